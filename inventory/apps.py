@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        import inventory.signals  # noqa: F401
+        import inventory.indexes  # noqa: F401
+        import inventory.columnar  # noqa: F401
@@ -0,0 +1,277 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from inventory.models import Item, Stock
+from inventory.signals import getGeneration
+from array import array
+import heapq
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# In-memory columnar catalogue
+#
+# The integer fields the range endpoints filter and sort on are kept in
+# columns, one array('q') per field, so a range filter, a sort or a top-N
+# query runs over a few contiguous arrays instead of the table. When NumPy
+# is installed the columns are read through zero-copy views and the queries
+# run as vectorized masks and argsorts, otherwise as plain python loops over
+# the same arrays. Only the pks of the selected page are handed back, the
+# rows themselves are then fetched from the ORM.
+#
+# Like the item indexes (inventory.indexes), every process keeps its own
+# copy, loaded on first use, updated in place by the model signals and
+# reloaded when the model generation moves under it or after
+# INVENTORY_INDEX_TTL seconds.
+
+class ColumnTable:
+    """
+    Columns of the integer fields of one model.
+
+    Rows are appended in load order and never move: a save overwrites the
+    row of its pk in place (or appends one for a new pk) and a delete
+    clears the live flag of the row. The dead rows are dropped on the next
+    reload.
+
+    Rows of equal sort keys are ordered on the tiebreak, the pk or a unique
+    field, in the direction of the sort, like compiled queries
+    (inventory.query.QUERY_TIEBREAKS).
+    """
+
+    def __init__(self, model, fields, tiebreak='pk'):
+        self.model = model
+        self.fields = fields
+        self.tiebreak = tiebreak
+        self.attnames = [model._meta.get_field(field).attname for field in fields]
+        self.lock = threading.RLock()
+        self.generation = None
+        self.loaded_at = None
+        self.clear()
+
+    def clear(self):
+        self.pks = array('q')
+        self.live = array('b')
+        self.columns = {field: array('q') for field in self.fields}
+        self.rows = {}
+
+    def isCurrent(self, generation):
+        """
+        Check whether the columns were loaded at a generation, less than INVENTORY_INDEX_TTL seconds ago.
+        """
+        return (
+            self.generation == generation
+            and time.monotonic() - self.loaded_at < settings.INVENTORY_INDEX_TTL
+        )
+
+    def ensureLoaded(self):
+        """
+        Load the columns if they are empty or out of date.
+        """
+        generation = getGeneration(self.model)
+        if self.isCurrent(generation):
+            return
+
+        with self.lock:
+            if self.isCurrent(generation):
+                return
+
+            self.clear()
+            for pk, *values in self.model.objects.order_by('pk').values_list(
+                'pk', *self.fields
+            ).iterator(chunk_size=2000):
+                self.put(pk, values)
+
+            self.generation = generation
+            self.loaded_at = time.monotonic()
+
+    def put(self, pk, values):
+        row = self.rows.get(pk)
+
+        if row is None:
+            self.rows[pk] = len(self.pks)
+            self.pks.append(pk)
+            self.live.append(1)
+            for field, value in zip(self.fields, values):
+                self.columns[field].append(value)
+        else:
+            self.live[row] = 1
+            for field, value in zip(self.fields, values):
+                self.columns[field][row] = value
+
+    def sync(self, instance, deleted=False):
+        """
+        Apply a saved or deleted instance to loaded columns.
+        """
+        with self.lock:
+            if self.generation is None:
+                return
+
+            if deleted:
+                row = self.rows.get(instance.pk)
+                if row is not None:
+                    self.live[row] = 0
+            else:
+                self.put(instance.pk, [getattr(instance, attname) for attname in self.attnames])
+
+            self.generation = getGeneration(self.model)
+
+    def select(self, ranges, sort=None, descending=False, offset=0, limit=None):
+        """
+        Select the rows whose fields fall within ranges, sorted.
+
+        Args:
+            ranges: field -> (minimum, maximum), inclusive, either bound None for unbounded
+            sort: The field to sort on, pk order if None. Ties are broken on the tiebreak
+            descending: Whether to sort in descending order
+            offset: The number of sorted rows to skip
+            limit: The number of rows to return, all of them if None
+
+        Returns:
+            tuple: (pks of the selected rows, number of matching rows)
+        """
+        self.ensureLoaded()
+
+        with self.lock:
+            if not self.pks:
+                return [], 0
+
+            if numpy is not None:
+                return self.selectVectorized(ranges, sort, descending, offset, limit)
+
+            return self.selectScalar(ranges, sort, descending, offset, limit)
+
+    def selectVectorized(self, ranges, sort, descending, offset, limit):
+        pks = numpy.frombuffer(self.pks, dtype=numpy.int64)
+
+        mask = numpy.frombuffer(self.live, dtype=numpy.int8) == 1
+        for field, (minimum, maximum) in ranges.items():
+            column = numpy.frombuffer(self.columns[field], dtype=numpy.int64)
+            if minimum is not None:
+                mask &= column >= minimum
+            if maximum is not None:
+                mask &= column <= maximum
+
+        selected = numpy.flatnonzero(mask)
+        total = len(selected)
+
+        if self.tiebreak == 'pk':
+            ties = pks[selected]
+        else:
+            ties = numpy.frombuffer(self.columns[self.tiebreak], dtype=numpy.int64)[selected]
+
+        if sort is None:
+            keys = pks[selected]
+        else:
+            keys = numpy.frombuffer(self.columns[sort], dtype=numpy.int64)[selected]
+            if descending:
+                keys, ties = -keys, -ties
+
+        end = total if limit is None else min(offset + limit, total)
+        if offset >= end:
+            return [], total
+
+        if end < total:
+            # Top-N: only the rows up to the end-th smallest key (ties
+            # included) need sorting
+            threshold = numpy.partition(keys, end - 1)[end - 1]
+            candidates = keys <= threshold
+            selected, keys, ties = selected[candidates], keys[candidates], ties[candidates]
+
+        order = numpy.lexsort((ties, keys))
+        return pks[selected[order[offset:end]]].tolist(), total
+
+    def selectScalar(self, ranges, sort, descending, offset, limit):
+        pks, live = self.pks, self.live
+        bounds = [
+            (self.columns[field], minimum, maximum)
+            for field, (minimum, maximum) in ranges.items()
+        ]
+
+        selected = [
+            row for row in range(len(pks))
+            if live[row] and all(
+                (minimum is None or column[row] >= minimum)
+                and (maximum is None or column[row] <= maximum)
+                for column, minimum, maximum in bounds
+            )
+        ]
+        total = len(selected)
+
+        if sort is None:
+            key = pks.__getitem__
+        else:
+            column = self.columns[sort]
+            ties = pks if self.tiebreak == 'pk' else self.columns[self.tiebreak]
+            sign = -1 if descending else 1
+            key = lambda row: (sign * column[row], sign * ties[row])
+
+        end = total if limit is None else min(offset + limit, total)
+        if offset >= end:
+            return [], total
+
+        if end < total:
+            rows = heapq.nsmallest(end, selected, key=key)
+        else:
+            rows = sorted(selected, key=key)
+
+        return [pks[row] for row in rows[offset:end]], total
+
+
+item_columns = ColumnTable(Item, ['price', 'category', 'sub_category'])
+stock_columns = ColumnTable(Stock, ['qty_in_stock', 'item'], tiebreak='item')
+
+COLUMN_TABLES = {Item: item_columns, Stock: stock_columns}
+
+
+def paginateColumns(model, ranges, sort, page, pagesize):
+    """
+    Cut a page out of the rows of a model selected from its columns.
+
+    Args:
+        model: Item or Stock
+        ranges: field -> (minimum, maximum), see ColumnTable.select
+        sort: The field to sort on, '-' prefixed for descending
+        page: The 1-based page number, clamped to the last page
+        pagesize: The number of rows per page
+
+    Returns:
+        tuple: (page_queryset, total_pages, total_results), like
+        inventory.myutils.paginateQueryset
+    """
+    table = COLUMN_TABLES[model]
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+
+    pks, total_results = table.select(
+        ranges, field, descending, (page - 1) * pagesize, pagesize
+    )
+    total_pages = max(1, -(-total_results // pagesize))
+
+    if page > total_pages:
+        # Past the end, like Paginator.get_page, send the last page
+        pks, total_results = table.select(
+            ranges, field, descending, (total_pages - 1) * pagesize, pagesize
+        )
+
+    page_queryset = model.objects.filter(pk__in=pks).order_by(
+        sort, ('-' if descending else '') + table.tiebreak
+    )
+
+    return page_queryset, total_pages, total_results
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Stock)
+def syncSavedColumns(sender, instance, **kwargs):
+    COLUMN_TABLES[sender].sync(instance)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Stock)
+def syncDeletedColumns(sender, instance, **kwargs):
+    COLUMN_TABLES[sender].sync(instance, deleted=True)
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Value, When
+
+
+# Faceted counts of a search result
+#
+# All the facets are counted with a single GROUP BY over the result set, on
+# the combination of the requested dimensions, and every facet is then
+# rolled up from those groups in python.
+
+FACETS = ['category', 'sub_category', 'price', 'stock']
+
+
+def parseFacets(request):
+    """
+    Read the facets asked for with ?facets=1 (all of them) or ?facets=category,price,...
+
+    Returns:
+        list: The requested facet names, empty when ?facets= is missing
+    """
+    facets = request.GET.get('facets', '')
+    if not facets:
+        return []
+
+    if facets in ['1', 'true']:
+        return list(FACETS)
+
+    requested = [name.strip() for name in facets.split(',')]
+    return [name for name in FACETS if name in requested]
+
+
+def bandCase(lookup, bands):
+    """
+    Build the CASE expression labelling a value with the (label, min, max)
+    band it falls in, max None meaning unbounded.
+    """
+    whens = []
+    for label, minimum, maximum in bands:
+        conditions = {f'{lookup}__gte': minimum}
+        if maximum is not None:
+            conditions[f'{lookup}__lte'] = maximum
+        whens.append(When(**conditions, then=Value(label)))
+
+    return Case(*whens, default=Value(None), output_field=CharField())
+
+
+def computeFacets(queryset, facets):
+    """
+    Count the items of a result set per category, sub-category, price bucket
+    and stock band.
+
+    Args:
+        queryset: A QuerySet of Item, the current result set
+        facets: The names of the facets to count, see FACETS
+
+    Returns:
+        dict: facet name -> list of {..., count}. Categories and sub-categories
+        are sorted by count, price buckets and stock bands keep the order of
+        INVENTORY_FACET_PRICE_BUCKETS and INVENTORY_FACET_STOCK_BANDS,
+        empty ones included
+    """
+    group_by = []
+    annotations = {}
+
+    if 'category' in facets:
+        group_by += ['category', 'category__name', 'category__slug']
+    if 'sub_category' in facets:
+        group_by += ['sub_category', 'sub_category__name', 'sub_category__slug']
+    if 'price' in facets:
+        annotations['price_bucket'] = bandCase(
+            'price', settings.INVENTORY_FACET_PRICE_BUCKETS
+        )
+    if 'stock' in facets:
+        annotations['stock_band'] = bandCase(
+            'stock__qty_in_stock', settings.INVENTORY_FACET_STOCK_BANDS
+        )
+
+    if not group_by and not annotations:
+        return {}
+
+    groups = queryset.order_by().annotate(**annotations).values(
+        *group_by, *annotations
+    ).annotate(count=Count('pk'))
+
+    counts = {facet: {} for facet in facets}
+    for group in groups:
+        for facet in ['category', 'sub_category']:
+            if facet in counts:
+                entry = counts[facet].setdefault(group[facet], {
+                    'id': group[facet],
+                    'name': group[f'{facet}__name'],
+                    'slug': group[f'{facet}__slug'],
+                    'count': 0
+                })
+                entry['count'] += group['count']
+
+        for facet, key in [('price', 'price_bucket'), ('stock', 'stock_band')]:
+            if facet in counts and group[key] is not None:
+                counts[facet][group[key]] = counts[facet].get(group[key], 0) + group['count']
+
+    result = {}
+    for facet in ['category', 'sub_category']:
+        if facet in counts:
+            result[facet] = sorted(
+                counts[facet].values(), key=lambda entry: (-entry['count'], entry['name'])
+            )
+
+    for facet, bands in [
+        ('price', settings.INVENTORY_FACET_PRICE_BUCKETS),
+        ('stock', settings.INVENTORY_FACET_STOCK_BANDS)
+    ]:
+        if facet in counts:
+            result[facet] = [
+                {
+                    'label': label,
+                    'min': minimum,
+                    'max': maximum,
+                    'count': counts[facet].get(label, 0)
+                }
+                for label, minimum, maximum in bands
+            ]
+
+    return result
@@ -0,0 +1,391 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from inventory.models import Item, Category, SubCategory
+from inventory.signals import getGeneration
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import NamedTuple
+import re
+import threading
+import time
+
+
+# In-memory item indexes
+#
+# Every process keeps its own copy, loaded from the database the first time
+# it is queried and then updated in place by the Item signals. Writes made by
+# other processes are caught through the Item generation counter: when it no
+# longer matches the one the index was last synced with, the index is
+# reloaded on its next query. The counters are only seen across processes
+# through a shared cache, so an index is also reloaded once it is older than
+# INVENTORY_INDEX_TTL seconds (inventory.signals).
+
+class ItemIndex(ABC):
+    """
+    Base class of the in-memory item indexes.
+
+    Subclasses implement clear(), add() and remove(), the loading, locking
+    and generation tracking are done here.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.generation = None
+        self.loaded_at = None
+
+    def isCurrent(self, generation):
+        """
+        Check whether the index was loaded at a generation, less than INVENTORY_INDEX_TTL seconds ago.
+        """
+        return (
+            self.generation == generation
+            and time.monotonic() - self.loaded_at < settings.INVENTORY_INDEX_TTL
+        )
+
+    def ensureLoaded(self):
+        """
+        Load the index if it is empty or out of date.
+        """
+        generation = getGeneration(Item)
+        if self.isCurrent(generation):
+            return
+
+        with self.lock:
+            if self.isCurrent(generation):
+                return
+
+            self.clear()
+            self.load(
+                Item.objects.values_list('pk', 'name', 'sku', 'slug').iterator(chunk_size=2000)
+            )
+
+            self.generation = generation
+            self.loaded_at = time.monotonic()
+
+    def load(self, rows):
+        """
+        Fill the cleared index with (pk, name, sku, slug) rows.
+        """
+        for pk, name, sku, slug in rows:
+            self.add(pk, name, sku, slug)
+
+    def sync(self, pk, name=None, sku=None, slug=None, deleted=False):
+        """
+        Apply a saved or deleted item to a loaded index.
+        """
+        with self.lock:
+            if self.generation is None:
+                return
+
+            self.remove(pk)
+            if not deleted:
+                self.add(pk, name, sku, slug)
+
+            self.generation = getGeneration(Item)
+
+    @abstractmethod
+    def clear(self):
+        """
+        Empty the index.
+        """
+
+    @abstractmethod
+    def add(self, pk, name, sku, slug):
+        """
+        Add an item to the index.
+        """
+
+    @abstractmethod
+    def remove(self, pk):
+        """
+        Remove an item from the index, if it is in it.
+        """
+
+
+# Trigram index
+
+def trigrams(text):
+    """
+    Return the set of trigrams of a text, the way pg_trgm builds them: the
+    text is casefolded, split into alphanumeric words and every word is
+    padded with two spaces in front and one behind.
+    """
+    grams = set()
+    for word in re.findall(r'[^\W_]+', text.casefold()):
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class TrigramIndex(ItemIndex):
+    """
+    Trigram index over the name and sku of the items, for typo-tolerant search.
+
+    Every field keeps posting lists (trigram -> item pks), so a query only
+    visits the items sharing at least one trigram with it instead of the
+    whole catalogue. The similarity of a field is the pg_trgm one:
+    shared trigrams / (query trigrams + field trigrams - shared trigrams),
+    and an item scores the best similarity of its name and sku.
+    """
+
+    fields = ('name', 'sku')
+
+    def clear(self):
+        self.postings = {field: defaultdict(set) for field in self.fields}
+        self.grams = {field: {} for field in self.fields}
+
+    def add(self, pk, name, sku, slug):
+        for field, value in zip(self.fields, (name, sku)):
+            grams = trigrams(value or '')
+            self.grams[field][pk] = grams
+            for gram in grams:
+                self.postings[field][gram].add(pk)
+
+    def remove(self, pk):
+        for field in self.fields:
+            for gram in self.grams[field].pop(pk, ()):
+                self.postings[field][gram].discard(pk)
+                if not self.postings[field][gram]:
+                    del self.postings[field][gram]
+
+    def search(self, text, threshold=0.3):
+        """
+        Return the items similar to a text.
+
+        Args:
+            text: The text to look for
+            threshold: The minimum similarity, between 0 and 1
+
+        Returns:
+            list: (pk, similarity) pairs, the most similar first
+        """
+        query_grams = trigrams(text)
+        if not query_grams:
+            return []
+
+        self.ensureLoaded()
+
+        scores = {}
+        with self.lock:
+            for field in self.fields:
+                shared = defaultdict(int)
+                for gram in query_grams:
+                    for pk in self.postings[field].get(gram, ()):
+                        shared[pk] += 1
+
+                for pk, count in shared.items():
+                    similarity = count / (len(query_grams) + len(self.grams[field][pk]) - count)
+                    if similarity >= threshold and similarity > scores.get(pk, 0):
+                        scores[pk] = similarity
+
+        return sorted(scores.items(), key=lambda score: (-score[1], score[0]))
+
+
+# Autocomplete index
+
+class AutocompleteIndex(ItemIndex):
+    """
+    Sorted array of the casefolded names and skus of the items, for prefix
+    lookups.
+
+    Every word of a name starts a key of its own, so "pro" completes
+    "iPhone 14 Pro". A lookup is a binary search to the first key at or
+    after the prefix, followed by a walk over the next keys while they
+    still start with it. A load sorts the keys once, saves and deletes
+    insert and remove keys in place.
+    """
+
+    def clear(self):
+        self.keys = []
+        self.entries = {}
+        self.entry_keys = {}
+
+    def record(self, pk, name, sku, slug):
+        """
+        Record the entry of an item and return its keys.
+        """
+        keys = set()
+        folded_name = (name or '').casefold()
+        for match in re.finditer(r'[^\W_]+', folded_name):
+            keys.add(folded_name[match.start():])
+        if sku:
+            keys.add(sku.casefold())
+
+        self.entries[pk] = {'id': pk, 'name': name, 'sku': sku, 'slug': slug}
+        self.entry_keys[pk] = keys
+        return keys
+
+    def load(self, rows):
+        # Appended then sorted once, an insort per key would make the load
+        # quadratic in the number of items
+        for pk, name, sku, slug in rows:
+            self.keys.extend((key, pk) for key in self.record(pk, name, sku, slug))
+        self.keys.sort()
+
+    def add(self, pk, name, sku, slug):
+        for key in self.record(pk, name, sku, slug):
+            insort(self.keys, (key, pk))
+
+    def remove(self, pk):
+        self.entries.pop(pk, None)
+
+        for key in self.entry_keys.pop(pk, ()):
+            position = bisect_left(self.keys, (key, pk))
+            if position < len(self.keys) and self.keys[position] == (key, pk):
+                del self.keys[position]
+
+    def complete(self, prefix, limit):
+        """
+        Return the items whose name, a word of their name, or sku start with a prefix.
+
+        Args:
+            prefix: The text typed so far
+            limit: The number of items to return
+
+        Returns:
+            list: {id, name, sku, slug} of the matching items, in key order
+        """
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+
+        self.ensureLoaded()
+
+        pks = []
+        with self.lock:
+            position = bisect_left(self.keys, (prefix,))
+            while position < len(self.keys) and len(pks) < limit:
+                key, pk = self.keys[position]
+                if not key.startswith(prefix):
+                    break
+                if pk not in pks:
+                    pks.append(pk)
+                position += 1
+
+            return [self.entries[pk] for pk in pks]
+
+
+# Category and sub-category registries
+
+class CategoryEntry(NamedTuple):
+    id: int
+    name: str
+    slug: str
+
+    def __str__(self):
+        return self.name
+
+
+class CategoryRegistry:
+    """
+    Process-local map of the categories (or sub-categories) by casefolded
+    name and by slug, to resolve the category filters without a query.
+
+    The whole table is loaded on first use, dropped when a row is saved or
+    deleted, and reloaded when the model generation moves or the registry
+    is older than INVENTORY_INDEX_TTL seconds. A name or slug
+    that isn't found is still looked up in the database before giving up.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.RLock()
+        self.generation = None
+        self.loaded_at = None
+        self.by_name = {}
+        self.by_slug = {}
+
+    def isCurrent(self, generation):
+        return (
+            self.generation == generation
+            and time.monotonic() - self.loaded_at < settings.INVENTORY_INDEX_TTL
+        )
+
+    def ensureLoaded(self):
+        generation = getGeneration(self.model)
+        if self.isCurrent(generation):
+            return
+
+        with self.lock:
+            if self.isCurrent(generation):
+                return
+
+            self.by_name = {}
+            self.by_slug = {}
+            for row in self.model.objects.values_list('id', 'name', 'slug'):
+                self.add(CategoryEntry(*row))
+
+            self.generation = generation
+            self.loaded_at = time.monotonic()
+
+    def add(self, entry):
+        self.by_name[entry.name.casefold()] = entry
+        self.by_slug[entry.slug] = entry
+
+    def invalidate(self):
+        with self.lock:
+            self.generation = None
+
+    def get(self, name=None, slug=None):
+        """
+        Resolve a category by case-insensitive name or by slug.
+
+        Returns:
+            CategoryEntry: (id, name, slug) of the category
+
+        Raises:
+            DoesNotExist: If no category has that name or slug
+        """
+        self.ensureLoaded()
+
+        if name is not None:
+            entry = self.by_name.get(name.casefold())
+            lookup = {'name__iexact': name}
+        else:
+            entry = self.by_slug.get(slug)
+            lookup = {'slug': slug}
+
+        if entry is not None:
+            return entry
+
+        row = self.model.objects.filter(**lookup).values_list('id', 'name', 'slug').first()
+        if row is None:
+            raise self.model.DoesNotExist
+
+        entry = CategoryEntry(*row)
+        with self.lock:
+            self.add(entry)
+
+        return entry
+
+
+trigram_index = TrigramIndex()
+autocomplete_index = AutocompleteIndex()
+category_registry = CategoryRegistry(Category)
+sub_category_registry = CategoryRegistry(SubCategory)
+
+
+@receiver(post_save, sender=Item)
+def syncSavedItem(sender, instance, **kwargs):
+    for index in (trigram_index, autocomplete_index):
+        index.sync(instance.pk, instance.name, instance.sku, instance.slug)
+
+
+@receiver(post_delete, sender=Item)
+def syncDeletedItem(sender, instance, **kwargs):
+    for index in (trigram_index, autocomplete_index):
+        index.sync(instance.pk, deleted=True)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidateCategoryRegistry(sender, **kwargs):
+    category_registry.invalidate()
+
+
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidateSubCategoryRegistry(sender, **kwargs):
+    sub_category_registry.invalidate()
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from inventory.stocks import takeCheckpoint
+import datetime
+
+
+class Command(BaseCommand):
+    help = "Checkpoint the quantities on hand of every item, for the point-in-time queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="The database to checkpoint the stocks of"
+        )
+        parser.add_argument(
+            '--at', default=None,
+            help="The ISO 8601 time of the checkpoint, now minus --lag by default"
+        )
+        parser.add_argument(
+            '--lag', type=int, default=60,
+            help="Seconds to stay behind now, so movements still being committed are counted"
+        )
+
+    def handle(self, *args, **options):
+        if options['at']:
+            moment = parse_datetime(options['at'])
+            if moment is None:
+                raise CommandError(f"Invalid time {options['at']}.")
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+        else:
+            moment = timezone.now() - datetime.timedelta(seconds=options['lag'])
+
+        try:
+            count = takeCheckpoint(moment, using=options['database'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully checkpointed {count} items at {moment.isoformat()}"
+        ))
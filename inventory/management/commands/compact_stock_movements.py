@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Sum
+from inventory.models import Stock, StockMovement
+from inventory.stocks import compactPending
+import time
+
+
+class Command(BaseCommand):
+    help = "Fold the pending stock movements into the stock snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="The database to compact the movements of"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="The number of items compacted per transaction"
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, compacting every --interval seconds"
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.INVENTORY_COMPACTION_INTERVAL,
+            help="Seconds between two runs of --loop"
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Then report the stocks whose snapshot differs from their compacted ledger"
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Then reset the snapshots that differ to the sum of their compacted ledger"
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+
+        total = compactPending(batch_size=options['batch_size'], using=database)
+        self.stdout.write(self.style.SUCCESS(f"Successfully compacted {total} movements"))
+
+        while options['loop']:
+            # The quantity filters lag the ledger by at most the interval
+            time.sleep(options['interval'])
+            total = compactPending(batch_size=options['batch_size'], using=database)
+            if total:
+                self.stdout.write(f"Compacted {total} movements")
+
+        if not (options['verify'] or options['rebuild']):
+            return
+
+        ledger = dict(
+            StockMovement.objects.using(database).filter(compacted=True).order_by().values(
+                'item'
+            ).annotate(total=Sum('delta')).values_list('item', 'total')
+        )
+
+        mismatches = []
+        for stock in Stock.objects.using(database).order_by('pk').iterator(chunk_size=2000):
+            expected = ledger.get(stock.item_id, 0)
+            if stock.qty_in_stock != expected:
+                mismatches.append(stock)
+                self.stdout.write(
+                    f"Stock {stock.pk} (item {stock.item_id}): snapshot {stock.qty_in_stock}, ledger {expected}"
+                )
+
+        if options['rebuild']:
+            rebuilt = 0
+            for stock in mismatches:
+                if ledger.get(stock.item_id, 0) < 0:
+                    self.stderr.write(f"Stock {stock.pk} has a negative ledger, not rebuilt")
+                    continue
+
+                stock.qty_in_stock = ledger.get(stock.item_id, 0)
+                stock.save(update_fields=['qty_in_stock', 'last_updated'])
+                rebuilt += 1
+
+            self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt {rebuilt} stocks"))
+        else:
+            self.stdout.write(f"{len(mismatches)} stocks differ from their ledger")
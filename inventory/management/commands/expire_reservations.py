@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from inventory.reservations import expireReservations
+
+
+class Command(BaseCommand):
+    help = "Expire the stock reservations past their expiry and give their quantities back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="The database to expire the reservations of"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.INVENTORY_RESERVATION_SWEEP_BATCH,
+            help="The number of reservations expired per transaction"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expired = expireReservations(batch_size=options['batch_size'], using=options['database'])
+            if not expired:
+                break
+            total += expired
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully expired {total} reservations"))
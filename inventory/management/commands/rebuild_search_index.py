@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from inventory.search import createIndex, dropIndex, rebuildIndex
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of the items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="The database to rebuild the index on"
+        )
+        parser.add_argument(
+            '--recreate', action='store_true',
+            help="Drop and recreate the index table and its triggers first"
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+
+        if connections[database].vendor != 'sqlite':
+            raise CommandError("The full-text index is only available on SQLite.")
+
+        if options['recreate']:
+            dropIndex(database)
+
+        createIndex(database)
+        rebuildIndex(database)
+
+        self.stdout.write(self.style.SUCCESS("Successfully rebuilt the search index"))
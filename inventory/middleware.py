@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Response compression
+
+def gzipCompressor(level):
+    compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED, 31)
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush
+    )
+
+
+def zstdCompressor(level):
+    compressor = zstandard.ZstdCompressor(level=min(level, 19)).compressobj()
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        compressor.flush
+    )
+
+
+def brotliCompressor(level):
+    compressor = brotli.Compressor(quality=min(level, 11))
+    return (
+        compressor.process,
+        compressor.flush,
+        compressor.finish
+    )
+
+
+# Codecs in order of preference, the optional ones only when installed.
+CODECS = [
+    (coding, factory) for coding, factory, available in [
+        ('zstd', zstdCompressor, zstandard is not None),
+        ('br', brotliCompressor, brotli is not None),
+        ('gzip', gzipCompressor, True),
+    ]
+    if available
+]
+
+
+def negotiateEncoding(accept_encoding):
+    """
+    Pick the preferred codec the client accepts, honoring q-values.
+
+    Returns:
+        tuple: (coding, compressor factory), or None if no codec is acceptable
+    """
+    accepted = {}
+    for token in accept_encoding.split(','):
+        coding, _, params = token.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    candidates = [
+        (accepted.get(coding, accepted.get('*', 0.0)), -position, coding, factory)
+        for position, (coding, factory) in enumerate(CODECS)
+    ]
+    quality, _, coding, factory = max(candidates)
+
+    if quality <= 0:
+        return None
+
+    return coding, factory
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best codec the client accepts.
+
+    gzip is always available, zstd and br are used when the zstandard or
+    brotli packages are installed. Settings:
+
+        INVENTORY_COMPRESSION_MIN_SIZE: Smaller responses are sent as is
+        INVENTORY_COMPRESSION_LEVEL: Compression level, capped to each codec's maximum
+        INVENTORY_COMPRESSION_EXCLUDE_PATHS: Path prefixes that are never compressed
+
+    Streaming responses are compressed chunk by chunk, flushing after every
+    chunk so the client still receives rows as they are produced.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'INVENTORY_COMPRESSION_MIN_SIZE', 1024)
+        self.level = getattr(settings, 'INVENTORY_COMPRESSION_LEVEL', 6)
+        self.exclude_paths = tuple(
+            getattr(settings, 'INVENTORY_COMPRESSION_EXCLUDE_PATHS', [])
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if self.exclude_paths and request.path.startswith(self.exclude_paths):
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        negotiated = negotiateEncoding(request.headers.get('Accept-Encoding', ''))
+        if negotiated is None:
+            return response
+
+        coding, factory = negotiated
+        compress, flush, finish = factory(self.level)
+
+        if response.streaming:
+            def compressStream(streaming_content):
+                for chunk in streaming_content:
+                    data = compress(chunk) + flush()
+                    if data:
+                        yield data
+                yield finish()
+
+            response.streaming_content = compressStream(response.streaming_content)
+            del response.headers['Content-Length']
+
+        else:
+            compressed_content = compress(response.content) + finish()
+            if len(compressed_content) >= len(response.content):
+                return response
+
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(compressed_content))
+
+        # The representation changed, so a strong ETag can only be kept as a
+        # weak one, which If-None-Match still matches.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        response.headers['Content-Encoding'] = coding
+
+        return response
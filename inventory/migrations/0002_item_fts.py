@@ -0,0 +1,69 @@
+from django.db import migrations
+
+
+# The full-text table and triggers as of this migration, inlined so the
+# migration doesn't depend on inventory.search.
+CREATE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_item_fts USING fts5(
+        name, sku, description,
+        content='inventory_item', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ai AFTER INSERT ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ad AFTER DELETE ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_au AFTER UPDATE OF name, sku, description ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO inventory_item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    "INSERT INTO inventory_item_fts(inventory_item_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX_SQL = [
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ai",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ad",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_au",
+    "DROP TABLE IF EXISTS inventory_item_fts",
+]
+
+
+def createItemIndex(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for sql in CREATE_INDEX_SQL:
+        schema_editor.execute(sql)
+
+
+def dropItemIndex(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for sql in DROP_INDEX_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(createItemIndex, dropItemIndex),
+    ]
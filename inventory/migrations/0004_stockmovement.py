@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def recordOpeningBalances(apps, schema_editor):
+    """
+    Open the ledger of every stock with a movement of its current quantity,
+    already compacted into the snapshot.
+    """
+    Stock = apps.get_model('inventory', 'Stock')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    using = schema_editor.connection.alias
+
+    movements = [
+        StockMovement(
+            item_id=item_id, delta=qty_in_stock, reason='opening',
+            source='migration', created_at=last_updated, compacted=True
+        )
+        for item_id, qty_in_stock, last_updated in Stock.objects.using(using).values_list(
+            'item_id', 'qty_in_stock', 'last_updated'
+        ).iterator(chunk_size=2000)
+    ]
+    StockMovement.objects.using(using).bulk_create(movements, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_item_stock_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(verbose_name='Delta')),
+                ('reason', models.CharField(default='adjustment', max_length=50, verbose_name='Reason')),
+                ('source', models.CharField(blank=True, default='', max_length=100, verbose_name='Source')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created_at')),
+                ('compacted', models.BooleanField(default=False, verbose_name='Compacted')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.item', verbose_name='Item')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(condition=models.Q(('compacted', False)), fields=['item', 'id'], name='movement_pending_idx'),
+        ),
+        migrations.RunPython(recordOpeningBalances, migrations.RunPython.noop),
+    ]
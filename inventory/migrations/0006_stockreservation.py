@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='qty_reserved',
+            field=models.PositiveIntegerField(default=0, verbose_name='Reserved quantity'),
+        ),
+        migrations.RemoveIndex(
+            model_name='stock',
+            name='stock_qty_covering_idx',
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['qty_in_stock', 'item', 'last_updated', 'qty_reserved'], name='stock_qty_covering_idx'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('confirmed', 'Confirmed'), ('released', 'Released'), ('expired', 'Expired')], default='active', max_length=10, verbose_name='Status')),
+                ('reference', models.CharField(blank=True, default='', max_length=100, verbose_name='Reference')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created_at')),
+                ('expires_at', models.DateTimeField(verbose_name='expires_at')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.item', verbose_name='Item')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['item', 'expires_at'], name='reservation_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expires_at'], name='reservation_sweep_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+# The full-text table rebuilt with the trigram tokenizer, so a word matches
+# anywhere in a column, as name__icontains did. Inlined so the migration
+# doesn't depend on inventory.search.
+DROP_INDEX_SQL = [
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ai",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ad",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_au",
+    "DROP TABLE IF EXISTS inventory_item_fts",
+]
+
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ai AFTER INSERT ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ad AFTER DELETE ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_au AFTER UPDATE OF name, sku, description ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO inventory_item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    "INSERT INTO inventory_item_fts(inventory_item_fts) VALUES ('rebuild')",
+]
+
+TRIGRAM_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_item_fts USING fts5(
+        name, sku, description,
+        content='inventory_item', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+] + TRIGGERS_SQL
+
+WORD_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_item_fts USING fts5(
+        name, sku, description,
+        content='inventory_item', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+] + TRIGGERS_SQL
+
+
+def recreateItemIndex(create_sql):
+    def recreate(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+
+        for sql in DROP_INDEX_SQL + create_sql:
+            schema_editor.execute(sql)
+
+    return recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stockreservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            recreateItemIndex(TRIGRAM_INDEX_SQL), recreateItemIndex(WORD_INDEX_SQL)
+        ),
+    ]
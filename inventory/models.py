@@ -102,6 +102,7 @@
 #         category.delete()
 
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
@@ -202,6 +203,20 @@ class Item(models.Model):
         auto_now=True
     )
 
+    class Meta:
+        # The filter and sort paths of the item lists: price ranges (alone
+        # or within a category / sub-category), the name, price and updatedAt
+        # keyset sorts, and the MAX(updatedAt) probe of the conditional GETs.
+        # SQLite appends the rowid (the pk) to every index, which is the
+        # tie-breaker of the keyset sorts.
+        indexes = [
+            models.Index(fields=['price'], name='item_price_idx'),
+            models.Index(fields=['category', 'price'], name='item_category_price_idx'),
+            models.Index(fields=['sub_category', 'price'], name='item_subcategory_price_idx'),
+            models.Index(fields=['name'], name='item_name_idx'),
+            models.Index(fields=['updatedAt'], name='item_updatedat_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.sku)
         return super().save(*args, **kwargs)
@@ -219,11 +234,172 @@ class Stock(models.Model):
     )
     qty_in_stock = models.PositiveIntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
+    qty_reserved = models.PositiveIntegerField(
+        verbose_name="Reserved quantity",
+        default=0
+    )
+
+    class Meta:
+        # Covers the quantity range lists: the rows they serialize (id,
+        # item_id, qty_in_stock, last_updated, qty_reserved) are read from
+        # the index alone.
+        indexes = [
+            models.Index(
+                fields=['qty_in_stock', 'item', 'last_updated', 'qty_reserved'],
+                name='stock_qty_covering_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.item.name} - {self.qty_in_stock} in stock"
 
 
+class StockMovement(models.Model):
+    """
+    A signed change of the quantity of an item, in an append-only ledger.
+
+    Stock.qty_in_stock is a snapshot of the compacted movements, the
+    quantity on hand is that snapshot plus the movements not compacted yet
+    (see inventory.stocks).
+    """
+    id = models.BigAutoField(verbose_name="ID", primary_key=True)
+    item = models.ForeignKey(
+        to='Item',
+        on_delete=models.CASCADE,
+        verbose_name='Item'
+    )
+    delta = models.IntegerField(verbose_name="Delta")
+    reason = models.CharField(
+        verbose_name="Reason",
+        max_length=50,
+        default='adjustment'
+    )
+    source = models.CharField(
+        verbose_name="Source",
+        max_length=100,
+        blank=True,
+        default=''
+    )
+    created_at = models.DateTimeField(
+        verbose_name="created_at",
+        default=timezone.now
+    )
+    compacted = models.BooleanField(
+        verbose_name="Compacted",
+        default=False
+    )
+
+    class Meta:
+        # The pending movements of an item, summed on top of its snapshot,
+        # are read from a partial index holding only the uncompacted rows.
+        # The point-in-time quantities read the movements between the last
+        # checkpoint and a time, of one item or of all of them.
+        indexes = [
+            models.Index(
+                fields=['item', 'id'],
+                condition=models.Q(compacted=False),
+                name='movement_pending_idx'
+            ),
+            models.Index(fields=['item', 'created_at'], name='movement_item_created_idx'),
+            models.Index(fields=['created_at'], name='movement_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name} {self.delta:+d} ({self.reason})"
+
+
+class StockCheckpoint(models.Model):
+    """
+    The quantity on hand of an item at a point in time, the sum of its
+    movements up to then.
+
+    Checkpoints are taken for all the items at once, by the
+    checkpoint_stocks command, so a past quantity is the one of the last
+    checkpoint before it plus the movements since.
+    """
+    id = models.BigAutoField(verbose_name="ID", primary_key=True)
+    item = models.ForeignKey(
+        to='Item',
+        on_delete=models.CASCADE,
+        verbose_name='Item'
+    )
+    qty = models.IntegerField(verbose_name="Quantity")
+    taken_at = models.DateTimeField(verbose_name="taken_at")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taken_at', 'item'], name='checkpoint_taken_item_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name}: {self.qty} at {self.taken_at}"
+
+
+class StockReservation(models.Model):
+    """
+    A hold on a quantity of an item until it expires, is confirmed (the
+    quantity leaves the stock) or is released.
+
+    The quantities of the active reservations of an item are counted in
+    Stock.qty_reserved (see inventory.reservations).
+    """
+    ACTIVE = 'active'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+
+    STATUSES = [
+        (ACTIVE, 'Active'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    id = models.BigAutoField(verbose_name="ID", primary_key=True)
+    item = models.ForeignKey(
+        to='Item',
+        on_delete=models.CASCADE,
+        verbose_name='Item'
+    )
+    qty = models.PositiveIntegerField(verbose_name="Quantity")
+    status = models.CharField(
+        verbose_name="Status",
+        max_length=10,
+        choices=STATUSES,
+        default=ACTIVE
+    )
+    reference = models.CharField(
+        verbose_name="Reference",
+        max_length=100,
+        blank=True,
+        default=''
+    )
+    created_at = models.DateTimeField(
+        verbose_name="created_at",
+        default=timezone.now
+    )
+    expires_at = models.DateTimeField(verbose_name="expires_at")
+
+    class Meta:
+        # The expiry sweeps read the active reservations past their
+        # expiry from a partial index holding only the active ones.
+        indexes = [
+            models.Index(
+                fields=['item', 'expires_at'],
+                condition=models.Q(status='active'),
+                name='reservation_expiry_idx'
+            ),
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='active'),
+                name='reservation_sweep_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name}: {self.qty} {self.status} until {self.expires_at}"
+
+
 # class Supplier(models.Model):
 #     id = models.AutoField(verbose_name="ID", primary_key=True)
 #     name_of_person = models.CharField(
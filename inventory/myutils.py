@@ -0,0 +1,656 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import EmptyResultSet, ObjectDoesNotExist
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from inventory.models import Item, Stock, StockMovement, Category, SubCategory
+from inventory.reservations import lapsedHolds
+from inventory.signals import getGeneration
+from inventory.stocks import pendingDelta
+from functools import wraps
+from itertools import islice
+import base64
+import datetime
+import hashlib
+import json
+
+
+def serializeQueryset(queryset, fields=None, envelope=True, expand=None):
+    """
+    Serialize a queryset (or a list of instances) straight into python rows.
+
+    Args:
+        queryset: A QuerySet of Item, Stock, Category or SubCategory, or a list of instances
+        fields: The names of the fields to keep, all of them by default
+        envelope: Keep the {model, pk, fields} shape of django's serializers
+        expand: The names of the relations to embed, see EXPANSIONS
+
+    Returns:
+        list: The serialized rows, ready to be handed to JsonResponse
+
+    The rows are read with a single values_list() projection instead of
+    serialize('json') followed by json.loads, so no model instances are built
+    and the payload is only encoded once, by the response itself.
+    """
+    return list(iterSerializedRows(queryset, fields, envelope, expand=expand))
+
+
+def iterSerializedRows(queryset, fields=None, envelope=True, chunk_size=None, expand=None):
+    """
+    Lazily serialize a queryset (or a list of instances), one row at a time.
+
+    Args:
+        queryset: A QuerySet of Item, Stock, Category or SubCategory, or a list of instances
+        fields: The names of the fields to keep, all of them by default
+        envelope: Keep the {model, pk, fields} shape of django's serializers
+        chunk_size: Read the queryset with .iterator(chunk_size) instead of caching it
+        expand: The names of the relations to embed, see EXPANSIONS
+
+    Yields:
+        dict: The serialized rows
+
+    The expanded relations are read as joined columns of the same query, so
+    embedding them doesn't cost any extra query. The columns listed in
+    LIVE_VALUES are read as their annotation instead, e.g. the quantity on
+    hand in place of the stock snapshot.
+    """
+    if isinstance(queryset, QuerySet):
+        model = queryset.model
+    elif queryset:
+        model = type(queryset[0])
+    else:
+        return
+
+    opts = model._meta
+    model_label = str(opts)
+    pk_name = opts.pk.attname
+
+    serialized_fields = [
+        field for field in opts.local_fields
+        if field.serialize and (fields is None or field.name in fields)
+    ]
+    names = [field.name for field in serialized_fields]
+    attnames = [field.attname for field in serialized_fields]
+
+    expansions = [
+        (name, *EXPANSIONS[model_label][name])
+        for name in (expand or []) if name in EXPANSIONS.get(model_label, {})
+    ]
+    expanded_attnames = [
+        f'{lookup}__{sub_field}'
+        for _, lookup, sub_fields in expansions for sub_field in sub_fields
+    ]
+
+    live_values = {
+        path: live_value for path, live_value in LIVE_VALUES.get(model_label, {}).items()
+        if path in attnames or path in expanded_attnames
+    }
+
+    if isinstance(queryset, QuerySet):
+        columns = [
+            live_values[path][0] if path in live_values else path
+            for path in [*attnames, *expanded_attnames]
+        ]
+        values = queryset.annotate(
+            **{annotation: expression() for annotation, expression in live_values.values()}
+        ).values_list(pk_name, *columns)
+        if chunk_size:
+            values = values.iterator(chunk_size=chunk_size)
+    else:
+        # Instances read with the annotation (see inventory.stocks.withQtyOnHand)
+        # carry it, the others serve the stored value
+        values = (
+            [getattr(obj, pk_name)]
+            + [
+                getattr(obj, live_values[attname][0], getattr(obj, attname))
+                if attname in live_values else getattr(obj, attname)
+                for attname in attnames
+            ]
+            + [getRelatedValue(obj, attname) for attname in expanded_attnames]
+            for obj in queryset
+        )
+
+    for row in values:
+        row_fields = dict(zip(names, row[1:len(names) + 1]))
+
+        offset = len(names) + 1
+        for name, _, sub_fields in expansions:
+            related_values = row[offset:offset + len(sub_fields)]
+            offset += len(sub_fields)
+
+            # A missing reverse relation (an item without stock) joins as NULLs.
+            row_fields[name] = (
+                dict(zip(sub_fields, related_values))
+                if related_values[0] is not None else None
+            )
+
+        if envelope:
+            yield {
+                "model": model_label,
+                "pk": row[0],
+                "fields": row_fields
+            }
+        else:
+            yield {opts.pk.name: row[0], **row_fields}
+
+
+def getRelatedValue(obj, lookup):
+    """
+    Follow a double-underscore lookup on an instance, None when a relation is missing.
+    """
+    for attname in lookup.split('__'):
+        try:
+            obj = getattr(obj, attname)
+        except ObjectDoesNotExist:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def parseFieldset(request, model):
+    """
+    Read the sparse fieldset asked for with ?fields=name,sku,...
+
+    Args:
+        request: The request object
+        model: The model being listed
+
+    Returns:
+        list: The requested field names that exist on the model, None when
+        ?fields= is missing so that every field is sent
+
+    The fieldset is handed to serializeQueryset, which narrows both the SQL
+    column list and the JSON payload to it.
+    """
+    fields = request.GET.get('fields', '')
+    if not fields:
+        return None
+
+    field_names = [
+        field.name for field in model._meta.local_fields if field.serialize
+    ]
+    return [
+        field_name for field_name in field_names
+        if field_name in [name.strip() for name in fields.split(',')]
+    ]
+
+
+# The relations that can be embedded with ?expand=, per model label:
+# name -> (lookup followed from the listed model, columns of the embedded object)
+EXPANSIONS = {
+    'inventory.item': {
+        'stock': ('stock', ['id', 'qty_in_stock', 'last_updated']),
+        'category': ('category', ['id', 'name', 'slug']),
+        'sub_category': ('sub_category', ['id', 'name', 'slug']),
+    },
+    'inventory.stock': {
+        'item': ('item', ['id', 'name', 'slug', 'sku', 'price']),
+    },
+}
+
+
+# The columns served with their live value instead of the stored one, per
+# model label: path -> (annotation, expression). Stock.qty_in_stock is a
+# snapshot of the compacted movements, the quantity on hand adds the
+# pending ones (see inventory.stocks). Stock.qty_reserved still counts the
+# reservations past their expiry until they are swept, they are taken out
+# (see inventory.reservations)
+LIVE_VALUES = {
+    'inventory.item': {
+        'stock__qty_in_stock': (
+            'stock_qty_on_hand', lambda: F('stock__qty_in_stock') + pendingDelta('pk')
+        ),
+    },
+    'inventory.stock': {
+        'qty_in_stock': ('qty_on_hand', lambda: F('qty_in_stock') + pendingDelta()),
+        'qty_reserved': ('qty_held', lambda: F('qty_reserved') - lapsedHolds()),
+    },
+}
+
+
+def parseExpand(request, model):
+    """
+    Read the relations asked for with ?expand=stock,category,...
+
+    Args:
+        request: The request object
+        model: The model being listed
+
+    Returns:
+        list: The requested relation names that can be expanded on the model
+    """
+    expand = request.GET.get('expand', '')
+    if not expand:
+        return []
+
+    requested = [name.strip() for name in expand.split(',')]
+    return [
+        name for name in EXPANSIONS.get(str(model._meta), {})
+        if name in requested
+    ]
+
+
+def wantsStream(request):
+    """
+    Check whether the client asked for a streamed list, with ?stream=1 or an
+    application/x-ndjson Accept header.
+    """
+    return (
+        request.GET.get('stream', '') in ['1', 'true', 'ndjson']
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+
+def streamQueryset(request, queryset, message, list_key, related_fields=(), related_models=(), count_key=None):
+    """
+    Stream a queryset to the client without loading it into memory.
+
+    Args:
+        request: The request object
+        queryset: The QuerySet to stream
+        message: The message of the JSON document, left out when None
+        list_key: The key holding the rows in the JSON document
+        related_fields: The relational fields to populate, see populateRelationalFields
+        related_models: The models the related_fields point to
+        count_key: When given, the number of streamed rows is appended under this key
+
+    Returns:
+        StreamingHttpResponse: NDJSON (one row per line) when the client accepts
+        application/x-ndjson or passes ?stream=ndjson, a JSON document otherwise
+
+    The queryset is read with .iterator(chunk_size=INVENTORY_STREAM_CHUNK_SIZE)
+    and the relations are populated one chunk at a time, so memory stays flat
+    whatever the size of the result set.
+    """
+    chunk_size = getattr(settings, 'INVENTORY_STREAM_CHUNK_SIZE', 500)
+    ndjson = (
+        request.GET.get('stream', '') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+    def iterChunks():
+        rows = iterSerializedRows(queryset, chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            populateRelationalFields(chunk, related_fields, related_models)
+            yield chunk
+
+    def iterNdjson():
+        for chunk in iterChunks():
+            yield ''.join(
+                json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in chunk
+            )
+
+    def iterJson():
+        if message is not None:
+            yield json.dumps({"message": message})[:-1] + f', {json.dumps(list_key)}: ['
+        else:
+            yield f'{{{json.dumps(list_key)}: ['
+
+        rows_count = 0
+        for chunk in iterChunks():
+            yield ('' if rows_count == 0 else ', ') + ', '.join(
+                json.dumps(row, cls=DjangoJSONEncoder) for row in chunk
+            )
+            rows_count += len(chunk)
+
+        if count_key is not None:
+            yield f'], {json.dumps(count_key)}: {rows_count}}}'
+        else:
+            yield ']}'
+
+    if ndjson:
+        return StreamingHttpResponse(iterNdjson(), content_type='application/x-ndjson')
+
+    return StreamingHttpResponse(iterJson(), content_type='application/json')
+
+
+def populateRelationalFields(querylist=None, related_fields=None, related_models=None):
+    """
+    Replace the foreign-key ids of serialized rows with {id, name, slug} dicts.
+
+    Args:
+        querylist: A serialized row (dict) or a list of serialized rows
+        related_fields: The names of the relational fields to populate
+        related_models: The models the related_fields point to, in the same order
+
+    Returns:
+        The populated querylist
+
+    Every related model is resolved with a single pk__in query, so a page of
+    any size costs one query per related model.
+    """
+    if not querylist:
+        return querylist
+
+    rows = [querylist] if isinstance(querylist, dict) else querylist
+
+    for related_field, related_model in zip(related_fields, related_models):
+        related_field_ids = {
+            row['fields'].get(related_field) for row in rows
+            if not isinstance(row['fields'].get(related_field), dict)
+        }
+        related_field_ids.discard(None)
+
+        if not related_field_ids:
+            continue
+
+        related_field_objs = {
+            related_field_obj['id']: related_field_obj
+            for related_field_obj in related_model.objects.filter(
+                pk__in=related_field_ids
+            ).values('id', 'name', 'slug')
+        }
+
+        for row in rows:
+            related_field_id = row['fields'].get(related_field)
+            if not isinstance(related_field_id, dict) and related_field_id in related_field_objs:
+                row['fields'][related_field] = dict(
+                    related_field_objs[related_field_id]
+                )
+
+    return querylist
+
+
+def encodeCursor(key, direction):
+    """
+    Encode a seek key and a direction ('next' or 'prev') into an opaque cursor.
+
+    Datetimes are kept to the microsecond (DjangoJSONEncoder would cut them
+    to milliseconds), so the seek key equals the stored value.
+    """
+    key = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in key
+    ]
+    payload = json.dumps({"k": key, "d": direction}, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decodeCursor(cursor):
+    """
+    Decode a cursor built by encodeCursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        )
+        key, direction = payload['k'], payload['d']
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+    if direction not in ['next', 'prev'] or not isinstance(key, list):
+        raise ValueError("Invalid cursor.")
+
+    return key, direction
+
+
+def cursorPaginate(queryset, cursor, pagesize, sort_key='pk'):
+    """
+    Keyset-paginate a queryset on pk, or on a (sort_key, pk) pair.
+
+    Args:
+        queryset: The QuerySet to paginate
+        cursor: A cursor returned by a previous call, '' for the first page
+        pagesize: The number of rows per page
+        sort_key: The field to sort on, prefixed with '-' for a descending order
+
+    Returns:
+        tuple: (page_queryset, next_cursor, prev_cursor), the cursors are None
+        when there is no page in that direction
+
+    Raises:
+        ValueError: If the cursor is malformed
+
+    Instead of COUNT(*) and LIMIT/OFFSET, the page is found by seeking past the
+    key of the last row that was sent, so any page costs the same as the first.
+    """
+    descending = sort_key.startswith('-')
+    sort_field = sort_key.lstrip('-')
+    if sort_field == 'pk':
+        key_fields = ['pk']
+    else:
+        key_fields = [sort_field, 'pk']
+
+    key, direction = decodeCursor(cursor) if cursor else (None, 'next')
+    if key is not None and len(key) != len(key_fields):
+        raise ValueError("Invalid cursor.")
+
+    # Walking backwards is walking forwards on the reversed ordering.
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    lookup = 'lt' if reverse else 'gt'
+    ordering = [('-' if reverse else '') + field for field in key_fields]
+
+    keys_queryset = queryset.order_by(*ordering)
+    if key is not None:
+        seek = Q()
+        for position, field in enumerate(key_fields):
+            seek |= Q(
+                **{prev_field: key[index] for index, prev_field in enumerate(key_fields[:position])},
+                **{f'{field}__{lookup}': key[position]}
+            )
+        keys_queryset = keys_queryset.filter(seek)
+
+    keys = list(keys_queryset.values_list(*key_fields)[:pagesize + 1])
+    has_more = len(keys) > pagesize
+    keys = keys[:pagesize]
+    if backwards:
+        keys.reverse()
+
+    page_queryset = queryset.filter(
+        pk__in=[row_key[-1] for row_key in keys]
+    ).order_by(*[('-' if descending else '') + field for field in key_fields])
+
+    if not keys:
+        return page_queryset, None, None
+
+    if backwards:
+        next_cursor = encodeCursor(list(keys[-1]), 'next')
+        prev_cursor = encodeCursor(list(keys[0]), 'prev') if has_more else None
+    else:
+        next_cursor = encodeCursor(list(keys[-1]), 'next') if has_more else None
+        prev_cursor = encodeCursor(list(keys[0]), 'prev') if key is not None else None
+
+    return page_queryset, next_cursor, prev_cursor
+
+
+COUNT_MODES = ['exact', 'cached', 'estimated', 'none']
+
+
+def queryModels(queryset, sql):
+    """
+    List the models whose tables an SQL query of a queryset reads, joined
+    or in subqueries, the model of the queryset first.
+    """
+    quote = connections[queryset.db].ops.quote_name
+
+    return [queryset.model] + [
+        model for model in apps.get_app_config('inventory').get_models()
+        if model is not queryset.model and quote(model._meta.db_table) in sql
+    ]
+
+
+def countResults(queryset, count_mode='exact'):
+    """
+    Count the rows of a queryset with the given count mode.
+
+    Args:
+        queryset: The QuerySet to count
+        count_mode: One of COUNT_MODES
+
+    Returns:
+        int: The number of rows, None with count_mode 'none'
+
+    'exact' runs COUNT(*), 'cached' keeps the exact count in the cache for
+    INVENTORY_COUNT_CACHE_TTL seconds per filter signature (until one of the
+    models the query reads is written to), and 'estimated' stops counting at
+    INVENTORY_COUNT_ESTIMATE_LIMIT rows so the result is a lower bound past
+    that point.
+    """
+    if count_mode == 'none':
+        return None
+
+    if count_mode == 'estimated':
+        limit = getattr(settings, 'INVENTORY_COUNT_ESTIMATE_LIMIT', 10000)
+        return queryset.order_by()[:limit].count()
+
+    if count_mode == 'cached':
+        try:
+            signature = str(queryset.order_by().query)
+        except EmptyResultSet:
+            return 0
+
+        key = 'inventory:count:{}:{}'.format(
+            hashlib.md5(signature.encode()).hexdigest(),
+            ':'.join(str(getGeneration(model)) for model in queryModels(queryset, signature))
+        )
+        return cache.get_or_set(
+            key, queryset.count, getattr(settings, 'INVENTORY_COUNT_CACHE_TTL', 60)
+        )
+
+    return queryset.count()
+
+
+def paginateQueryset(request, queryset, page, pagesize):
+    """
+    Cut a page out of a queryset, counting the results as asked with ?count=.
+
+    Args:
+        request: The request object
+        queryset: The QuerySet to paginate
+        page: The 1-based page number
+        pagesize: The number of rows per page
+
+    Returns:
+        tuple: (page_queryset, total_pages, total_results), the totals are None
+        with ?count=none
+
+    ?count= accepts one of COUNT_MODES and defaults to INVENTORY_COUNT_MODE.
+    """
+    count_mode = request.GET.get('count', '')
+    if count_mode not in COUNT_MODES:
+        count_mode = getattr(settings, 'INVENTORY_COUNT_MODE', 'exact')
+
+    if count_mode in ['none', 'estimated']:
+        # Without an exact count, pages past the end are empty rather than
+        # clamped to the last page.
+        offset = (page - 1) * pagesize
+        page_queryset = queryset[offset:offset + pagesize]
+
+        total_results = countResults(queryset, count_mode)
+        if total_results is None:
+            return page_queryset, None, None
+
+        return page_queryset, max(1, -(-total_results // pagesize)), total_results
+
+    if count_mode == 'cached':
+        # The cached count only numbers the pages, the rows are sliced from
+        # the queryset itself so a count gone stale never cuts any out.
+        total_results = countResults(queryset, count_mode)
+        total_pages = max(1, -(-total_results // pagesize))
+
+        offset = (min(page, total_pages) - 1) * pagesize
+        return queryset[offset:offset + pagesize], total_pages, total_results
+
+    paginator = Paginator(queryset, pagesize)
+    paginator.count = countResults(queryset, count_mode)
+    page_object = paginator.get_page(page)
+
+    return page_object.object_list, paginator.num_pages, paginator.count
+
+
+def conditionalGet(probe):
+    """
+    Decorate a view with ETag / Last-Modified validators.
+
+    Args:
+        probe: A function taking the view arguments and returning a
+            (version, last_modified) pair from a cheap query, e.g. MAX(updatedAt)
+            and COUNT(*), or (None, None) when there is nothing to validate.
+            last_modified must be None unless every change of the version
+            moves it, or If-Modified-Since would answer stale 304s
+
+    Returns:
+        A view decorator
+
+    The strong ETag is a hash of the version and the full request path (so
+    every page, fieldset and cursor gets its own), and matching If-None-Match
+    or If-Modified-Since headers get a 304 before the view serializes anything.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, 'inventory_validators'):
+            version, last_modified = probe(request, *args, **kwargs)
+
+            etag = None
+            if version is not None:
+                etag = hashlib.sha1(
+                    f'{request.get_full_path()}:{version}'.encode()
+                ).hexdigest()
+
+            request.inventory_validators = (etag, last_modified)
+
+        return request.inventory_validators
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1]
+    )
+
+
+def cachedResponse(view):
+    """
+    Decorate a list view with a cache of its ready-to-send response bytes.
+
+    The key is built from the path, the sorted query parameters (page and
+    pagesize included) and the generations of Item, Stock, StockMovement,
+    Category and SubCategory, which every serialized row depends on (the
+    quantities on hand add the pending movements). A write to any of
+    them bumps its generation, so the stale entries are never read again
+    and expire after INVENTORY_RESULT_CACHE_TTL seconds.
+
+    Only successful, buffered GET responses are cached, the streamed
+    (?stream=1) ones always run the view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or wantsStream(request):
+            return view(request, *args, **kwargs)
+
+        params = sorted(
+            (key, value) for key, values in request.GET.lists() for value in values
+        )
+        generations = [
+            getGeneration(model) for model in (Item, Stock, StockMovement, Category, SubCategory)
+        ]
+        cache_key = 'inventory:response:' + hashlib.md5(
+            json.dumps([request.path, params, generations]).encode()
+        ).hexdigest()
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+
+        if response.status_code == 200 and not response.streaming:
+            cache.set(
+                cache_key, (response.content, response['Content-Type']),
+                settings.INVENTORY_RESULT_CACHE_TTL
+            )
+
+        return response
+
+    return wrapper
@@ -18,18 +18,37 @@
 from inventory.models import Category, SubCategory
 
 def poulateRelatedFields(querylist=None, related_field=None, related_model=None):
+    """
+    Replace the foreign-key ids of serialized rows with {id, name, slug} dicts.
+
+    All the ids of the page are collected first and resolved with a single
+    pk__in query, so the number of queries doesn't grow with the page size.
+    """
+    if not querylist:
+        return querylist
+
+    related_field_ids = {
+        query_dict['fields'].get(related_field) for query_dict in querylist
+    }
+    related_field_ids.discard(None)
+
+    related_field_objs = {
+        related_field_obj['id']: related_field_obj
+        for related_field_obj in related_model.objects.filter(
+            pk__in=related_field_ids
+        ).values('id', 'name', 'slug')
+    }
+
     for query_dict in querylist:
         related_field_id = query_dict['fields'].get(related_field)
-        if related_field_id:
-            related_field_obj = related_model.objects.get(pk=related_field_id)
-
-            query_dict['fields'][related_field] = {
-                'id': related_field_obj.id,
-                'name': related_field_obj.name,
-                'slug': related_field_obj.slug
-            }
+        if related_field_id in related_field_objs:
+            query_dict['fields'][related_field] = dict(
+                related_field_objs[related_field_id]
+            )
 
     # Handle both category and sub_category fields
-    if querylist is not None and querylist[0]['model'] == 'inventory.item':
+    if querylist[0]['model'] == 'inventory.item':
         if related_field == 'category':
-            poulateRelatedFields(querylist, 'sub_category', SubCategory)
\ No newline at end of file
+            poulateRelatedFields(querylist, 'sub_category', SubCategory)
+
+    return querylist
@@ -0,0 +1,174 @@
+from inventory.models import Item, Stock
+from inventory.search import filterByText
+from functools import lru_cache
+
+
+# Filter-query compiler
+#
+# A filter expression is a set of query parameters, <field>[__<operator>]=<value>:
+#
+#     items/query/?price__gte=100&price__lte=300&category__in=phones,tablets
+#         &qty__gt=0&q=pro&sort=-price,name
+#
+# The fields and sort keys a model accepts are whitelisted below, with the
+# ORM path they translate to. qty filters and sorts on the stock snapshot,
+# which lags the quantity on hand by at most INVENTORY_COMPACTION_INTERVAL
+# (see inventory.stocks). The translation of a set of (field, operator)
+# pairs is the compiled plan, it only depends on the shape of the expression,
+# not on its values, and is cached per normalized signature.
+
+# name -> (ORM path, value type), per model label
+QUERY_FIELDS = {
+    'inventory.item': {
+        'price': ('price', int),
+        'qty': ('stock__qty_in_stock', int),
+        'name': ('name', str),
+        'sku': ('sku', str),
+        'slug': ('slug', str),
+        'category': ('category__slug', str),
+        'sub_category': ('sub_category__slug', str),
+    },
+    'inventory.stock': {
+        'qty': ('qty_in_stock', int),
+        'price': ('item__price', int),
+        'item': ('item__slug', str),
+        'category': ('item__category__slug', str),
+        'sub_category': ('item__sub_category__slug', str),
+    },
+}
+
+# name -> ORM path, per model label
+QUERY_SORT_KEYS = {
+    'inventory.item': {
+        'pk': 'pk',
+        'name': 'name',
+        'price': 'price',
+        'qty': 'stock__qty_in_stock',
+        'updatedAt': 'updatedAt',
+    },
+    'inventory.stock': {
+        'pk': 'pk',
+        'qty': 'qty_in_stock',
+        'price': 'item__price',
+        'last_updated': 'last_updated',
+    },
+}
+
+# The unique path that breaks ties between rows of equal sort keys, per model
+# label. It is the last column of the indexes on the sort keys, so the index
+# still returns the rows in order: the pk for items, the item for stocks
+# (see Stock.Meta.indexes)
+QUERY_TIEBREAKS = {
+    'inventory.item': 'pk',
+    'inventory.stock': 'item',
+}
+
+QUERY_OPERATORS = ['exact', 'gt', 'gte', 'lt', 'lte', 'in']
+
+# Parameters that aren't filters: the text, the sort, and the ones read by the
+# views themselves (fieldsets, expansions, streaming, pagination, facets...)
+RESERVED_PARAMS = [
+    'q', 'sort', 'model', 'fields', 'expand', 'stream', 'page', 'pagesize',
+    'count', 'cursor', 'limit', 'facets'
+]
+
+
+@lru_cache(maxsize=256)
+def compilePlan(model_label, signature, sort):
+    """
+    Translate the shape of a filter expression into ORM lookups.
+
+    Args:
+        model_label: The label of the model being queried
+        signature: The sorted (field, operator) pairs of the expression
+        sort: The comma separated sort keys, '-' prefixed for descending
+
+    Returns:
+        tuple: ((field, operator, lookup, value type), ...) and the order_by paths
+
+    Raises:
+        ValueError: If a field, operator or sort key isn't supported
+    """
+    fields = QUERY_FIELDS[model_label]
+    sort_keys = QUERY_SORT_KEYS[model_label]
+
+    lookups = []
+    for field, operator in signature:
+        if field not in fields or operator not in QUERY_OPERATORS:
+            raise ValueError(f"Unsupported filter {field}__{operator}.")
+
+        path, value_type = fields[field]
+        lookups.append((field, operator, f'{path}__{operator}', value_type))
+
+    order_by = []
+    for sort_key in filter(None, sort.split(',')):
+        descending = sort_key.startswith('-')
+        if sort_key.lstrip('-') not in sort_keys:
+            raise ValueError(f"Unsupported sort key {sort_key.lstrip('-')}.")
+
+        order_by.append(('-' if descending else '') + sort_keys[sort_key.lstrip('-')])
+
+    tiebreak = QUERY_TIEBREAKS[model_label]
+    if order_by and order_by[-1].lstrip('-') not in ['pk', tiebreak]:
+        # Ties go in the direction of the last key, so the pages of a
+        # sorted list are stable
+        order_by.append(('-' if order_by[-1].startswith('-') else '') + tiebreak)
+
+    return tuple(lookups), tuple(order_by)
+
+
+def compileQuery(model, params):
+    """
+    Compile a filter expression into a single lazy queryset.
+
+    Args:
+        model: Item or Stock
+        params: The filter expression, a QueryDict or a dict of parameters
+
+    Returns:
+        QuerySet: The filtered and sorted queryset
+
+    Raises:
+        ValueError: If the expression or one of its values is invalid
+    """
+    model_label = str(model._meta)
+
+    values = {}
+    for param in params:
+        if param in RESERVED_PARAMS:
+            continue
+
+        field, _, operator = param.partition('__')
+        values[(field, operator or 'exact')] = params[param]
+
+    lookups, order_by = compilePlan(
+        model_label, tuple(sorted(values)), str(params.get('sort', '') or '')
+    )
+
+    filters = {}
+    for field, operator, lookup, value_type in lookups:
+        value = values[(field, operator)]
+        try:
+            if operator == 'in':
+                filters[lookup] = [
+                    value_type(element.strip()) for element in str(value).split(',')
+                    if element.strip()
+                ]
+            else:
+                filters[lookup] = value_type(value)
+        except ValueError:
+            raise ValueError(f"Invalid value for {field}__{operator}.")
+
+    queryset = model.objects.filter(**filters)
+
+    text = params.get('q', '')
+    if text:
+        if model is Item:
+            queryset = filterByText(queryset, text)
+        elif model is Stock:
+            queryset = queryset.filter(item__in=filterByText(Item.objects.all(), text))
+
+    if order_by:
+        queryset = queryset.order_by(*order_by)
+
+    return queryset
@@ -0,0 +1,293 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.utils import timezone
+from inventory.models import Item, Stock, StockMovement, StockReservation
+from inventory.signals import bumpGeneration
+from inventory.stocks import StockConflict, appendMovement, supportsReturning, withQtyOnHand
+import datetime
+
+
+# Stock reservations
+#
+# A reservation holds a quantity of an item for a while, during a checkout.
+# The quantities held by the active reservations of an item are counted in
+# Stock.qty_reserved, so the quantity available is the quantity on hand
+# (see inventory.stocks) minus that counter, without reading the
+# reservations. Reserving is a single conditional UPDATE of the counter,
+# which only succeeds while enough is available.
+#
+# Expired reservations aren't swept on a schedule: they are expired, and
+# their quantity given back, by the next write checking the reserved
+# quantity of the item (a reserve, an adjust or a bulk update), in the same
+# transaction, in batches read from a partial index of the active
+# reservations by expiry. Reads subtract the holds past their expiry not
+# swept yet, see lapsedHolds.
+
+class ReservationConflict(Exception):
+    """
+    Raised when a reservation can't be confirmed or released anymore.
+    """
+
+    def __init__(self, reservation_id, status):
+        self.status = status
+        super().__init__(f"Reservation {reservation_id} is {status}.")
+
+
+def releaseHeld(totals, using='default'):
+    """
+    Give the quantities of ended reservations back to their stocks.
+
+    Args:
+        totals: item id -> quantity no longer held
+        using: The database alias
+    """
+    now = timezone.now()
+    for item_id, qty in totals.items():
+        Stock.objects.using(using).filter(item=item_id).update(
+            qty_reserved=F('qty_reserved') - qty, last_updated=now
+        )
+
+    for stock in Stock.objects.using(using).filter(item__in=list(totals)):
+        post_save.send(
+            sender=Stock, instance=stock, created=False, raw=False, using=using,
+            update_fields={'qty_reserved', 'last_updated'}
+        )
+
+
+def expireReservations(item_ids=None, batch_size=100, using='default'):
+    """
+    Expire a batch of the active reservations past their expiry.
+
+    Args:
+        item_ids: The items whose reservations to expire, all if None
+        batch_size: The number of reservations expired at most
+        using: The database alias
+
+    Returns:
+        int: The number of reservations expired
+    """
+    connection = connections[using]
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        expired = StockReservation.objects.using(using).filter(
+            status=StockReservation.ACTIVE, expires_at__lte=now
+        )
+        if item_ids is not None:
+            expired = expired.filter(item__in=item_ids)
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent sweeps take different reservations
+            expired = expired.select_for_update(skip_locked=True)
+
+        rows = list(expired.order_by('expires_at').values_list('id', 'item_id', 'qty')[:batch_size])
+        if not rows:
+            return 0
+
+        StockReservation.objects.using(using).filter(
+            id__in=[id for id, _, _ in rows]
+        ).update(status=StockReservation.EXPIRED)
+
+        totals = {}
+        for _, item_id, qty in rows:
+            totals[item_id] = totals.get(item_id, 0) + qty
+
+        releaseHeld(totals, using)
+
+    bumpGeneration(StockReservation)
+
+    return len(rows)
+
+
+def expireLapsed(item_ids, using='default'):
+    """
+    Expire all the active reservations of items past their expiry, in
+    batches of INVENTORY_RESERVATION_SWEEP_BATCH, before their reserved
+    quantity is checked.
+
+    Args:
+        item_ids: The items whose reservations to expire
+        using: The database alias
+    """
+    batch_size = settings.INVENTORY_RESERVATION_SWEEP_BATCH
+    while expireReservations(item_ids, batch_size, using):
+        pass
+
+
+def lapsedHolds(item='item'):
+    """
+    Build the expression summing the quantities of the active reservations
+    past their expiry of the item referenced by the outer query, the part
+    of Stock.qty_reserved no longer held.
+    """
+    return Coalesce(
+        Subquery(
+            StockReservation.objects.filter(
+                item=OuterRef(item), status=StockReservation.ACTIVE,
+                expires_at__lte=timezone.now()
+            ).order_by().values('item').annotate(total=Sum('qty')).values('total')[:1]
+        ),
+        0
+    )
+
+
+def lastLapsed(item='item'):
+    """
+    Build the expression reading the latest expiry of the active
+    reservations past their expiry of the item referenced by the outer
+    query, None when there is none.
+    """
+    return Subquery(
+        StockReservation.objects.filter(
+            item=OuterRef(item), status=StockReservation.ACTIVE,
+            expires_at__lte=timezone.now()
+        ).order_by().values('item').annotate(latest=Max('expires_at')).values('latest')[:1]
+    )
+
+
+def reserveStock(item_slug, qty, ttl, reference='', using='default'):
+    """
+    Hold a quantity of an item for ttl seconds.
+
+    The expired reservations of the item are swept first, in the same
+    transaction, then the hold is taken with a single UPDATE ... WHERE
+    available >= qty ... RETURNING statement. Where RETURNING is not
+    supported the stock row is locked, checked and updated instead.
+
+    Args:
+        item_slug: The slug of the item
+        qty: The quantity to hold, positive
+        ttl: The number of seconds to hold it for
+        reference: The reference of the cart or order, free text
+        using: The database alias
+
+    Returns:
+        tuple: The StockReservation and the quantity still available
+
+    Raises:
+        Stock.DoesNotExist: If the item doesn't exist or has no stock
+        StockConflict: If less than qty is available
+    """
+    connection = connections[using]
+    now = timezone.now()
+
+    stocks = Stock.objects.using(using).filter(item__slug=item_slug)
+
+    with transaction.atomic(using=using):
+        expireLapsed(stocks.values('item'), using)
+
+        if supportsReturning(connection):
+            quote = connection.ops.quote_name
+            stock_table = quote(Stock._meta.db_table)
+            qty_on_hand = (
+                f'{stock_table}.qty_in_stock + COALESCE(('
+                f'SELECT SUM(movement.delta) FROM {quote(StockMovement._meta.db_table)} movement '
+                f'WHERE movement.item_id = {stock_table}.item_id AND movement.compacted = %s'
+                f'), 0)'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {stock_table} '
+                    f'SET qty_reserved = qty_reserved + %s, last_updated = %s '
+                    f'WHERE item_id = (SELECT id FROM {quote(Item._meta.db_table)} WHERE slug = %s) '
+                    f'AND {qty_on_hand} - qty_reserved >= %s '
+                    f'RETURNING id, item_id, qty_in_stock, qty_reserved, {qty_on_hand} - qty_reserved',
+                    [
+                        qty, connection.ops.adapt_datetimefield_value(now), item_slug,
+                        False, qty, False
+                    ]
+                )
+                row = cursor.fetchone()
+        else:
+            stock = withQtyOnHand(stocks.select_for_update()).first()
+            row = None
+            if stock is not None and stock.qty_on_hand - stock.qty_reserved >= qty:
+                stocks.update(qty_reserved=F('qty_reserved') + qty, last_updated=now)
+                row = (
+                    stock.id, stock.item_id, stock.qty_in_stock, stock.qty_reserved + qty,
+                    stock.qty_on_hand - stock.qty_reserved - qty
+                )
+
+        if row is None:
+            # Nothing was reserved, find out why
+            stock = withQtyOnHand(stocks).first()
+            if stock is None:
+                raise Stock.DoesNotExist
+            raise StockConflict(stock.qty_on_hand, -qty, stock.qty_reserved)
+
+        stock_id, item_id, qty_in_stock, qty_reserved, qty_available = row
+
+        reservation = StockReservation.objects.using(using).create(
+            item_id=item_id, qty=qty, reference=reference, created_at=now,
+            expires_at=now + datetime.timedelta(seconds=ttl)
+        )
+
+    post_save.send(
+        sender=Stock, created=False, raw=False, using=using,
+        instance=Stock(
+            id=stock_id, item_id=item_id, qty_in_stock=qty_in_stock,
+            qty_reserved=qty_reserved, last_updated=now
+        ),
+        update_fields={'qty_reserved', 'last_updated'}
+    )
+
+    return reservation, qty_available
+
+
+def endReservation(reservation_id, status, using='default'):
+    """
+    Confirm or release an active reservation.
+
+    Confirming takes the held quantity out of the stock, as a sale movement
+    referencing the reservation. Releasing gives it back. A reservation
+    past its expiry is expired instead.
+
+    Args:
+        reservation_id: The id of the reservation
+        status: StockReservation.CONFIRMED or StockReservation.RELEASED
+        using: The database alias
+
+    Returns:
+        StockReservation: The ended reservation
+
+    Raises:
+        StockReservation.DoesNotExist: If the reservation doesn't exist
+        ReservationConflict: If the reservation isn't active anymore
+    """
+    now = timezone.now()
+    reservations = StockReservation.objects.using(using).filter(id=reservation_id)
+
+    with transaction.atomic(using=using):
+        ended = reservations.filter(
+            status=StockReservation.ACTIVE, expires_at__gt=now
+        ).update(status=status)
+
+        reservation = reservations.select_related('item').first()
+        if reservation is None:
+            raise StockReservation.DoesNotExist
+
+        if not ended and reservation.status == StockReservation.ACTIVE:
+            # Past its expiry but not swept yet, expire it now
+            if reservations.filter(status=StockReservation.ACTIVE).update(
+                status=StockReservation.EXPIRED
+            ):
+                releaseHeld({reservation.item_id: reservation.qty}, using)
+            reservation.status = StockReservation.EXPIRED
+
+        if ended:
+            releaseHeld({reservation.item_id: reservation.qty}, using)
+
+            if status == StockReservation.CONFIRMED:
+                appendMovement(
+                    reservation.item.slug, -reservation.qty, reason='sale',
+                    source=f'reservation {reservation.id}', using=using
+                )
+
+    bumpGeneration(StockReservation)
+
+    if not ended:
+        raise ReservationConflict(reservation_id, reservation.status)
+
+    return reservation
@@ -0,0 +1,356 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from inventory.indexes import trigram_index
+from inventory.myutils import serializeQueryset
+from functools import reduce
+import operator
+import re
+
+
+# Full-text search over Item.name, sku and description, backed by an SQLite
+# FTS5 table that mirrors inventory_item (external content) and is kept in
+# sync by triggers. The table is tokenized in trigrams, so a word matches
+# anywhere in a column, like name__icontains: "phone" finds "iPhone 14 Pro".
+# Words shorter than a trigram can't be looked up in the index and are
+# matched with icontains over the same columns. Other backends, or a
+# database that hasn't been migrated yet, fall back to name__icontains.
+
+FTS_TABLE = 'inventory_item_fts'
+
+FTS_COLUMNS = ['name', 'sku', 'description']
+
+# BM25 weight of every column, in FTS_COLUMNS order: a hit in the name counts
+# more than one in the sku, which counts more than one in the description.
+FTS_WEIGHTS = [10.0, 5.0, 1.0]
+
+# Markers wrapped around the matched terms by highlight() and snippet(),
+# turned into offsets before the text is sent.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# The shortest word looked up in the trigram index
+MIN_INDEXED_LENGTH = 3
+
+CREATE_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='inventory_item', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON inventory_item BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON inventory_item BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, sku, description ON inventory_item BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+]
+
+DROP_INDEX_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# Whether the index exists, per (database alias, database name)
+_fts_tables = {}
+
+
+def ftsAvailable(using='default'):
+    """
+    Check whether the full-text index can be queried on a database.
+
+    The table lookup is done once per database and remembered.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _fts_tables:
+        _fts_tables[key] = FTS_TABLE in connection.introspection.table_names()
+
+    return _fts_tables[key]
+
+
+def createIndex(using='default'):
+    """
+    Create the full-text table and its triggers, if they don't exist yet.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for sql in CREATE_INDEX_SQL:
+            cursor.execute(sql)
+
+    _fts_tables.pop((using, connection.settings_dict['NAME']), None)
+
+
+def dropIndex(using='default'):
+    """
+    Drop the full-text table and its triggers.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for sql in DROP_INDEX_SQL:
+            cursor.execute(sql)
+
+    _fts_tables.pop((using, connection.settings_dict['NAME']), None)
+
+
+def rebuildIndex(using='default'):
+    """
+    Rebuild the full-text index from the content of inventory_item.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def buildMatchQuery(text):
+    """
+    Turn user input into a safe FTS5 MATCH expression.
+
+    Every word of at least MIN_INDEXED_LENGTH characters becomes a quoted
+    string ("word"), matched anywhere in a column by the trigram tokenizer,
+    and the words are ANDed, so the FTS5 query syntax (operators, column
+    filters, quotes) can't be injected.
+
+    Returns:
+        str: The MATCH expression, None if the text has no word long enough
+    """
+    tokens = [
+        token for token in re.findall(r'\w+', text)
+        if len(token) >= MIN_INDEXED_LENGTH
+    ]
+    if not tokens:
+        return None
+
+    return ' '.join(f'"{token}"' for token in tokens)
+
+
+def shortWordsFilter(text):
+    """
+    Build the filter matching the words of a text too short for the trigram
+    index, each anywhere in name, sku or description.
+
+    Returns:
+        Q: The ANDed conditions, empty if there is no short word
+    """
+    condition = Q()
+    for token in re.findall(r'\w+', text):
+        if len(token) < MIN_INDEXED_LENGTH:
+            condition &= reduce(operator.or_, [
+                Q(**{f'{column}__icontains': token}) for column in FTS_COLUMNS
+            ])
+
+    return condition
+
+
+def filterByText(queryset, text):
+    """
+    Narrow an Item queryset to the items matching a text search.
+
+    Args:
+        queryset: A QuerySet of Item
+        text: The text to search name, sku and description for
+
+    Returns:
+        QuerySet: The filtered queryset, still lazy so that it combines with
+        the other filters into a single query
+    """
+    if not re.search(r'\w', text) or not ftsAvailable(queryset.db):
+        return queryset.filter(name__icontains=text)
+
+    queryset = queryset.filter(shortWordsFilter(text))
+
+    match = buildMatchQuery(text)
+    if match is None:
+        return queryset
+
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+    ))
+
+
+def rankedSearch(queryset, text, limit):
+    """
+    Run a BM25-ranked text search and keep the top results only.
+
+    Args:
+        queryset: A QuerySet of Item carrying the other filters of the search
+        text: The text to search name, sku and description for
+        limit: The number of results to keep
+
+    Returns:
+        list: One {pk, score, highlights, snippet} dict per result, best first,
+        None if the full-text index isn't available
+
+    The ranking is done by FTS5 itself (ORDER BY rank ... LIMIT), which keeps
+    only the best `limit` matches while scanning, instead of loading every
+    match to sort them in python. The other filters are applied as a rowid
+    IN (...) subquery of the same statement.
+    """
+    match = buildMatchQuery(text)
+
+    if match is None or not ftsAvailable(queryset.db):
+        return None
+
+    # The words too short for the index only filter, they aren't ranked
+    queryset = queryset.filter(shortWordsFilter(text))
+
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+
+    sql = f"""
+        SELECT rowid, rank,
+            highlight({FTS_TABLE}, 0, %s, %s),
+            snippet({FTS_TABLE}, 2, %s, %s, '...', 12)
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s AND rank MATCH 'bm25({weights})'
+    """
+    params = [HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match]
+
+    if queryset.query.has_filters():
+        filter_sql, filter_params = queryset.values('pk').query.sql_with_params()
+        sql += f" AND rowid IN ({filter_sql})"
+        params += list(filter_params)
+
+    sql += " ORDER BY rank LIMIT %s"
+    params.append(limit)
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    results = []
+    for pk, rank, name, snippet in rows:
+        name, name_offsets = highlightOffsets(name)
+        snippet, snippet_offsets = highlightOffsets(snippet)
+
+        results.append({
+            'pk': pk,
+            # bm25() is negative, the lower the better
+            'score': -rank,
+            'highlights': {'name': name_offsets},
+            'snippet': {'text': snippet, 'offsets': snippet_offsets},
+        })
+
+    return results
+
+
+def serializeRankedItems(queryset, text, limit, fields=None, expand=None):
+    """
+    Serialize the top results of a ranked search, best first.
+
+    Args:
+        queryset: A QuerySet of Item carrying the other filters of the search
+        text: The text to search name, sku and description for
+        limit: The number of results to keep
+        fields: The sparse fieldset handed to serializeQueryset
+        expand: The relations to embed, handed to serializeQueryset
+
+    Returns:
+        list: The serialized items, each with its score, highlights and
+        snippet, None if the full-text index isn't available
+    """
+    results = rankedSearch(queryset, text, limit)
+    if results is None:
+        return None
+
+    rows = {
+        row['pk']: row for row in serializeQueryset(
+            queryset.model.objects.filter(pk__in=[result['pk'] for result in results]),
+            fields, expand=expand
+        )
+    }
+
+    return [
+        {
+            **rows[result['pk']],
+            'score': result['score'],
+            'highlights': result['highlights'],
+            'snippet': result['snippet']
+        }
+        for result in results if result['pk'] in rows
+    ]
+
+
+def serializeFuzzyItems(queryset, text, limit, fields=None, expand=None):
+    """
+    Serialize the items whose name or sku look like the text, most similar first.
+
+    Args:
+        queryset: A QuerySet of Item carrying the other filters of the search
+        text: The text to look for, typos included
+        limit: The number of results to keep
+        fields: The sparse fieldset handed to serializeQueryset
+        expand: The relations to embed, handed to serializeQueryset
+
+    Returns:
+        list: The serialized items, each with its trigram similarity score
+
+    The candidates come from the in-memory trigram index (see
+    inventory.indexes), the database only applies the other filters to them.
+    """
+    scores = dict(trigram_index.search(text, settings.INVENTORY_FUZZY_THRESHOLD))
+
+    candidates = list(scores)
+    if not queryset.query.has_filters():
+        candidates = candidates[:limit]
+
+    rows = serializeQueryset(
+        queryset.filter(pk__in=candidates), fields, expand=expand
+    )
+    rows.sort(key=lambda row: (-scores[row['pk']], row['pk']))
+
+    return [{**row, 'score': scores[row['pk']]} for row in rows[:limit]]
+
+
+def highlightOffsets(text):
+    """
+    Strip the highlight markers from a text and return where they were.
+
+    Returns:
+        tuple: (the text without markers, [[start, end], ...] of the matched terms)
+    """
+    offsets = []
+    plain = []
+    length = 0
+    start = None
+
+    for char in text or '':
+        if char == HIGHLIGHT_START:
+            start = length
+        elif char == HIGHLIGHT_END:
+            if start is not None:
+                offsets.append([start, length])
+            start = None
+        else:
+            plain.append(char)
+            length += 1
+
+    return ''.join(plain), offsets
@@ -0,0 +1,81 @@
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from inventory.models import Item, Stock, Category, SubCategory, StockMovement, StockCheckpoint, StockReservation
+import time
+
+
+# Generation counters
+#
+# Every model that cached results depend on has a generation counter kept in
+# the cache. Writes bump the counter, and the cache keys built from it change,
+# so stale entries are never read again and simply expire. Writes that don't
+# send signals (update(), bulk_create(), raw SQL) bump the counter themselves.
+#
+# A counter is seeded with the current time in nanoseconds rather than 1: a
+# counter evicted from the cache (or lost with it) restarts above every value
+# it took before, so the keys built from it never collide with older ones.
+#
+# The counters only invalidate across processes when the cache is shared by
+# them. With a process-local cache the results cached by a worker expire
+# after INVENTORY_RESULT_CACHE_TTL, and its in-memory indexes
+# (inventory.indexes, inventory.columnar) after INVENTORY_INDEX_TTL, which
+# bounds how long it can miss the writes of the others.
+
+def getGeneration(model):
+    """
+    Return the current generation counter of a model.
+    """
+    return cache.get_or_set(f'inventory:generation:{model._meta.label_lower}', time.time_ns, None)
+
+
+def bumpGeneration(model):
+    """
+    Bump the generation counter of a model, invalidating everything cached from it.
+    """
+    key = f'inventory:generation:{model._meta.label_lower}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+@register(Tags.caches, deploy=True)
+def checkSharedCache(app_configs, **kwargs):
+    """
+    Warn when the generation counters live in a process-local cache.
+    """
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+
+    return [
+        Warning(
+            "The default cache is local to each process, a write in one worker "
+            "doesn't invalidate the responses cached by the others.",
+            hint=(
+                "Use a cache shared by the workers (e.g. FileBasedCache, Redis or "
+                "Memcached), or run a single worker process."
+            ),
+            id='inventory.W001',
+        )
+    ]
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=StockMovement)
+@receiver(post_delete, sender=StockMovement)
+@receiver(post_save, sender=StockCheckpoint)
+@receiver(post_delete, sender=StockCheckpoint)
+@receiver(post_save, sender=StockReservation)
+@receiver(post_delete, sender=StockReservation)
+def invalidateCachedResults(sender, **kwargs):
+    bumpGeneration(sender)
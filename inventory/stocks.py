@@ -0,0 +1,568 @@
+from django.db import connections, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.utils import timezone
+from inventory.models import Item, Stock, StockCheckpoint, StockMovement
+from inventory.signals import bumpGeneration
+
+
+# Stock quantity writes
+#
+# Every change of a quantity is a StockMovement, a signed delta appended to
+# the ledger of the item. Stock.qty_in_stock is a snapshot of the compacted
+# movements, and the quantity on hand is that snapshot plus the movements
+# not compacted yet, summed from the partial (item, id) index of the
+# pending ones.
+#
+# Relative changes only insert a movement, so writers never update the
+# stock row and increments never wait on each other. Decrements are refused
+# when they would take the quantity on hand below the quantity reserved
+# (see inventory.reservations), and are serialized per item on the stock
+# row lock so that check holds under concurrency.
+# The compact_stock_movements command folds the pending movements into the
+# snapshots every INVENTORY_COMPACTION_INTERVAL seconds, in the background.
+# Reads serve the quantity on hand, but the queries filtering, sorting or
+# bucketing on qty_in_stock are answered from the indexes of the snapshot,
+# so they lag the ledger by at most that interval. Reads never compact, so
+# they never take the write lock the adjustments contend on.
+#
+# Absolute writes (the quantity counted by a person or a warehouse sync)
+# compact the item first, then set the snapshot and record the difference
+# as an already compacted movement. A count is what is on the shelf, so it
+# is applied even below the quantity reserved: refusing it would keep
+# selling stock that isn't there. The shortfall is reported instead, for
+# the caller to cancel reservations.
+
+class StockConflict(Exception):
+    """
+    Raised when a change would take the quantity on hand of an item below
+    its reserved quantity (zero when nothing is reserved).
+    """
+
+    def __init__(self, qty_on_hand, delta, qty_reserved=0):
+        self.qty_on_hand = qty_on_hand
+        self.qty_reserved = qty_reserved
+        self.delta = delta
+        super().__init__(
+            f"Insufficient stock: {qty_on_hand} on hand, {qty_reserved} reserved, cannot apply {delta}."
+        )
+
+
+def pendingDelta(item='item'):
+    """
+    Build the expression summing the uncompacted movements of the item
+    referenced by the outer query.
+    """
+    return Coalesce(
+        Subquery(
+            StockMovement.objects.filter(
+                item=OuterRef(item), compacted=False
+            ).order_by().values('item').annotate(total=Sum('delta')).values('total')[:1]
+        ),
+        0
+    )
+
+
+def lastPending(field, item='item'):
+    """
+    Build the expression reading the latest value of a field of the
+    uncompacted movements of the item referenced by the outer query, None
+    when there is none.
+    """
+    return Subquery(
+        StockMovement.objects.filter(
+            item=OuterRef(item), compacted=False
+        ).order_by().values('item').annotate(latest=Max(field)).values('latest')[:1]
+    )
+
+
+def supportsReturning(connection):
+    """
+    Check whether the writes of this module can read rows back with a
+    RETURNING clause: on PostgreSQL, and on SQLite from 3.35 only.
+    """
+    return (
+        connection.vendor in ['postgresql', 'sqlite']
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def fromDatabase(connection, model, field_name, value):
+    """
+    Convert the value of a field read with a raw cursor as the ORM would.
+    """
+    field = model._meta.get_field(field_name)
+    column = field.get_col(model._meta.db_table)
+    for converter in connection.ops.get_db_converters(column) + field.get_db_converters(connection):
+        value = converter(value, column, connection)
+    return value
+
+
+def withQtyOnHand(queryset):
+    """
+    Annotate a queryset of Stock with qty_on_hand, the snapshot plus the
+    uncompacted movements.
+    """
+    return queryset.annotate(qty_on_hand=F('qty_in_stock') + pendingDelta())
+
+
+def appendMovement(item_slug, delta, reason='adjustment', source='', using='default'):
+    """
+    Append a movement to the ledger of an item.
+
+    The movement is inserted with a single INSERT ... SELECT statement that
+    only inserts a decrement while the quantity on hand stays at or above
+    the reserved quantity.
+
+    Args:
+        item_slug: The slug of the item
+        delta: The signed quantity to add
+        reason: Why the quantity changed, e.g. receipt, sale, adjustment
+        source: Who or what changed it, free text
+        using: The database alias
+
+    Returns:
+        tuple: The StockMovement and the Stock of the item, annotated with qty_on_hand
+
+    Raises:
+        Stock.DoesNotExist: If the item doesn't exist or has no stock
+        StockConflict: If the quantity on hand would go below the reserved quantity
+
+    The reservations of the item past their expiry are expired first, in
+    the same transaction, so they don't count as reserved.
+
+    On PostgreSQL and SQLite 3.35+ the stock is read back by the RETURNING
+    clause of the same statement, so a successful append costs one query.
+    Elsewhere it is read after the insert.
+    """
+    # Imported here, inventory.reservations builds on this module
+    from inventory.reservations import expireLapsed
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    returning = supportsReturning(connection)
+    now = timezone.now()
+
+    stocks = Stock.objects.using(using).filter(item__slug=item_slug)
+    movement_table = quote(StockMovement._meta.db_table)
+    stock_table = quote(Stock._meta.db_table)
+
+    # The stock of the inserted movement. The new movement is left out of the
+    # pending sum and added back, as SQLite shows it to the RETURNING clause
+    # and PostgreSQL doesn't
+    returned_stock = f'SELECT stock.{{}} FROM {stock_table} stock WHERE stock.item_id = {movement_table}.item_id'
+    returned_columns = ', '.join(
+        [f'{movement_table}.id', f'{movement_table}.item_id']
+        + [f'({returned_stock.format(column)})' for column in ['id', 'qty_in_stock', 'qty_reserved', 'last_updated']]
+        + [
+            f'({returned_stock.format("qty_in_stock")}) + {movement_table}.delta + COALESCE(('
+            f'SELECT SUM(movement.delta) FROM {movement_table} movement '
+            f'WHERE movement.item_id = {movement_table}.item_id AND movement.compacted = %s '
+            f'AND movement.id <> {movement_table}.id'
+            f'), 0)'
+        ]
+    )
+
+    with transaction.atomic(using=using):
+        expireLapsed(stocks.values('item'), using)
+
+        if delta < 0 and connection.features.has_select_for_update:
+            # Decrements of an item are serialized on its stock row,
+            # increments never wait
+            list(stocks.select_for_update().values_list('pk'))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {movement_table} '
+                f'(item_id, delta, reason, source, created_at, compacted) '
+                f'SELECT stock.item_id, %s, %s, %s, %s, %s '
+                f'FROM {stock_table} stock '
+                f'INNER JOIN {quote(Item._meta.db_table)} item ON item.id = stock.item_id '
+                f'WHERE item.slug = %s AND (%s >= 0 OR stock.qty_in_stock + COALESCE(('
+                f'SELECT SUM(movement.delta) FROM {movement_table} movement '
+                f'WHERE movement.item_id = stock.item_id AND movement.compacted = %s'
+                f'), 0) + %s >= stock.qty_reserved)'
+                + (f' RETURNING {returned_columns}' if returning else ''),
+                [
+                    delta, reason, source, connection.ops.adapt_datetimefield_value(now),
+                    False, item_slug, delta, False, delta
+                ] + ([False] if returning else [])
+            )
+            if returning:
+                row = cursor.fetchone()
+            else:
+                row = None
+                if cursor.rowcount:
+                    stock = withQtyOnHand(stocks).get()
+                    row = (
+                        cursor.lastrowid, stock.item_id, stock.id, stock.qty_in_stock,
+                        stock.qty_reserved, stock.last_updated, stock.qty_on_hand
+                    )
+
+        if row is None:
+            # Nothing was inserted, find out why
+            stock = withQtyOnHand(stocks).first()
+            if stock is None:
+                raise Stock.DoesNotExist
+            raise StockConflict(stock.qty_on_hand, delta, stock.qty_reserved)
+
+    movement_id, item_id, stock_id, qty_in_stock, qty_reserved, last_updated, qty_on_hand = row
+
+    stock = Stock(
+        id=stock_id, item_id=item_id, qty_in_stock=qty_in_stock, qty_reserved=qty_reserved,
+        last_updated=fromDatabase(connection, Stock, 'last_updated', last_updated)
+    )
+    stock.qty_on_hand = qty_on_hand
+
+    movement = StockMovement(
+        id=movement_id, item_id=item_id, delta=delta, reason=reason, source=source,
+        created_at=now, compacted=False
+    )
+
+    bumpGeneration(StockMovement)
+
+    return movement, stock
+
+
+def compactMovements(item_ids=None, batch_size=1000, using='default'):
+    """
+    Fold the pending movements of items into their stock snapshots.
+
+    All the pending movements of an item are folded together, under the
+    lock of its stock row, so a snapshot never goes through a state the
+    ledger didn't. Movements appended while compacting are left for the
+    next run.
+
+    Args:
+        item_ids: The items to compact, the first batch_size items with
+            pending movements if None
+        batch_size: The number of items compacted in one transaction
+        using: The database alias
+
+    Returns:
+        int: The number of movements compacted
+    """
+    pending = StockMovement.objects.using(using).filter(compacted=False)
+
+    with transaction.atomic(using=using):
+        if item_ids is None:
+            item_ids = list(
+                pending.order_by('item').values_list('item', flat=True).distinct()[:batch_size]
+            )
+
+        stocks = {
+            stock.item_id: stock
+            for stock in Stock.objects.using(using).select_for_update().filter(
+                item__in=item_ids
+            ).order_by('pk')
+        }
+
+        # Read once the stock rows are locked, so a concurrent compaction of
+        # the same items sees them compacted
+        movements = list(
+            pending.filter(item__in=list(stocks)).values_list('id', 'item_id', 'delta')
+        )
+        if not movements:
+            return 0
+
+        totals = {}
+        for _, item_id, delta in movements:
+            totals[item_id] = totals.get(item_id, 0) + delta
+
+        now = timezone.now()
+        updated = []
+        for item_id, total in totals.items():
+            stock = stocks[item_id]
+            stock.qty_in_stock += total
+            stock.last_updated = now
+            updated.append(stock)
+
+        Stock.objects.using(using).bulk_update(updated, ['qty_in_stock', 'last_updated'])
+
+        ids = [id for id, _, _ in movements]
+        for start in range(0, len(ids), 2000):
+            StockMovement.objects.using(using).filter(
+                id__in=ids[start:start + 2000]
+            ).update(compacted=True)
+
+    for stock in updated:
+        post_save.send(
+            sender=Stock, instance=stock, created=False, raw=False, using=using,
+            update_fields={'qty_in_stock', 'last_updated'}
+        )
+    bumpGeneration(StockMovement)
+
+    return len(movements)
+
+
+def compactPending(batch_size=1000, using='default'):
+    """
+    Fold every movement pending at the time of the call into the snapshots.
+
+    Run by the compact_stock_movements command. With nothing pending it
+    costs a single aggregate over the partial index of the pending
+    movements.
+
+    Args:
+        batch_size: The number of items compacted in one transaction
+        using: The database alias
+
+    Returns:
+        int: The number of movements compacted
+    """
+    pending = StockMovement.objects.using(using).filter(
+        compacted=False, item__stock__isnull=False
+    )
+
+    latest = pending.aggregate(latest=Max('id'))['latest']
+    if latest is None:
+        return 0
+
+    # Movements appended meanwhile are left to the next call, so a stream
+    # of writes can't keep a run going
+    compacted = 0
+    while True:
+        item_ids = list(
+            pending.filter(id__lte=latest).order_by('item').values_list(
+                'item', flat=True
+            ).distinct()[:batch_size]
+        )
+        if not item_ids:
+            return compacted
+
+        compacted += compactMovements(item_ids, batch_size, using)
+
+
+def openStock(item, qty_in_stock, using='default'):
+    """
+    Create the stock of a new item and open its ledger.
+
+    Returns:
+        Stock: The created stock
+    """
+    with transaction.atomic(using=using):
+        stock = Stock.objects.using(using).create(item=item, qty_in_stock=qty_in_stock)
+        StockMovement.objects.using(using).create(
+            item=item, delta=stock.qty_in_stock, reason='opening', compacted=True
+        )
+
+    return stock
+
+
+def validateStockUpdate(entry):
+    """
+    Check an entry of a bulk stock update, {sku|slug, qty|delta}.
+
+    Returns:
+        str: The error of an invalid entry, None for a valid one
+    """
+    if not isinstance(entry, dict):
+        return "Entry must be an object."
+
+    keys = [key for key in ['sku', 'slug'] if key in entry]
+    if len(keys) != 1 or not isinstance(entry[keys[0]], str):
+        return "Entry must have either a sku or a slug."
+
+    changes = [change for change in ['qty', 'delta'] if change in entry]
+    if len(changes) != 1:
+        return "Entry must have either a qty or a delta."
+
+    value = entry[changes[0]]
+    if not isinstance(value, int) or isinstance(value, bool):
+        return f"{changes[0]} must be an integer."
+
+    if changes[0] == 'qty' and value < 0:
+        return "qty must not be negative."
+
+    return None
+
+
+def applyStockUpdates(entries, reason='sync', source='', using='default'):
+    """
+    Apply a batch of absolute (qty) or relative (delta) quantity changes.
+
+    The items of all the entries are compacted, their stocks read and
+    locked with a single IN query, and the changes written with
+    bulk_update and recorded with bulk_create, in one transaction. Entries
+    are applied in order, several entries may target the same stock. An
+    entry that fails doesn't prevent the others from being applied.
+
+    Args:
+        entries: A list of {sku|slug, qty|delta} dicts
+        reason: The reason of the recorded movements
+        source: The source of the recorded movements
+        using: The database alias
+
+    Returns:
+        list: One result per entry, in order: {index, sku|slug, status}, the
+        status being updated (with the new qty_in_stock, and qty_short when
+        a count left less than the quantity reserved), not_found, conflict
+        (with the current qty_in_stock and qty_reserved) or invalid (with
+        an error)
+
+    Like appendMovement, the reservations past their expiry are expired
+    first, and a negative delta is refused when it would take the quantity
+    below the quantity reserved. An absolute qty is always applied, see the
+    policy above.
+    """
+    # Imported here, inventory.reservations builds on this module
+    from inventory.reservations import expireLapsed
+
+    results = []
+    valid = []
+
+    for index, entry in enumerate(entries):
+        error = validateStockUpdate(entry)
+        if error is not None:
+            results.append({"index": index, "status": "invalid", "error": error})
+            continue
+
+        key = 'sku' if 'sku' in entry else 'slug'
+        results.append({"index": index, key: entry[key]})
+        valid.append((index, key, entry))
+
+    skus = [entry['sku'] for _, key, entry in valid if key == 'sku']
+    slugs = [entry['slug'] for _, key, entry in valid if key == 'slug']
+    items = Item.objects.using(using).filter(Q(sku__in=skus) | Q(slug__in=slugs))
+
+    now = timezone.now()
+    updated = {}
+    movements = []
+
+    with transaction.atomic(using=using):
+        expireLapsed(items.values('id'), using)
+        compactMovements(item_ids=items.values('id'), using=using)
+
+        stocks = {}
+        for id, item_id, qty_in_stock, qty_reserved, sku, slug in Stock.objects.using(using).select_for_update().filter(
+            item__in=items.values('id')
+        ).values_list('id', 'item_id', 'qty_in_stock', 'qty_reserved', 'item__sku', 'item__slug'):
+            stock = Stock(id=id, item_id=item_id, qty_in_stock=qty_in_stock, qty_reserved=qty_reserved)
+            stocks[('sku', sku)] = stocks[('slug', slug)] = stock
+
+        for index, key, entry in valid:
+            result = results[index]
+            stock = stocks.get((key, entry[key]))
+
+            if stock is None:
+                result['status'] = 'not_found'
+                continue
+
+            if 'qty' in entry:
+                qty_in_stock = entry['qty']
+            else:
+                qty_in_stock = stock.qty_in_stock + entry['delta']
+
+                if entry['delta'] < 0 and qty_in_stock < stock.qty_reserved:
+                    result.update(
+                        status='conflict', qty_in_stock=stock.qty_in_stock,
+                        qty_reserved=stock.qty_reserved
+                    )
+                    continue
+
+            movements.append(StockMovement(
+                item_id=stock.item_id, delta=qty_in_stock - stock.qty_in_stock,
+                reason=reason, source=source, created_at=now, compacted=True
+            ))
+
+            stock.qty_in_stock = qty_in_stock
+            stock.last_updated = now
+            updated[stock.id] = stock
+            result.update(status='updated', qty_in_stock=qty_in_stock)
+            if qty_in_stock < stock.qty_reserved:
+                result['qty_short'] = stock.qty_reserved - qty_in_stock
+
+        Stock.objects.using(using).bulk_update(
+            updated.values(), ['qty_in_stock', 'last_updated']
+        )
+        StockMovement.objects.using(using).bulk_create(movements, batch_size=2000)
+
+    for stock in updated.values():
+        post_save.send(
+            sender=Stock, instance=stock, created=False, raw=False, using=using,
+            update_fields={'qty_in_stock', 'last_updated'}
+        )
+    if movements:
+        bumpGeneration(StockMovement)
+
+    return results
+
+
+# Point-in-time quantities
+#
+# The quantity on hand of an item at a time is the sum of its movements up
+# to then. Checkpoints of every item are taken periodically, so that sum
+# starts from the last checkpoint before the time and only adds the
+# movements since, whatever the age of the ledger.
+
+def quantitiesAsOf(moment, item_ids=None, using='default'):
+    """
+    Compute the quantities on hand of items at a point in time.
+
+    Args:
+        moment: An aware datetime
+        item_ids: The items to compute, all of them if None
+        using: The database alias
+
+    Returns:
+        tuple: (dict item id -> quantity, taken_at of the checkpoint
+        started from, None if there is none before the moment). Items
+        without any movement up to the moment are left out
+    """
+    checkpoints = StockCheckpoint.objects.using(using).filter(taken_at__lte=moment)
+    movements = StockMovement.objects.using(using).filter(created_at__lte=moment)
+
+    if item_ids is not None:
+        checkpoints = checkpoints.filter(item__in=item_ids)
+        movements = movements.filter(item__in=item_ids)
+
+    taken_at = checkpoints.aggregate(taken_at=Max('taken_at'))['taken_at']
+
+    quantities = {}
+    if taken_at is not None:
+        quantities = dict(checkpoints.filter(taken_at=taken_at).values_list('item', 'qty'))
+        movements = movements.filter(created_at__gt=taken_at)
+
+    for item_id, total in movements.order_by().values('item').annotate(
+        total=Sum('delta')
+    ).values_list('item', 'total'):
+        quantities[item_id] = quantities.get(item_id, 0) + total
+
+    return quantities, taken_at
+
+
+def takeCheckpoint(moment, using='default'):
+    """
+    Record the quantities on hand of every item at a point in time.
+
+    Args:
+        moment: An aware datetime, after the last checkpoint
+        using: The database alias
+
+    Returns:
+        int: The number of items checkpointed
+
+    Raises:
+        ValueError: If a checkpoint at or after the moment exists
+    """
+    with transaction.atomic(using=using):
+        latest = StockCheckpoint.objects.using(using).aggregate(
+            taken_at=Max('taken_at')
+        )['taken_at']
+        if latest is not None and latest >= moment:
+            raise ValueError(f"A checkpoint was already taken at {latest.isoformat()}.")
+
+        quantities, _ = quantitiesAsOf(moment, using=using)
+
+        StockCheckpoint.objects.using(using).bulk_create(
+            [
+                StockCheckpoint(item_id=item_id, qty=qty, taken_at=moment)
+                for item_id, qty in quantities.items()
+            ],
+            batch_size=2000
+        )
+
+    bumpGeneration(StockCheckpoint)
+
+    return len(quantities)
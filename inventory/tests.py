@@ -1,3 +1,901 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from inventory.columnar import item_columns, stock_columns
+from inventory.indexes import autocomplete_index, category_registry
+from inventory.middleware import CompressionMiddleware, brotli, zstandard
+from inventory.models import Item, Category, SubCategory, Stock, StockMovement, StockReservation
+from inventory.query import compileQuery
+from inventory.signals import bumpGeneration, checkSharedCache, getGeneration
+from inventory.stocks import openStock, takeCheckpoint
+from unittest import mock
+import datetime
+import io
+import json
+import re
+import unittest
+import zlib
 
 # Create your tests here.
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class QueryPlanTests(TestCase):
+    """
+    The queries of the filter and sort endpoints must be answered from an
+    index, never with a full table scan (nor, when sorted, a sort of the rows).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for i in range(3):
+            item = Item.objects.create(
+                name=f'Phone {i}', sku=f'PH-{i}', price=100 * i, description='A phone',
+                category=category, sub_category=sub_category
+            )
+            Stock.objects.create(item=item, qty_in_stock=i * 5)
+
+        cls.category = category
+        cls.sub_category = sub_category
+
+    def queryPlan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return sql, [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, queryset, sorted=False):
+        sql, plan = self.queryPlan(queryset)
+
+        for detail in plan:
+            self.assertIsNone(
+                re.match(r'SCAN (TABLE )?inventory_\w+$', detail),
+                f"Full table scan in:\n{sql}\n{plan}"
+            )
+
+        if sorted:
+            self.assertFalse(
+                any('TEMP B-TREE' in detail for detail in plan),
+                f"Rows sorted outside of an index in:\n{sql}\n{plan}"
+            )
+
+    def test_price_endpoints(self):
+        self.assertUsesIndexes(compileQuery(Item, {'price__gte': 100}))
+        self.assertUsesIndexes(compileQuery(Item, {'price__lte': 100}))
+        self.assertUsesIndexes(
+            compileQuery(Item, {'price__gte': 100, 'price__lte': 200, 'sort': 'price'}), sorted=True
+        )
+        self.assertUsesIndexes(
+            compileQuery(Item, {'price__lte': 200, 'price__gte': 100, 'sort': '-price'}), sorted=True
+        )
+
+    def test_quantity_endpoints(self):
+        self.assertUsesIndexes(compileQuery(Stock, {'qty__gte': 5}))
+        self.assertUsesIndexes(compileQuery(Stock, {'qty__lte': 5}))
+        self.assertUsesIndexes(
+            compileQuery(Stock, {'qty__gte': 0, 'qty__lte': 5, 'sort': 'qty'}), sorted=True
+        )
+        self.assertUsesIndexes(
+            compileQuery(Stock, {'qty__lte': 5, 'qty__gte': 0, 'sort': '-qty'}), sorted=True
+        )
+
+    def test_category_endpoints(self):
+        self.assertUsesIndexes(self.category.item_set.all())
+        self.assertUsesIndexes(self.sub_category.item_set.all())
+        self.assertUsesIndexes(
+            compileQuery(Item, {'category': self.category.slug, 'price__gte': 100, 'sort': 'price'}),
+            sorted=True
+        )
+        self.assertUsesIndexes(
+            compileQuery(Item, {'sub_category': self.sub_category.slug, 'price__lte': 100, 'sort': '-price'}),
+            sorted=True
+        )
+
+    def test_keyset_sorts(self):
+        item = Item.objects.first()
+
+        for sort_key in ['name', 'price', 'updatedAt']:
+            # The keys query of cursorPaginate, for the first and a later page
+            keys = Item.objects.order_by(sort_key, 'pk').values_list(sort_key, 'pk')
+            self.assertUsesIndexes(keys[:21], sorted=True)
+
+            key = getattr(item, sort_key)
+            self.assertUsesIndexes(
+                keys.filter(
+                    Q(**{f'{sort_key}__gt': key}) | Q(**{sort_key: key, 'pk__gt': item.pk})
+                )[:21],
+                sorted=True
+            )
+
+
+class CursorPaginationTests(TestCase):
+    """
+    Walking items/?cursor= forwards then backwards on every sort key must
+    return every item exactly once, in order.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for i in range(7):
+            item = Item.objects.create(
+                name=f'Phone {i % 3}', sku=f'PH-{i}', price=100 * (i % 4), description='A phone',
+                category=category, sub_category=sub_category
+            )
+            # Within the same millisecond, to the microsecond
+            Item.objects.filter(pk=item.pk).update(
+                updatedAt=datetime.datetime(2026, 1, 1, 12, 0, 0, 500100 + i, tzinfo=datetime.timezone.utc)
+            )
+
+    def walk(self, sort_key, cursor, direction):
+        """
+        Follow the cursors of one direction, returning the pks in list order
+        and the opposite cursor of the last page reached.
+        """
+        pks = []
+        back = 'prev' if direction == 'next' else 'next'
+        while cursor is not None:
+            response = self.client.get(
+                '/inventory/items/', {'cursor': cursor, 'sort': sort_key, 'pagesize': 2}
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+
+            data = response.json()
+            page = [row['pk'] for row in data['items']]
+            pks = pks + page if direction == 'next' else page + pks
+            self.assertLessEqual(len(pks), Item.objects.count(), f"Rows repeated: {pks}")
+            cursor, back_cursor = data[f'{direction}_cursor'], data[f'{back}_cursor']
+
+        return pks, back_cursor
+
+    def test_walk_every_sort_key(self):
+        for field in ['pk', 'name', 'price', 'updatedAt']:
+            for sort_key in [field, f'-{field}']:
+                with self.subTest(sort=sort_key):
+                    descending = sort_key.startswith('-')
+                    expected = list(
+                        Item.objects.order_by(sort_key, '-pk' if descending else 'pk')
+                        .values_list('pk', flat=True)
+                    )
+
+                    pks, prev_cursor = self.walk(sort_key, '', 'next')
+                    self.assertEqual(pks, expected)
+
+                    # The last page holds 7 % 2 rows, everything before it is walked back
+                    pks, _ = self.walk(sort_key, prev_cursor, 'prev')
+                    self.assertEqual(pks, expected[:-1])
+
+
+class CachedCountTests(TestCase):
+    """
+    A cached count must follow writes to the model being counted, and never
+    cut rows out of the page.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_count_follows_writes(self):
+        Category.objects.create(name='Phones')
+        Category.objects.create(name='Tablets')
+
+        url = '/inventory/categories/?page=1&pagesize=10&count=cached'
+        self.assertEqual(self.client.get(url).json()['total_results'], 2)
+
+        Category.objects.create(name='Laptops')
+        data = self.client.get(url).json()
+        self.assertEqual(data['total_results'], 3)
+        self.assertEqual(len(data['categories']), 3)
+
+    def test_stale_count_keeps_every_row(self):
+        for name in ['Phones', 'Tablets']:
+            Category.objects.create(name=name)
+
+        url = '/inventory/categories/?page=1&pagesize=10&count=cached'
+        self.client.get(url)
+
+        # A write that bypasses the signals, the generation doesn't move
+        Category.objects.bulk_create([Category(name='Laptops', slug='laptops')])
+        self.assertEqual(len(self.client.get(url).json()['categories']), 3)
+
+
+class ConditionalGetTests(TestCase):
+    """
+    A change the ETag sees but no timestamp does must not be answered with
+    a 304 to If-Modified-Since.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=self.category)
+
+        for i in range(2):
+            item = Item.objects.create(
+                name=f'Phone {i}', sku=f'PH-{i}', price=100, description='A phone',
+                category=self.category, sub_category=sub_category
+            )
+            Stock.objects.create(item=item, qty_in_stock=5)
+
+    def assertRevalidated(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        since = response.get('Last-Modified', 'Thu, 01 Jan 2099 00:00:00 GMT')
+
+        change()
+
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_item_deleted(self):
+        self.assertRevalidated(
+            '/inventory/items/?page=1&pagesize=10', lambda: Item.objects.get(sku='PH-1').delete()
+        )
+
+    def test_category_renamed(self):
+        def rename():
+            self.category.name = 'Mobiles'
+            self.category.save()
+
+        self.assertRevalidated('/inventory/items/retrieve/ph-0/', rename)
+
+
+class ColumnarEngineTests(TestCase):
+    """
+    The price and quantity routes asked for a page must serve the same rows
+    from the in-memory columns as from the database.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for i in range(12):
+            item = Item.objects.create(
+                name=f'Phone {i}', sku=f'PH-{i}', price=100 * (i % 5), description='A phone',
+                category=category, sub_category=sub_category
+            )
+            Stock.objects.create(item=item, qty_in_stock=i % 4)
+
+    def setUp(self):
+        cache.clear()
+        item_columns.generation = stock_columns.generation = None
+
+    def pages(self, url):
+        pages = []
+        for page in [1, 2, 3]:
+            data = self.client.get(url, {'page': page, 'pagesize': 5}).json()
+            rows = data.get('items', data.get('Items'))
+            pages.append(([row['pk'] for row in rows], data['total_pages'], data['total_results']))
+        return pages
+
+    def test_routed_ranges(self):
+        for url in [
+            '/inventory/items/min-price/100/',
+            '/inventory/items/max-price/300/',
+            '/inventory/items/price-min-max/100/300/',
+            '/inventory/items/price-max-min/300/100/',
+            '/inventory/items/min-qty/1/',
+            '/inventory/items/max-qty/2/',
+            '/inventory/stocks/qty-range-min-max/1/2/',
+            '/inventory/stocks/qty-range-max-min/2/1/',
+        ]:
+            with self.subTest(url=url):
+                with self.settings(INVENTORY_COLUMNAR_ENGINE=False):
+                    expected = self.pages(url)
+
+                cache.clear()
+                with self.settings(INVENTORY_COLUMNAR_ENGINE=True):
+                    self.assertEqual(self.pages(url), expected)
+
+                self.assertIsNotNone(
+                    (stock_columns if 'qty' in url else item_columns).generation,
+                    "The columns were never loaded"
+                )
+
+
+class LegacyRouteTests(TestCase):
+    """
+    The fixed price and quantity routes, aliases of items/query/, must keep
+    answering the requests they answered before.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for i in range(4):
+            item = Item.objects.create(
+                name=f'Phone {i}', sku=f'PH-{i}', price=100 * i, description='A phone',
+                category=category, sub_category=sub_category
+            )
+            Stock.objects.create(item=item, qty_in_stock=i)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unknown_params_ignored(self):
+        for url, key in [
+            ('/inventory/items/min-price/100/', 'items'),
+            ('/inventory/items/max-price/200/', 'items'),
+            ('/inventory/items/min-qty/1/', 'items'),
+            ('/inventory/items/max-qty/2/', 'items'),
+            ('/inventory/items/price-min-max/100/200/', 'Items'),
+            ('/inventory/items/price-max-min/200/100/', 'Items'),
+            ('/inventory/stocks/qty-range-min-max/1/2/', 'Items'),
+            ('/inventory/stocks/qty-range-max-min/2/1/', 'Items'),
+        ]:
+            with self.subTest(url=url):
+                expected = self.client.get(url).json()[key]
+
+                for params in [{'_': '1700000000000'}, {'price__gte': 300, 'sort': '-pk'}]:
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 200, response.content)
+                    self.assertEqual(response.json()[key], expected)
+
+    def test_pages_keep_keys(self):
+        for url, key, sort in [
+            ('/inventory/items/min-price/100/', 'items', 'price'),
+            ('/inventory/items/min-qty/1/', 'items', 'qty_in_stock'),
+            ('/inventory/items/max-qty/2/', 'items', 'qty_in_stock'),
+            ('/inventory/stocks/qty-range-max-min/3/1/', 'Items', '-qty_in_stock'),
+        ]:
+            with self.subTest(url=url):
+                rows = self.client.get(url).json()[key]
+                rows.sort(key=lambda row: row['fields'][sort.lstrip('-')], reverse=sort.startswith('-'))
+
+                data = self.client.get(url, {'page': 1}).json()
+                self.assertEqual(data['pagesize'], 20)
+                self.assertEqual(data['total_results'], len(rows))
+                self.assertEqual([row['pk'] for row in data[key]], [row['pk'] for row in rows])
+
+                data = self.client.get(url, {'page': 2, 'pagesize': 1}).json()
+                self.assertEqual([row['pk'] for row in data[key]], [rows[1]['pk']])
+
+    def test_page_cached_once(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.client.get('/inventory/items/min-qty/1/', {'page': 1, 'pagesize': 2})
+
+        keys = [call.args[0] for call in cache_set.call_args_list]
+        self.assertEqual(len([key for key in keys if key.startswith('inventory:response:')]), 1)
+
+
+class CompressionTests(TestCase):
+    """
+    Responses must be compressed with the best codec the client accepts,
+    and only when they are at least INVENTORY_COMPRESSION_MIN_SIZE bytes.
+    """
+
+    body = json.dumps([{'name': f'Phone {i}', 'sku': f'PH-{i}'} for i in range(100)]).encode()
+
+    def respond(self, accept_encoding, **overrides):
+        request = RequestFactory().get('/inventory/items/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        with self.settings(**overrides):
+            middleware = CompressionMiddleware(
+                lambda request: HttpResponse(self.body, content_type='application/json')
+            )
+            return middleware(request)
+
+    def test_gzip(self):
+        # Any codec is acceptable with *, gzip is only picked when it is the only one
+        wildcard = [] if zstandard or brotli else ['*']
+
+        for accept_encoding in ['gzip', 'deflate, gzip;q=0.5'] + wildcard:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.respond(accept_encoding, INVENTORY_COMPRESSION_LEVEL=3)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+    def test_level_capped(self):
+        response = self.respond('gzip', INVENTORY_COMPRESSION_LEVEL=19)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+    @unittest.skipUnless(zstandard or brotli, "Neither zstandard nor brotli is installed")
+    def test_preferred_codec(self):
+        response = self.respond('gzip, br, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd' if zstandard else 'br')
+
+        self.assertEqual(self.respond('gzip, br;q=0, zstd;q=0')['Content-Encoding'], 'gzip')
+
+    def test_not_accepted(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0', '*;q=0', 'compress']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.respond(accept_encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.body)
+
+    def test_min_size(self):
+        response = self.respond('gzip', INVENTORY_COMPRESSION_MIN_SIZE=len(self.body) + 1)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+        self.assertEqual(response.content, self.body)
+
+        response = self.respond('gzip', INVENTORY_COMPRESSION_MIN_SIZE=len(self.body))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class GenerationTests(TestCase):
+    """
+    An evicted generation counter must not reuse an earlier value, and the
+    in-memory indexes must not outlive INVENTORY_INDEX_TTL when the writes
+    of another process never reach their counters.
+    """
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.generation = category_registry.generation = None
+
+    def test_evicted_counter(self):
+        seen = {getGeneration(Item)}
+        bumpGeneration(Item)
+        seen.add(getGeneration(Item))
+
+        cache.delete('inventory:generation:inventory.item')
+        self.assertGreater(getGeneration(Item), max(seen))
+
+        cache.delete('inventory:generation:inventory.item')
+        bumpGeneration(Item)
+        self.assertGreater(getGeneration(Item), max(seen))
+
+    def test_indexes_expire(self):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+        self.assertEqual(autocomplete_index.complete('pho', 10), [])
+        category_registry.get(name='Phones')
+
+        # Writes of another process, the generations of this one don't move
+        Item.objects.bulk_create([Item(
+            name='Phone 1', sku='PH-1', slug='ph-1', price=100, description='A phone',
+            category=category, sub_category=sub_category
+        )])
+        Category.objects.filter(pk=category.pk).update(name='Mobiles')
+
+        self.assertEqual(autocomplete_index.complete('pho', 10), [])
+        self.assertEqual(category_registry.get(name='Phones').name, 'Phones')
+
+        with self.settings(INVENTORY_INDEX_TTL=0):
+            self.assertEqual([entry['sku'] for entry in autocomplete_index.complete('pho', 10)], ['PH-1'])
+            with self.assertRaises(Category.DoesNotExist):
+                category_registry.get(name='Phones')
+
+    def test_local_cache_check(self):
+        self.assertEqual([error.id for error in checkSharedCache(None)], ['inventory.W001'])
+
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/inventory-tests-cache',
+        }}):
+            self.assertEqual(checkSharedCache(None), [])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "The full-text index is SQLite specific")
+class TextSearchTests(TestCase):
+    """
+    ?q= and ?name= match a word anywhere in the name, sku or description,
+    as name__icontains did, from the full-text index.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for name, sku, description in [
+            ('iPhone 14 Pro', 'IP-14-PRO', 'An Apple phone'),
+            ('Galaxy Tab S9', 'GT-S9', 'A tablet'),
+        ]:
+            Item.objects.create(
+                name=name, sku=sku, price=100, description=description,
+                category=category, sub_category=sub_category
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get('/inventory/items/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['fields']['name'] for item in response.json()['name']]
+
+    def test_substring(self):
+        self.assertEqual(self.search(name='Phone'), ['iPhone 14 Pro'])
+        self.assertEqual(self.search(q='phone'), ['iPhone 14 Pro'])
+        self.assertEqual(self.search(q='ablet'), ['Galaxy Tab S9'])
+
+    def test_prefix(self):
+        self.assertEqual(self.search(q='gala'), ['Galaxy Tab S9'])
+        self.assertEqual(self.search(q='iph 14'), ['iPhone 14 Pro'])
+        self.assertEqual(self.search(q='S9'), ['Galaxy Tab S9'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search(q='nokia'), [])
+        self.assertEqual(self.search(q='phone tab'), [])
+        self.assertEqual(self.search(q='15'), [])
+
+    def test_ranked(self):
+        self.assertEqual(self.search(q='phone', rank='1'), ['iPhone 14 Pro'])
+
+        items = self.client.get('/inventory/items/query/', {'q': 'phone'}).json()['items']
+        self.assertEqual([item['fields']['name'] for item in items], ['iPhone 14 Pro'])
+
+
+class StockTestCase(TestCase):
+    """
+    Base of the stock write tests: two items, PH-0 and PH-1 (slugs ph-0 and
+    ph-1), opened with 10 and 20 in stock.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones')
+        sub_category = SubCategory.objects.create(name='Smartphones', category=category)
+
+        for i, qty in enumerate([10, 20]):
+            item = Item.objects.create(
+                name=f'Phone {i}', sku=f'PH-{i}', price=100, description='A phone',
+                category=category, sub_category=sub_category
+            )
+            openStock(item, qty)
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, url, body):
+        return self.client.post(url, json.dumps(body), content_type='application/json')
+
+
+class StockAdjustTests(StockTestCase):
+    """
+    stocks/adjust/ applies a signed delta in one statement, or nothing.
+    """
+
+    def test_adjust(self):
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -3})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['qty_on_hand'], 7)
+
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': 5, 'reason': 'receipt'})
+        self.assertEqual(response.json()['qty_on_hand'], 12)
+        self.assertEqual(response.json()['movement']['fields']['reason'], 'receipt')
+
+    def test_conflict(self):
+        movements = StockMovement.objects.count()
+
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -11})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['qty_on_hand'], 10)
+        self.assertEqual(StockMovement.objects.count(), movements)
+
+        # Down to zero is allowed
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -10})
+        self.assertEqual(response.json()['qty_on_hand'], 0)
+
+    def test_without_returning(self):
+        # SQLite before 3.35 has no RETURNING, the stock is read after the insert
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -3})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertFalse(any('RETURNING' in query['sql'] for query in queries.captured_queries))
+            self.assertEqual(response.json()['qty_on_hand'], 7)
+            self.assertEqual(response.json()['movement']['pk'], StockMovement.objects.latest('pk').pk)
+
+            self.assertEqual(self.post('/inventory/stocks/adjust/ph-0/', {'delta': -8}).status_code, 409)
+
+    def test_invalid(self):
+        for delta in ['3', 1.5, True, None]:
+            with self.subTest(delta=delta):
+                response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': delta})
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.post('/inventory/stocks/adjust/nope/', {'delta': 1}).status_code, 404)
+        self.assertEqual(self.client.get('/inventory/stocks/adjust/ph-0/').status_code, 405)
+
+
+class StockReadTests(StockTestCase):
+    """
+    The quantities read after an adjust include its movement, before any
+    compaction, and so do the versions of the conditional GETs.
+    """
+
+    def test_quantity_after_adjust(self):
+        self.post('/inventory/stocks/adjust/ph-0/', {'delta': 5})
+
+        stock = self.client.get('/inventory/stocks/retrieve/ph-0/').json()['item_stock']
+        self.assertEqual(stock['fields']['qty_in_stock'], 15)
+
+        stocks = self.client.get('/inventory/stocks/?page=1&pagesize=10').json()['stocks']
+        self.assertEqual([stock['fields']['qty_in_stock'] for stock in stocks], [15, 20])
+
+        items = self.client.get('/inventory/items/?page=1&pagesize=10&expand=stock').json()['items']
+        self.assertEqual([item['fields']['stock']['qty_in_stock'] for item in items], [15, 20])
+
+    def test_filters_after_compaction(self):
+        self.post('/inventory/stocks/adjust/ph-0/', {'delta': 5})
+        self.post('/inventory/stocks/adjust/ph-1/', {'delta': -10})
+
+        # The filters read the snapshots, the reads don't compact
+        items = self.client.get('/inventory/items/query/?qty__gte=11&sort=qty').json()['items']
+        self.assertEqual([item['fields']['slug'] for item in items], ['ph-1'])
+        self.assertEqual(StockMovement.objects.filter(compacted=False).count(), 2)
+
+        call_command('compact_stock_movements', stdout=io.StringIO())
+
+        items = self.client.get('/inventory/items/query/?qty__gte=11&sort=qty').json()['items']
+        self.assertEqual([item['fields']['slug'] for item in items], ['ph-0'])
+
+        items = self.client.get('/inventory/items/search/?qty=10').json()['name']
+        self.assertEqual([item['fields']['slug'] for item in items], ['ph-1'])
+
+    def test_version_after_adjust(self):
+        for url in ['/inventory/stocks/retrieve/ph-0/', '/inventory/stocks/?page=1&pagesize=10']:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.post('/inventory/stocks/adjust/ph-0/', {'delta': 1})
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+
+class BulkStockUpdateTests(StockTestCase):
+    """
+    stocks/bulk-update/ reports a status per entry, the failing entries
+    don't prevent the others.
+    """
+
+    def test_statuses(self):
+        response = self.post('/inventory/stocks/bulk-update/', {'updates': [
+            {'sku': 'PH-0', 'qty': 4},
+            {'slug': 'ph-0', 'delta': 3},
+            {'slug': 'ph-1', 'delta': -21},
+            {'sku': 'NOPE', 'qty': 1},
+            {'sku': 'PH-1', 'qty': -1},
+            {'sku': 'PH-1', 'slug': 'ph-1', 'qty': 1},
+        ]})
+        self.assertEqual(response.status_code, 200, response.content)
+
+        data = response.json()
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['updated', 'updated', 'conflict', 'not_found', 'invalid', 'invalid']
+        )
+        self.assertEqual(data['results'][1]['qty_in_stock'], 7)
+        self.assertEqual(data['results'][2]['qty_in_stock'], 20)
+        self.assertEqual(data['counts'], {'updated': 2, 'conflict': 1, 'not_found': 1, 'invalid': 2})
+
+        self.assertEqual(Stock.objects.get(item__sku='PH-0').qty_in_stock, 7)
+        self.assertEqual(Stock.objects.get(item__sku='PH-1').qty_in_stock, 20)
+
+    def test_limits(self):
+        self.assertEqual(self.post('/inventory/stocks/bulk-update/', {'updates': {}}).status_code, 400)
+
+        with self.settings(INVENTORY_BULK_UPDATE_MAX=1):
+            response = self.post('/inventory/stocks/bulk-update/', {'updates': [
+                {'sku': 'PH-0', 'qty': 1}, {'sku': 'PH-1', 'qty': 1}
+            ]})
+            self.assertEqual(response.status_code, 400)
+
+    def test_reserved(self):
+        self.post('/inventory/stocks/reserve/ph-0/', {'qty': 8})
+
+        results = self.post('/inventory/stocks/bulk-update/', {'updates': [
+            {'sku': 'PH-0', 'delta': -3},
+            {'sku': 'PH-0', 'delta': -2},
+            {'sku': 'PH-0', 'qty': 5},
+            {'sku': 'PH-0', 'delta': 1},
+        ]}).json()['results']
+
+        # Deltas can't go below the reserved quantity, counts are applied
+        # and report the shortfall
+        self.assertEqual(
+            [(result['status'], result['qty_in_stock']) for result in results],
+            [('conflict', 10), ('updated', 8), ('updated', 5), ('updated', 6)]
+        )
+        self.assertEqual(results[0]['qty_reserved'], 8)
+        self.assertEqual(results[2]['qty_short'], 3)
+        self.assertEqual(results[3]['qty_short'], 2)
+
+
+class StockAsOfTests(StockTestCase):
+    """
+    stocks/as-of/ sums the ledger up to a time, starting from the last
+    checkpoint before it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(microsecond=0)
+
+    def at(self, days):
+        return self.now - datetime.timedelta(days=days)
+
+    def adjust(self, item_slug, delta, days):
+        self.post(f'/inventory/stocks/adjust/{item_slug}/', {'delta': delta})
+        StockMovement.objects.filter(pk=StockMovement.objects.latest('pk').pk).update(created_at=self.at(days))
+
+    def asOf(self, moment, **params):
+        response = self.client.get('/inventory/stocks/as-of/', {'t': moment.isoformat(), **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        checkpoint = data['checkpoint'] and parse_datetime(data['checkpoint'])
+        return {stock['item']['slug']: stock['qty'] for stock in data['stocks']}, checkpoint
+
+    def test_before_and_after_checkpoint(self):
+        StockMovement.objects.update(created_at=self.at(4))
+        self.adjust('ph-0', -3, 3)
+        self.assertEqual(takeCheckpoint(self.at(2)), 2)
+        self.adjust('ph-0', 5, 1)
+        self.adjust('ph-1', -2, 1)
+
+        self.assertEqual(self.asOf(self.at(5)), ({'ph-0': 0, 'ph-1': 0}, None))
+        self.assertEqual(self.asOf(self.at(3.5)), ({'ph-0': 10, 'ph-1': 20}, None))
+        self.assertEqual(self.asOf(self.at(2.5)), ({'ph-0': 7, 'ph-1': 20}, None))
+        self.assertEqual(self.asOf(self.at(2)), ({'ph-0': 7, 'ph-1': 20}, self.at(2)))
+        self.assertEqual(self.asOf(self.at(0)), ({'ph-0': 12, 'ph-1': 18}, self.at(2)))
+        self.assertEqual(self.asOf(self.at(0), item='ph-1'), ({'ph-1': 18}, self.at(2)))
+
+    def test_reads_from_checkpoint(self):
+        StockMovement.objects.update(created_at=self.at(4))
+        takeCheckpoint(self.at(2))
+
+        # The movements before the checkpoint aren't read anymore
+        StockMovement.objects.filter(created_at__lte=self.at(2)).delete()
+        self.assertEqual(self.asOf(self.at(1)), ({'ph-0': 10, 'ph-1': 20}, self.at(2)))
+
+        with self.assertRaises(ValueError):
+            takeCheckpoint(self.at(3))
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get('/inventory/stocks/as-of/', {'t': 'yesterday'}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/inventory/stocks/as-of/', {'t': '2024-06-30', 'item': 'nope'}).status_code, 404
+        )
+
+
+class StockReservationTests(StockTestCase):
+    """
+    A reservation holds a quantity until it is confirmed, released or
+    expires, and nothing can take the quantity on hand below the holds.
+    """
+
+    def reserve(self, item_slug, qty, **body):
+        return self.post(f'/inventory/stocks/reserve/{item_slug}/', {'qty': qty, **body})
+
+    def end(self, reservation_id, action):
+        return self.post(f'/inventory/reservations/{reservation_id}/{action}/', {})
+
+    def stock(self, item_slug):
+        return self.client.get(f'/inventory/stocks/retrieve/{item_slug}/').json()['item_stock']['fields']
+
+    def expire(self, reservation_id):
+        StockReservation.objects.filter(pk=reservation_id).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+    def test_oversell(self):
+        response = self.reserve('ph-0', 8)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['qty_available'], 2)
+
+        response = self.reserve('ph-0', 3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['qty_on_hand'], response.json()['qty_reserved']), (10, 8))
+
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -3})
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(self.reserve('ph-0', 2).json()['qty_available'], 0)
+        self.assertEqual(self.stock('ph-0')['qty_reserved'], 10)
+
+    def test_without_returning(self):
+        # SQLite before 3.35 has no RETURNING, the stock is read and updated
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.reserve('ph-0', 8)
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(response.json()['qty_available'], 2)
+            self.assertFalse(any('RETURNING' in query['sql'] for query in queries.captured_queries))
+
+            self.assertEqual(self.reserve('ph-0', 3).status_code, 409)
+
+    def test_expiry(self):
+        reservation_id = self.reserve('ph-0', 8).json()['reservation']['pk']
+        self.expire(reservation_id)
+
+        # The next reserve of the item expires it and takes its quantity
+        response = self.reserve('ph-0', 9)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['qty_available'], 1)
+        self.assertEqual(StockReservation.objects.get(pk=reservation_id).status, StockReservation.EXPIRED)
+
+    def test_confirm(self):
+        reservation_id = self.reserve('ph-0', 4).json()['reservation']['pk']
+
+        response = self.end(reservation_id, 'confirm')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['reservation']['fields']['status'], StockReservation.CONFIRMED)
+        self.assertEqual(
+            (self.stock('ph-0')['qty_in_stock'], self.stock('ph-0')['qty_reserved']), (6, 0)
+        )
+        self.assertEqual(StockMovement.objects.latest('pk').source, f'reservation {reservation_id}')
+
+        for action in ['confirm', 'release']:
+            with self.subTest(action=action):
+                response = self.end(reservation_id, action)
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['status'], StockReservation.CONFIRMED)
+
+    def test_release(self):
+        reservation_id = self.reserve('ph-0', 4).json()['reservation']['pk']
+
+        response = self.end(reservation_id, 'release')
+        self.assertEqual(response.json()['reservation']['fields']['status'], StockReservation.RELEASED)
+        self.assertEqual(
+            (self.stock('ph-0')['qty_in_stock'], self.stock('ph-0')['qty_reserved']), (10, 0)
+        )
+        self.assertEqual(self.end(reservation_id, 'confirm').status_code, 409)
+
+    def test_end_expired(self):
+        reservation_id = self.reserve('ph-0', 4).json()['reservation']['pk']
+        self.expire(reservation_id)
+
+        response = self.end(reservation_id, 'confirm')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], StockReservation.EXPIRED)
+
+        # The expiry is kept, and its quantity given back
+        self.assertEqual(StockReservation.objects.get(pk=reservation_id).status, StockReservation.EXPIRED)
+        self.assertEqual(
+            (self.stock('ph-0')['qty_in_stock'], self.stock('ph-0')['qty_reserved']), (10, 0)
+        )
+
+    def test_adjust_after_expiry(self):
+        reservation_id = self.reserve('ph-0', 8, ttl=1).json()['reservation']['pk']
+        etag = self.client.get('/inventory/stocks/retrieve/ph-0/')['ETag']
+        self.expire(reservation_id)
+
+        # Read before any sweep, the lapsed hold isn't reserved anymore
+        response = self.client.get('/inventory/stocks/retrieve/ph-0/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item_stock']['fields']['qty_reserved'], 0)
+
+        response = self.post('/inventory/stocks/adjust/ph-0/', {'delta': -5})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['item_stock']['fields']['qty_reserved'], 0)
+        self.assertEqual(StockReservation.objects.get(pk=reservation_id).status, StockReservation.EXPIRED)
+
+    def test_bulk_after_expiry(self):
+        self.expire(self.reserve('ph-0', 8).json()['reservation']['pk'])
+
+        results = self.post('/inventory/stocks/bulk-update/', {'updates': [
+            {'slug': 'ph-0', 'delta': -5}
+        ]}).json()['results']
+        self.assertEqual((results[0]['status'], results[0]['qty_in_stock']), ('updated', 5))
+        self.assertEqual(Stock.objects.get(item__slug='ph-0').qty_reserved, 0)
+
+    def test_invalid(self):
+        for body in [{'qty': 0}, {'qty': '2'}, {'qty': 1, 'ttl': 0}, {'qty': 1, 'reference': 3}]:
+            with self.subTest(body=body):
+                response = self.post('/inventory/stocks/reserve/ph-0/', body)
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.reserve('nope', 1).status_code, 404)
+        self.assertEqual(self.end(999, 'confirm').status_code, 404)
+        self.assertEqual(self.client.get('/inventory/reservations/1/release/').status_code, 405)
@@ -98,7 +98,7 @@
 # ]
 
 from django.urls import path
-from inventory.views import item_views, stock_views, category_views, subcategory_views, search_filter_views, supply_views, supplier_views
+from inventory.views import item_views, stock_views, category_views, subcategory_views, search_filter_views, supply_views, reservation_views
 
 urlpatterns = [
     # Items Enpoints.
@@ -197,12 +197,24 @@ urlpatterns = [
 
     # Search Endpoint
 
+    path(
+        'items/query/',
+        view=search_filter_views.queryItems,
+        name='query-items'  # Filter items with a filter expression
+    ),
+
     path(
         'items/search/',
         view=search_filter_views.searchItems,
         name='search-items'  # Search items
     ),
 
+    path(
+        'items/autocomplete/',
+        view=search_filter_views.autocompleteItems,
+        name='autocomplete-items'  # Complete item names and skus
+    ),
+
     # Category Endpoints
 
     path(
@@ -275,6 +287,50 @@ urlpatterns = [
         name='update-stock'  # Update stock by item slug
     ),
 
+    path(
+        'stocks/adjust/<str:item_slug>/',
+        view=stock_views.adjustStockQty,
+        name='adjust-stock'  # Add a signed delta to a stock by item slug
+    ),
+
+    path(
+        'stocks/movements/<str:item_slug>/',
+        view=stock_views.listStockMovements,
+        name='list-stock-movements'  # List or append the stock movements of an item
+    ),
+
+    path(
+        'stocks/as-of/',
+        view=stock_views.listStocksAsOf,
+        name='list-stocks-as-of'  # Quantities on hand at a point in time
+    ),
+
+    path(
+        'stocks/bulk-update/',
+        view=stock_views.bulkUpdateStocks,
+        name='bulk-update-stocks'  # Update many stocks by sku or slug
+    ),
+
+    # Reservation Endpoints
+
+    path(
+        'stocks/reserve/<str:item_slug>/',
+        view=reservation_views.reserveStockQty,
+        name='reserve-stock'  # Hold a quantity of an item for a while
+    ),
+
+    path(
+        'reservations/<int:reservation_id>/confirm/',
+        view=reservation_views.confirmReservation,
+        name='confirm-reservation'  # Take a held quantity out of the stock
+    ),
+
+    path(
+        'reservations/<int:reservation_id>/release/',
+        view=reservation_views.releaseReservation,
+        name='release-reservation'  # Give a held quantity back
+    ),
+
     # Supply Endpoints
 
     path(
@@ -1,18 +1,35 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
-from django.core.paginator import Paginator
+from django.db.models import Count, Max
 from inventory.models import Category
+from inventory.myutils import conditionalGet, cursorPaginate, paginateQueryset, serializeQueryset
+from inventory.signals import getGeneration
 import json
 
 
 # Category views
 
+def categoriesVersion(request):
+    """
+    Version of the category list: COUNT(*) and MAX(pk) of the categories and
+    their generation counter, categories have no timestamp to send as
+    Last-Modified.
+    """
+    probe = Category.objects.aggregate(count=Count('pk'), last_pk=Max('pk'))
+
+    version = (probe['count'], probe['last_pk'], getGeneration(Category))
+    return version, None
+
+
 @csrf_exempt
+@conditionalGet(categoriesVersion)
 def listCategories(request):
     """
     Retrieves a list of all categories in the inventory.
 
+    Pass ?cursor= (empty for the first page) instead of ?page= to walk the
+    list with keyset pagination.
+
     Returns:
         JsonResponse: A JSON response containing a list of categories
 
@@ -24,34 +41,60 @@ def listCategories(request):
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
+        cursor = request.GET.get('cursor', None)
 
         page = int(page)
         pagesize = int(pagesize)
 
+        if cursor is not None:
+            if pagesize <= 0:
+                return JsonResponse(
+                    {"error": "Invalid pagesize."},
+                    status=400
+                )
+
+            page_queryset, next_cursor, prev_cursor = cursorPaginate(
+                categories_queryset, cursor, pagesize
+            )
+
+            return JsonResponse(
+                {
+                    "message": "Successfully retrieved all categories",
+                    "pagesize": pagesize,
+                    "next_cursor": next_cursor,
+                    "prev_cursor": prev_cursor,
+                    "categories": serializeQueryset(page_queryset)
+                },
+                status=200
+            )
+
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."},
                 status=400
             )
 
-        paginator = Paginator(categories_queryset, pagesize)
-        page_object = paginator.get_page(page)
-
-        categories_list = json.loads(
-            serialize('json', page_object.object_list)
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, categories_queryset, page, pagesize
         )
 
+        categories_list = serializeQueryset(page_queryset)
+
         return JsonResponse(
             {
                 "message": f"Successfully retrieved all categories",
                 "page": page,
                 "pagesize": pagesize,
-                "total_pages": paginator.num_pages,
-                "total_results": paginator.count,
+                "total_pages": total_pages,
+                "total_results": total_results,
                 "categories": categories_list
             },
             status=200
         )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -74,9 +117,7 @@ def retrieveCategory(request, category_slug):
     """
     try:
         category_retrieved = Category.objects.get(slug=category_slug)
-        category_retrieved = json.loads(
-            serialize('json', [category_retrieved])
-        )[0]
+        category_retrieved = serializeQueryset([category_retrieved])[0]
 
         return JsonResponse(
             {
@@ -125,9 +166,7 @@ def updateCategory(request, category_slug):
         category.name = category_name
         category.save()
 
-        category_updated = json.loads(
-            serialize('json', [category])
-        )[0]
+        category_updated = serializeQueryset([category])[0]
 
         return JsonResponse(
             {
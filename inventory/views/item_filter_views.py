@@ -1,14 +1,18 @@
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
-from django.core.paginator import Paginator
 from inventory.models import Item, Category, SubCategory, Stock
-from inventory.myutils import populateRelationalFields
-import json
+from inventory.myutils import cachedResponse, paginateQueryset, parseExpand, parseFieldset, populateRelationalFields, serializeQueryset
+from inventory.indexes import category_registry, sub_category_registry
+from inventory.columnar import paginateColumns
+from inventory.facets import computeFacets, parseFacets
+from inventory.query import compileQuery
+from inventory.search import filterByText, serializeFuzzyItems, serializeRankedItems
 
 
 # Item-Filter Views.
 
+@cachedResponse
 def listItemsByCategory(request, category_slug):
     """
     List all items filtered by category.
@@ -25,29 +29,28 @@ def listItemsByCategory(request, category_slug):
         Exception: If any exception occurs
     """
     try:
-        category = Category.objects.get(slug=category_slug)
-        category_related_items = category.item_set.all().order_by('category')
+        category = category_registry.get(slug=category_slug)
+        category_related_items = Item.objects.filter(category=category.id).order_by('category')
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(category_related_items, pagesize)
-        page_object = paginator.get_page(page)
-
-        category_related_items = json.loads(
-            serialize(
-                'json', page_object.object_list
-            )
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, category_related_items, page, pagesize
         )
 
+        category_related_items = serializeQueryset(page_queryset, fields, expand=expand)
+
         populateRelationalFields(category_related_items, [
             'category', 'sub_category'], [Category, SubCategory]
         )
@@ -57,8 +60,8 @@ def listItemsByCategory(request, category_slug):
                 "message": f"Successfully retrieved all items of category {category}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "items": category_related_items
             },
             status=200
@@ -75,6 +78,7 @@ def listItemsByCategory(request, category_slug):
         )
 
 
+@cachedResponse
 def listItemsBySubCategory(request, sub_category_slug):
     """
     List all items filtered by sub-category.
@@ -91,29 +95,28 @@ def listItemsBySubCategory(request, sub_category_slug):
         Exception: If any exception occurs
     """
     try:
-        sub_category = SubCategory.objects.get(slug=sub_category_slug)
-        sub_category_related_items = sub_category.item_set.all().order_by('sub_category')
+        sub_category = sub_category_registry.get(slug=sub_category_slug)
+        sub_category_related_items = Item.objects.filter(sub_category=sub_category.id).order_by('sub_category')
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(sub_category_related_items, pagesize)
-        page_object = paginator.get_page(page)
-
-        sub_category_related_items = json.loads(
-            serialize(
-                'json', page_object.object_list
-            )
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, sub_category_related_items, page, pagesize
         )
 
+        sub_category_related_items = serializeQueryset(page_queryset, fields, expand=expand)
+
         populateRelationalFields(sub_category_related_items, [
             'category', 'sub_category'], [Category, SubCategory]
         )
@@ -123,8 +126,8 @@ def listItemsBySubCategory(request, sub_category_slug):
                 "message": f"Successfully retrieved all items of sub-category {sub_category}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "items": sub_category_related_items
             },
             status=200
@@ -137,6 +140,7 @@ def listItemsBySubCategory(request, sub_category_slug):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsByMinPrice(request, min_price):
     """
     Retrieves a list of items from the inventory filtered by min price.
@@ -151,25 +155,31 @@ def listItemsByMinPrice(request, min_price):
         Exception: If there is an error with the database query
     """
     try:
-        min_price_related_items = Item.objects.filter(price__gte=min_price).order_by('price')
+        min_price_related_items = compileQuery(Item, {'price__gte': min_price, 'sort': 'price'})
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(min_price_related_items, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Item, {'price': (min_price, None)}, 'price', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, min_price_related_items, page, pagesize
+            )
 
-        min_price_related_items = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        min_price_related_items = serializeQueryset(page_queryset, fields, expand=expand)
 
         populateRelationalFields(min_price_related_items, [
             'category', 'sub_category'], [Category, SubCategory]
@@ -180,8 +190,8 @@ def listItemsByMinPrice(request, min_price):
                 "message": f"Successfully retrieved all items of max price {min_price}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "items": min_price_related_items
             },
             status=200
@@ -190,6 +200,7 @@ def listItemsByMinPrice(request, min_price):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsByMaxPrice(request, max_price):
     """
     Retrieves a list of items from the inventory filtered by max price.
@@ -204,25 +215,31 @@ def listItemsByMaxPrice(request, max_price):
         Exception: If there is an error with the database query
     """
     try:
-        max_price_related_items = Item.objects.filter(price__lte=max_price).order_by('price')
+        max_price_related_items = compileQuery(Item, {'price__lte': max_price, 'sort': 'price'})
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(max_price_related_items, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Item, {'price': (None, max_price)}, 'price', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, max_price_related_items, page, pagesize
+            )
 
-        max_price_related_items = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        max_price_related_items = serializeQueryset(page_queryset, fields, expand=expand)
 
         populateRelationalFields(max_price_related_items, [
             'category', 'sub_category'], [Category, SubCategory]
@@ -233,8 +250,8 @@ def listItemsByMaxPrice(request, max_price):
                 "message": f"Successfully retrieved all items of max price {max_price}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "items": max_price_related_items
             },
             status=200
@@ -244,30 +261,36 @@ def listItemsByMaxPrice(request, max_price):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsFromMinToMaxPrice(request, min_price, max_price):
     try:
-        items_from_min_to_max_price = Item.objects.filter(
-            price__gte=min_price,
-            price__lte=max_price
-        ).order_by('price')  # Order filtered items by price
+        items_from_min_to_max_price = compileQuery(
+            Item, {'price__gte': min_price, 'price__lte': max_price, 'sort': 'price'}
+        )
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(items_from_min_to_max_price, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Item, {'price': (min_price, max_price)}, 'price', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, items_from_min_to_max_price, page, pagesize
+            )
 
-        items_from_min_to_max_price = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        items_from_min_to_max_price = serializeQueryset(page_queryset, fields, expand=expand)
 
         populateRelationalFields(items_from_min_to_max_price, [
             'category', 'sub_category'], [Category, SubCategory]
@@ -278,8 +301,8 @@ def listItemsFromMinToMaxPrice(request, min_price, max_price):
                 "message": f"Successfully retrieved all items between price {min_price} and {max_price}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "Items": items_from_min_to_max_price
             }
         )
@@ -288,30 +311,36 @@ def listItemsFromMinToMaxPrice(request, min_price, max_price):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsFromMaxToMinPrice(request, max_price, min_price):
     try:
-        items_from_max_to_min_price = Item.objects.filter(
-            price__lte=max_price,
-            price__gte=min_price
-        ).order_by('-price')
+        items_from_max_to_min_price = compileQuery(
+            Item, {'price__lte': max_price, 'price__gte': min_price, 'sort': '-price'}
+        )
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(items_from_max_to_min_price, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Item, {'price': (min_price, max_price)}, '-price', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, items_from_max_to_min_price, page, pagesize
+            )
 
-        items_from_max_to_min_price = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        items_from_max_to_min_price = serializeQueryset(page_queryset, fields, expand=expand)
 
         populateRelationalFields(items_from_max_to_min_price, [
             'category', 'sub_category'], [Category, SubCategory]
@@ -322,8 +351,8 @@ def listItemsFromMaxToMinPrice(request, max_price, min_price):
                 "message": f"Successfully retrieved all items between price {max_price} and {min_price}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "Items": items_from_max_to_min_price
             }
         )
@@ -333,12 +362,22 @@ def listItemsFromMaxToMinPrice(request, max_price, min_price):
 
 
 @csrf_exempt
+@cachedResponse
 def searchItems(request):
     """
-    Retrieves an item from the inventory by name.
+    Retrieves items from the inventory by text, combined with the other filters.
+
+    The text is searched in the name, sku and description of the items
+    through the full-text index (see inventory.search).
 
     Args:
-        name (str): The name to filter the items by
+        q (str): The text to search the items for, ?name= is kept as an alias
+        rank (str): Pass 1 to get the best ?limit= results ordered by BM25
+            relevance, each with its score, highlights and snippet
+        fuzzy (str): Pass 1 to get the ?limit= items whose name or sku are
+            the most similar to the text, typos included, with their score
+        facets (str): Pass 1, or some of category,sub_category,price,stock,
+            to also get the number of matching items per facet
 
     Returns:
         JsonResponse: A JSON response containing the item
@@ -351,15 +390,16 @@ def searchItems(request):
         sub_category = request.GET.get('sub_category', '')
 
         if category != '':
-            category = Category.objects.get(name__iexact=category)
+            category = category_registry.get(name=category)
             category = category.id
 
         if sub_category != '':
-            sub_category = SubCategory.objects.get(name__iexact=sub_category)
+            sub_category = sub_category_registry.get(name=sub_category)
             sub_category = sub_category.id
 
+        text = request.GET.get('q', '') or request.GET.get('name', '')
+
         queries = {
-            'name__icontains': request.GET.get('name', ''),
             'stock__qty_in_stock': request.GET.get('qty_in_stock', ''),
             'category': category,
             'sub_category': sub_category,
@@ -368,13 +408,66 @@ def searchItems(request):
         queries = {key: value for key, value in queries.items() if value != ''}
 
         items = Item.objects.filter(**queries)
-        items = json.loads(serialize('json', items))
+        facets = parseFacets(request)
+
+        ranked = request.GET.get('rank', '') in ['1', 'true']
+        fuzzy = request.GET.get('fuzzy', '') in ['1', 'true']
+
+        if text != '' and (ranked or fuzzy):
+            limit = request.GET.get('limit', settings.INVENTORY_SEARCH_LIMIT)
+
+            if not str(limit).isdigit() or not 0 < int(limit) <= settings.INVENTORY_SEARCH_MAX_LIMIT:
+                return JsonResponse(
+                    {"error": f"Invalid limit, use 1 to {settings.INVENTORY_SEARCH_MAX_LIMIT}."}, status=400
+                )
+
+            if fuzzy:
+                found_items = serializeFuzzyItems(
+                    items, text, int(limit),
+                    parseFieldset(request, Item), parseExpand(request, Item)
+                )
+            else:
+                found_items = serializeRankedItems(
+                    items, text, int(limit),
+                    parseFieldset(request, Item), parseExpand(request, Item)
+                )
+
+            if found_items is not None:
+                populateRelationalFields(found_items, ['category', 'sub_category'], [
+                    Category, SubCategory]
+                )
+
+                response = {"name": found_items}
+
+                if facets:
+                    # The fuzzy matches aren't a queryset, the ranked ones are
+                    # counted over all the full-text matches, not only the top ones.
+                    if fuzzy:
+                        faceted_items = items.filter(pk__in=[row['pk'] for row in found_items])
+                    else:
+                        faceted_items = filterByText(items, text)
+
+                    response["facets"] = computeFacets(faceted_items, facets)
+
+                return JsonResponse(response)
+
+        if text != '':
+            items = filterByText(items, text)
+
+        items_list = serializeQueryset(
+            items, parseFieldset(request, Item), expand=parseExpand(request, Item)
+        )
 
-        populateRelationalFields(items, ['category', 'sub_category'], [
+        populateRelationalFields(items_list, ['category', 'sub_category'], [
             Category, SubCategory]
         )
 
-        return JsonResponse({"name": items})
+        response = {"name": items_list}
+
+        if facets:
+            response["facets"] = computeFacets(items, facets)
+
+        return JsonResponse(response)
 
     except Category.DoesNotExist:
         return JsonResponse({"error": "Category does not exist"}, status=404)
@@ -1,18 +1,80 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
-from django.core.paginator import Paginator
-from inventory.models import Item, Category, SubCategory, Stock
-from inventory.myutils import populateRelationalFields
+from django.db.models import Count, Max
+from inventory.models import Item, Category, SubCategory, Stock, StockMovement
+from inventory.myutils import conditionalGet, cursorPaginate, paginateQueryset, parseExpand, parseFieldset, populateRelationalFields, serializeQueryset
+from inventory.signals import getGeneration
+from inventory.stocks import lastPending, openStock
 import json
 
 
 # # Item views
 
+def itemsVersion(request):
+    """
+    Version of the item list: MAX(updatedAt), COUNT(*) and MAX(pk) of the
+    items, plus the generations of the categories embedded in every row, and
+    the same probe over the stocks, with the last movement appended, when
+    they are expanded.
+
+    No Last-Modified is sent: deletes and category renames change the list
+    without moving any timestamp, only the ETag sees them.
+    """
+    probe = Item.objects.aggregate(
+        last_modified=Max('updatedAt'), count=Count('pk'), last_pk=Max('pk')
+    )
+
+    version = (
+        probe['last_modified'], probe['count'], probe['last_pk'],
+        getGeneration(Category), getGeneration(SubCategory)
+    )
+
+    if 'stock' in parseExpand(request, Item):
+        stock_probe = Stock.objects.aggregate(
+            last_modified=Max('last_updated'), count=Count('pk')
+        )
+        version += (
+            stock_probe['last_modified'], stock_probe['count'],
+            StockMovement.objects.aggregate(last_movement=Max('id'))['last_movement']
+        )
+
+    return version, None
+
+
+def itemVersion(request, item_slug):
+    """
+    Version of a single item: its updatedAt, the last_updated of its stock
+    and its last pending movement, plus the generations of the categories
+    embedded in it.
+
+    No Last-Modified is sent: a category rename changes the item without
+    moving any of its timestamps.
+    """
+    probe = Item.objects.filter(slug=item_slug).annotate(
+        last_movement=lastPending('id', 'pk')
+    ).values_list('updatedAt', 'stock__last_updated', 'last_movement').first()
+
+    if probe is None:
+        return None, None
+
+    last_modified, stock_last_updated, last_movement = probe
+
+    version = (
+        last_modified, stock_last_updated, last_movement,
+        getGeneration(Category), getGeneration(SubCategory)
+    )
+    return version, None
+
+
+@conditionalGet(itemsVersion)
 def listItems(request):
     """
     Return a list of all items in the database.
 
+    Pass ?cursor= (empty for the first page) instead of ?page= to walk the
+    list with keyset pagination, optionally sorted with ?sort=. Pass
+    ?expand=stock,category,sub_category to embed the related objects.
+
     Returns:
         JsonResponse: A list of all items in the database
     """
@@ -21,22 +83,54 @@ def listItems(request):
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
+        cursor = request.GET.get('cursor', None)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
+
+        if cursor is not None:
+            sort_key = request.GET.get('sort', 'pk')
+
+            if pagesize <= 0 or sort_key.lstrip('-') not in ['pk', 'name', 'price', 'updatedAt']:
+                return JsonResponse(
+                    {"error": "Invalid pagesize or sort."}, status=400
+                )
+
+            page_queryset, next_cursor, prev_cursor = cursorPaginate(
+                items_queryset, cursor, pagesize, sort_key
+            )
+
+            items_list = serializeQueryset(page_queryset, fields, expand=expand)
+
+            populateRelationalFields(
+                items_list, ['category', 'sub_category'],
+                [Category, SubCategory]
+            )
+
+            return JsonResponse(
+                {
+                    "message": "Successfully retrieved all items",
+                    "pagesize": pagesize,
+                    "next_cursor": next_cursor,
+                    "prev_cursor": prev_cursor,
+                    "items": items_list
+                },
+                status=200
+            )
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(items_queryset, pagesize)
-        page_object = paginator.get_page(page)
-
-        items_list = json.loads(
-            serialize('json', page_object.object_list)
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, items_queryset, page, pagesize
         )
 
+        items_list = serializeQueryset(page_queryset, fields, expand=expand)
+
         populateRelationalFields(
             items_list, ['category', 'sub_category'],
             [Category, SubCategory]
@@ -47,23 +141,32 @@ def listItems(request):
                 "message": "Successfully retrieved all items",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "items": items_list
             },
             status=200
         )
 
+    except ValueError as e:
+        return JsonResponse(
+            {"error": str(e)}, status=400
+        )
+
     except Exception as e:
         return JsonResponse(
             {"error": str(e)}, status=500
         )
 
 
+@conditionalGet(itemVersion)
 def retrieveItem(request, item_slug):
     """
     Retrieve a specific item by slug.
 
+    Pass ?expand=stock,category,sub_category to embed the related objects,
+    read with the item in a single query.
+
     Args:
         request: The request object
         item_slug: The slug of the item to retrieve
@@ -76,10 +179,16 @@ def retrieveItem(request, item_slug):
         Exception: If any other exception occurs
     """
     try:
-        item_retrieved = Item.objects.get(slug=item_slug)
-        item_retrieved = json.loads(
-            serialize('json', [item_retrieved])
-        )[0]
+        fields = parseFieldset(request, Item)
+        expand = parseExpand(request, Item)
+
+        items_retrieved = serializeQueryset(
+            Item.objects.filter(slug=item_slug), fields, expand=expand
+        )
+        if not items_retrieved:
+            raise Item.DoesNotExist
+
+        item_retrieved = items_retrieved[0]
 
         populateRelationalFields(
             item_retrieved, ['category', 'sub_category'],
@@ -149,13 +258,9 @@ def createItem(request):
                 sub_category=sub_category,
             )
 
-            Stock.objects.create(
-                item=item, qty_in_stock=qty_in_stock
-            )
+            openStock(item, qty_in_stock)
 
-            item_created = json.loads(
-                serialize('json', [item])
-            )[0]
+            item_created = serializeQueryset([item])[0]
 
             populateRelationalFields(
                 item_created, ['category', 'sub_category'],
@@ -215,9 +320,7 @@ def updateItem(request, item_slug):
 
             item.save()
 
-            item_updated = json.loads(
-                serialize('json', [item])
-            )[0]
+            item_updated = serializeQueryset([item])[0]
 
             populateRelationalFields(
                 item_updated, ['category', 'sub_category'],
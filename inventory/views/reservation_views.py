@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from inventory.models import Stock, StockReservation
+from inventory.myutils import serializeQueryset
+from inventory.reservations import ReservationConflict, endReservation, reserveStock
+from inventory.stocks import StockConflict
+import json
+
+
+@csrf_exempt
+def reserveStockQty(request, item_slug):
+    """
+    Holds a quantity of an item for a while, e.g. {"qty": 2, "ttl": 600,
+    "reference": "cart 42"}. The ttl, in seconds, defaults to
+    INVENTORY_RESERVATION_TTL.
+
+    The hold is taken with a single conditional UPDATE of the reserved
+    quantity of the stock, so concurrent reservations never oversell.
+
+    Args:
+        item-slug (str): The slug of the item to reserve
+
+    Returns:
+        JsonResponse: A JSON response containing the reservation and the
+        quantity still available
+
+    Raises:
+        Stock.DoesNotExist: If the item doesn't exist or has no stock
+        StockConflict: If less than qty is available
+        Exception: If there is an error with the database query
+    """
+    try:
+        if request.method != 'POST':
+            return JsonResponse(
+                {"error": f"Request method {request.method} not allowed, use POST"}, status=405
+            )
+
+        data = json.loads(request.body)
+        qty = data.get('qty')
+        ttl = data.get('ttl', settings.INVENTORY_RESERVATION_TTL)
+        reference = data.get('reference', '')
+
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+            return JsonResponse(
+                {"error": "qty must be a positive integer."}, status=400
+            )
+
+        if (
+            not isinstance(ttl, int) or isinstance(ttl, bool)
+            or not 1 <= ttl <= settings.INVENTORY_RESERVATION_MAX_TTL
+        ):
+            return JsonResponse(
+                {"error": f"ttl must be an integer between 1 and {settings.INVENTORY_RESERVATION_MAX_TTL}."}, status=400
+            )
+
+        if not isinstance(reference, str):
+            return JsonResponse(
+                {"error": "reference must be a string."}, status=400
+            )
+
+        reservation, qty_available = reserveStock(item_slug, qty, ttl, reference)
+
+        return JsonResponse(
+            {
+                "message": f"Successfully reserved {qty} of the item with slug {item_slug}",
+                "reservation": serializeQueryset([reservation])[0],
+                "qty_available": qty_available
+            },
+            status=201
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Stock.DoesNotExist:
+        return JsonResponse({"error": f"Stock of the item with slug {item_slug} Doesn't Exists"}, status=404)
+
+    except StockConflict as e:
+        return JsonResponse(
+            {
+                "error": f"Insufficient stock: {e.qty_on_hand - e.qty_reserved} available, cannot reserve {qty}.",
+                "qty_on_hand": e.qty_on_hand, "qty_reserved": e.qty_reserved, "qty": qty
+            },
+            status=409
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=500
+        )
+
+
+def endReservationView(request, reservation_id, status):
+    if request.method != 'POST':
+        return JsonResponse(
+            {"error": f"Request method {request.method} not allowed, use POST"}, status=405
+        )
+
+    try:
+        reservation = endReservation(reservation_id, status)
+
+        return JsonResponse(
+            {
+                "message": f"Successfully {status} the reservation {reservation_id}",
+                "reservation": serializeQueryset([reservation])[0]
+            },
+            status=200
+        )
+
+    except StockReservation.DoesNotExist:
+        return JsonResponse({"error": f"Reservation {reservation_id} Doesn't Exists"}, status=404)
+
+    except ReservationConflict as e:
+        return JsonResponse({"error": str(e), "status": e.status}, status=409)
+
+    except StockConflict as e:
+        return JsonResponse(
+            {"error": str(e), "qty_on_hand": e.qty_on_hand, "qty_reserved": e.qty_reserved, "delta": e.delta}, status=409
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=500
+        )
+
+
+@csrf_exempt
+def confirmReservation(request, reservation_id):
+    """
+    Confirms an active reservation: the held quantity is taken out of the
+    stock, as a sale movement of the ledger.
+
+    Args:
+        reservation-id (int): The id of the reservation
+
+    Returns:
+        JsonResponse: A JSON response containing the confirmed reservation
+
+    Raises:
+        StockReservation.DoesNotExist: If the reservation doesn't exist
+        ReservationConflict: If the reservation expired or already ended
+        Exception: If there is an error with the database query
+    """
+    return endReservationView(request, reservation_id, StockReservation.CONFIRMED)
+
+
+@csrf_exempt
+def releaseReservation(request, reservation_id):
+    """
+    Releases an active reservation: the held quantity is available again.
+
+    Args:
+        reservation-id (int): The id of the reservation
+
+    Returns:
+        JsonResponse: A JSON response containing the released reservation
+
+    Raises:
+        StockReservation.DoesNotExist: If the reservation doesn't exist
+        ReservationConflict: If the reservation expired or already ended
+        Exception: If there is an error with the database query
+    """
+    return endReservationView(request, reservation_id, StockReservation.RELEASED)
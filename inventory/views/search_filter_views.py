@@ -391,17 +391,23 @@
 #         return JsonResponse({"error": str(e)}, status=500)
 
 
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
 from inventory.models import Item, Category, SubCategory, Stock
+from inventory.columnar import paginateColumns
+from inventory.myutils import cachedResponse, paginateQueryset, parseExpand, parseFieldset, populateRelationalFields, serializeQueryset, streamQueryset, wantsStream
+from inventory.indexes import autocomplete_index, category_registry, sub_category_registry
 from inventory.myutils2 import poulateRelatedFields
-import json
+from inventory.facets import computeFacets, parseFacets
+from inventory.query import compileQuery
+from inventory.search import filterByText, serializeFuzzyItems, serializeRankedItems
 
 
 # Filter & Searching views
 
 @csrf_exempt
+@cachedResponse
 def listItemsByCategory(request, category_slug):
     """
     List all items filtered by category.
@@ -418,13 +424,16 @@ def listItemsByCategory(request, category_slug):
         Exception: If any exception occurs
     """
     try:
-        category = Category.objects.get(slug=category_slug)
+        category = category_registry.get(slug=category_slug)
+        category_items = Item.objects.filter(category=category.id)
 
-        category_related_items = json.loads(
-            serialize(
-                'json', category.item_set.all()
+        if wantsStream(request):
+            return streamQueryset(
+                request, category_items, f"Successfully retrieved all items of category {category}", 'items',
+                ['category', 'sub_category'], [Category, SubCategory], count_key='items_count'
             )
-        )
+
+        category_related_items = serializeQueryset(category_items)
 
         poulateRelatedFields(category_related_items, 'category', Category)
 
@@ -449,6 +458,7 @@ def listItemsByCategory(request, category_slug):
 
 
 @csrf_exempt
+@cachedResponse
 def listItemsBySubCategory(request, sub_category_slug):
     """
     List all items filtered by sub-category.
@@ -466,13 +476,16 @@ def listItemsBySubCategory(request, sub_category_slug):
     """
 
     try:
-        sub_category = SubCategory.objects.get(slug=sub_category_slug)
+        sub_category = sub_category_registry.get(slug=sub_category_slug)
+        sub_category_items = Item.objects.filter(sub_category=sub_category.id)
 
-        sub_category_related_items = json.loads(
-            serialize(
-                'json', sub_category.item_set.all()
+        if wantsStream(request):
+            return streamQueryset(
+                request, sub_category_items, f"Successfully retrieved all items of sub-category {sub_category}", 'items',
+                ['category', 'sub_category'], [Category, SubCategory], count_key='items_count'
             )
-        )
+
+        sub_category_related_items = serializeQueryset(sub_category_items)
 
         poulateRelatedFields(sub_category_related_items, 'category', Category)
 
@@ -492,7 +505,203 @@ def listItemsBySubCategory(request, sub_category_slug):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+def wantsPagedRange(request):
+    """
+    Check whether a price or quantity route is asked for a page of its
+    range, e.g. ?page=2&pagesize=20. Streamed (?stream=1) requests always
+    get every row.
+    """
+    return 'page' in request.GET and not wantsStream(request)
+
+
+def respondWithRangePage(request, queryset, ranges, sort, message, list_key, count_key):
+    """
+    Send a page of the rows of a price or quantity route.
+
+    The page is cut from the in-memory columns (inventory.columnar) when
+    INVENTORY_COLUMNAR_ENGINE is set, from the sorted query otherwise. The
+    rows keep the keys of the unpaged response, with the page and totals
+    added, and ?pagesize= defaults to INVENTORY_RANGE_PAGESIZE.
+
+    Args:
+        request: The request object
+        queryset: The QuerySet of the route, sorted on sort
+        ranges: The range of the route, field -> (minimum, maximum), see ColumnTable.select
+        sort: The column the rows are sorted on, '-' prefixed for descending
+        message: The message of the response
+        list_key: The key of the rows in the response
+        count_key: The key of the number of rows in the response
+
+    Returns:
+        JsonResponse: The page of rows
+
+    Raises:
+        ValueError: If page or pagesize isn't an integer
+    """
+    model = queryset.model
+
+    page = int(request.GET.get('page', 0))
+    pagesize = int(request.GET.get('pagesize', settings.INVENTORY_RANGE_PAGESIZE))
+
+    if page <= 0 or pagesize <= 0:
+        return JsonResponse(
+            {"error": "Invalid page or pagesize."}, status=400
+        )
+
+    if settings.INVENTORY_COLUMNAR_ENGINE:
+        page_queryset, total_pages, total_results = paginateColumns(
+            model, ranges, sort, page, pagesize
+        )
+    else:
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, queryset, page, pagesize
+        )
+
+    if model is Item:
+        related_fields, related_models = ['category', 'sub_category'], [Category, SubCategory]
+    else:
+        related_fields, related_models = ['item'], [Item]
+
+    rows = serializeQueryset(
+        page_queryset, parseFieldset(request, model), expand=parseExpand(request, model)
+    )
+
+    populateRelationalFields(rows, related_fields, related_models)
+
+    return JsonResponse(
+        {
+            "message": message,
+            "page": page,
+            "pagesize": pagesize,
+            "total_pages": total_pages,
+            "total_results": total_results,
+            count_key: len(rows),
+            list_key: rows
+        },
+        status=200
+    )
+
+
+# The parameters the fixed price and quantity routes forward to compileQuery
+# besides their own bounds: the pagination and format ones. Any other
+# parameter, a cache buster like ?_= included, is ignored as it was before
+# the routes became aliases of items/query/
+ALIAS_PARAMS = ['fields', 'expand', 'stream', 'page', 'pagesize', 'count', 'cursor', 'limit']
+
+
+def compileAliasQuery(request, model, bounds):
+    """
+    Compile the query of a fixed price or quantity route.
+
+    Args:
+        request: The request object
+        model: Item or Stock
+        bounds: The filter expression of the route, its range and sort
+
+    Returns:
+        QuerySet: The rows of the route
+    """
+    params = {param: value for param, value in request.GET.items() if param in ALIAS_PARAMS}
+    return compileQuery(model, {**params, **bounds})
+
+
+def respondWithQuery(request, queryset, message, list_key, count_key):
+    """
+    Send the rows of a compiled filter query, buffered or streamed.
+
+    Used by items/query/ and by the fixed price and quantity routes, which
+    are aliases of it keeping their own message and keys.
+
+    Args:
+        request: The request object
+        queryset: The QuerySet of Item or Stock returned by compileQuery
+        message: The message of the response
+        list_key: The key of the rows in the response
+        count_key: The key of the number of rows in the response
+
+    Returns:
+        JsonResponse: The rows, or a StreamingHttpResponse with ?stream=1
+    """
+    model = queryset.model
+
+    if model is Item:
+        related_fields, related_models = ['category', 'sub_category'], [Category, SubCategory]
+    else:
+        related_fields, related_models = ['item'], [Item]
+
+    if wantsStream(request):
+        return streamQueryset(
+            request, queryset, message, list_key,
+            related_fields, related_models, count_key=count_key
+        )
+
+    rows = serializeQueryset(
+        queryset, parseFieldset(request, model), expand=parseExpand(request, model)
+    )
+
+    populateRelationalFields(rows, related_fields, related_models)
+
+    return JsonResponse(
+        {
+            "message": message,
+            count_key: len(rows),
+            list_key: rows
+        },
+        status=200
+    )
+
+
 @csrf_exempt
+@cachedResponse
+def queryItems(request):
+    """
+    Retrieves the items (or stocks, with ?model=stock) matching a filter expression.
+
+    Every parameter other than the reserved ones is a filter,
+    <field>[__<operator>]=<value> with the operators exact, gt, gte, lt, lte
+    and in (comma separated values), e.g.
+
+        ?price__gte=100&price__lte=300&category__in=phones,tablets&sort=-price
+
+    ?q= adds a text search and ?sort= takes comma separated sort keys. The
+    expression is compiled into a single query (see inventory.query).
+
+    Returns:
+        JsonResponse: A JSON response containing the matching items or stocks
+
+    Raises:
+        ValueError: If the filter expression is invalid
+        Exception: If there is an error with the database query
+    """
+    try:
+        models = {'item': Item, 'stock': Stock}
+        model = models.get(request.GET.get('model', 'item'))
+
+        if model is None:
+            return JsonResponse(
+                {"error": "Invalid model, use item or stock."}, status=400
+            )
+
+        queryset = compileQuery(model, request.GET)
+
+        if model is Item:
+            return respondWithQuery(
+                request, queryset, "Successfully retrieved the matching items", 'items', 'items_count'
+            )
+
+        return respondWithQuery(
+            request, queryset, "Successfully retrieved the matching stocks", 'stocks', 'stocks_count'
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@csrf_exempt
+@cachedResponse
 def listItemsByMinPrice(request, min_price):
     """
     Retrieves a list of items from the inventory filtered by min price.
@@ -508,26 +717,27 @@ def listItemsByMinPrice(request, min_price):
     """
 
     try:
-        min_price_related_items = Item.objects.filter(price__gte=min_price)
-        min_price_related_items = json.loads(
-            serialize('json', min_price_related_items)
-        )
+        message = f"Successfully retrieved all items of max price {min_price}"
 
-        poulateRelatedFields(min_price_related_items, 'category', Category)
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Item, {'price__gte': min_price, 'sort': 'price'}),
+                {'price': (min_price, None)}, 'price', message, 'items', 'items_count'
+            )
+
+        items = compileAliasQuery(request, Item, {'price__gte': min_price})
+
+        return respondWithQuery(request, items, message, 'items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items of max price {min_price}",
-                "items_count": len(min_price_related_items),
-                "items": min_price_related_items
-            },
-            status=200
-        )
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @csrf_exempt
+@cachedResponse
 def listItemsByMaxPrice(request, max_price):
     """
     Retrieves a list of items from the inventory filtered by max price.
@@ -543,27 +753,27 @@ def listItemsByMaxPrice(request, max_price):
     """
 
     try:
-        max_price_related_items = Item.objects.filter(price__lte=max_price)
-        max_price_related_items = json.loads(
-            serialize('json', max_price_related_items)
-        )
+        message = f"Successfully retrieved all items of max price {max_price}"
 
-        poulateRelatedFields(max_price_related_items, 'category', Category)
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Item, {'price__lte': max_price, 'sort': 'price'}),
+                {'price': (None, max_price)}, 'price', message, 'items', 'items_count'
+            )
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items of max price {max_price}",
-                "items_count": len(max_price_related_items),
-                "items": max_price_related_items
-            },
-            status=200
-        )
+        items = compileAliasQuery(request, Item, {'price__lte': max_price})
+
+        return respondWithQuery(request, items, message, 'items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @csrf_exempt
+@cachedResponse
 def listStocksByMinQty(request, min_qty):
     """
     Retrieves a list of items from the inventory filtered by minimum quantity.
@@ -579,27 +789,27 @@ def listStocksByMinQty(request, min_qty):
     """
 
     try:
-        min_qty_stocks = Stock.objects.filter(qty_in_stock__gte=min_qty)
-        min_qty_stocks = json.loads(
-            serialize('json', min_qty_stocks)
-        )
+        message = f"Successfully retrieved all items of min quantity {min_qty}"
 
-        poulateRelatedFields(min_qty_stocks, 'item', Item)
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Stock, {'qty__gte': min_qty, 'sort': 'qty'}),
+                {'qty_in_stock': (min_qty, None)}, 'qty_in_stock', message, 'items', 'items_count'
+            )
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items of min quantity {min_qty}",
-                "items_count": len(min_qty_stocks),
-                "items": min_qty_stocks
-            },
-            status=200
-        )
+        stocks = compileAliasQuery(request, Stock, {'qty__gte': min_qty})
+
+        return respondWithQuery(request, stocks, message, 'items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @csrf_exempt
+@cachedResponse
 def listStocksByMaxQty(request, max_qty):
     """
     Retrieves a list of items from the inventory filtered by quantity range.
@@ -614,151 +824,130 @@ def listStocksByMaxQty(request, max_qty):
         Exception: If there is an error with the database query
     """
     try:
-        max_qty_stocks = Stock.objects.filter(qty_in_stock__lte=max_qty)
-        max_qty_stocks = json.loads(
-            serialize('json', max_qty_stocks)
-        )
+        message = f"Successfully retrieved all items of max quantity {max_qty}"
+
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Stock, {'qty__lte': max_qty, 'sort': 'qty'}),
+                {'qty_in_stock': (None, max_qty)}, 'qty_in_stock', message, 'items', 'items_count'
+            )
 
-        poulateRelatedFields(max_qty_stocks, 'item', Item)
+        stocks = compileAliasQuery(request, Stock, {'qty__lte': max_qty})
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items of max quantity {max_qty}",
-                "items_count": len(max_qty_stocks),
-                "items": max_qty_stocks
-            },
-            status=200
-        )
+        return respondWithQuery(request, stocks, message, 'items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsFromMinToMaxPrice(request, min_price, max_price):
     try:
-        items_from_min_to_max_price = Item.objects.filter(
-            price__gte=min_price,
-            price__lte=max_price
-        ).order_by('price')  # Order filtered items by price
-
-        items_from_min_to_max_price = json.loads(
-            serialize(
-                'json', items_from_min_to_max_price
+        message = f"Successfully retrieved all items between price {min_price} and {max_price}"
+
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Item, {'price__gte': min_price, 'price__lte': max_price, 'sort': 'price'}),
+                {'price': (min_price, max_price)}, 'price', message, 'Items', 'items_count'
             )
-        )
 
-        poulateRelatedFields(items_from_min_to_max_price, 'category', Category)
+        items = compileAliasQuery(request, Item, {'price__gte': min_price, 'price__lte': max_price, 'sort': 'price'})
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items between price {min_price} and {max_price}",
-                "items_count": len(items_from_min_to_max_price),
-                "Items": items_from_min_to_max_price
-            }
-        )
+        return respondWithQuery(request, items, message, 'Items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listItemsFromMaxToMinPrice(request, max_price, min_price):
     try:
-        items_from_max_to_min_price = Item.objects.filter(
-            price__lte=max_price,
-            price__gte=min_price
-        ).order_by('-price')
-
-        items_from_max_to_min_price = json.loads(
-            serialize(
-                'json', items_from_max_to_min_price
+        message = f"Successfully retrieved all items between price {max_price} and {min_price}"
+
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Item, {'price__lte': max_price, 'price__gte': min_price, 'sort': '-price'}),
+                {'price': (min_price, max_price)}, '-price', message, 'Items', 'items_count'
             )
-        )
 
-        poulateRelatedFields(items_from_max_to_min_price, 'category', Category)
+        items = compileAliasQuery(request, Item, {'price__lte': max_price, 'price__gte': min_price, 'sort': '-price'})
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all items between price {max_price} and {min_price}",
-                "items_count": len(items_from_max_to_min_price),
-                "Items": items_from_max_to_min_price
-            }
-        )
+        return respondWithQuery(request, items, message, 'Items', 'items_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listStocksFromMaxToMinQty(request, max_qty, min_qty):
     try:
-        stocks_from_min_to_max_qty = Stock.objects.filter(
-            qty_in_stock__lte=max_qty,
-            qty_in_stock__gte=min_qty,
-        ).order_by('-qty_in_stock')
-
-        stocks_from_min_to_max_qty = json.loads(
-            serialize(
-                'json', stocks_from_min_to_max_qty
+        message = f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}"
+
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Stock, {'qty__lte': max_qty, 'qty__gte': min_qty, 'sort': '-qty'}),
+                {'qty_in_stock': (min_qty, max_qty)}, '-qty_in_stock', message, 'Items', 'stocks'
             )
-        )
 
-        poulateRelatedFields(stocks_from_min_to_max_qty, 'item', Item)
+        stocks = compileAliasQuery(request, Stock, {'qty__lte': max_qty, 'qty__gte': min_qty, 'sort': '-qty'})
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}",
-                "stocks": len(stocks_from_min_to_max_qty),
-                "Items": stocks_from_min_to_max_qty
-            }
-        )
+        return respondWithQuery(request, stocks, message, 'Items', 'stocks')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
-        return JsonResponse(
-            {
-                "error": str(e)
-            },
-            status=500
-        )
+        return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listStocksFromMinToMaxQty(request, min_qty, max_qty):
     try:
-        stocks_from_min_to_max_qty = Stock.objects.filter(
-            qty_in_stock__gte=min_qty,
-            qty_in_stock__lte=max_qty
-        ).order_by('qty_in_stock')
-
-        stocks_from_min_to_max_qty = json.loads(
-            serialize(
-                'json', stocks_from_min_to_max_qty
+        message = f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}"
+
+        if wantsPagedRange(request):
+            return respondWithRangePage(
+                request, compileQuery(Stock, {'qty__gte': min_qty, 'qty__lte': max_qty, 'sort': 'qty'}),
+                {'qty_in_stock': (min_qty, max_qty)}, 'qty_in_stock', message, 'Items', 'stocks_count'
             )
-        )
 
-        poulateRelatedFields(stocks_from_min_to_max_qty, 'item', Item)
+        stocks = compileAliasQuery(request, Stock, {'qty__gte': min_qty, 'qty__lte': max_qty, 'sort': 'qty'})
 
-        return JsonResponse(
-            {
-                "message": f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}",
-                "stocks_count": len(stocks_from_min_to_max_qty),
-                "Items": stocks_from_min_to_max_qty
-            }
-        )
+        return respondWithQuery(request, stocks, message, 'Items', 'stocks_count')
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     except Exception as e:
-        return JsonResponse(
-            {
-                "error": str(e)
-            },
-            status=500
-        )
+        return JsonResponse({"error": str(e)}, status=500)
 
 
 @csrf_exempt
+@cachedResponse
 def searchItems(request):
     """
-    Retrieves an item from the inventory by name.
+    Retrieves items from the inventory by text, combined with the other filters.
+
+    The text is searched in the name, sku and description of the items
+    through the full-text index (see inventory.search).
 
     Args:
-        name (str): The name to filter the items by
+        q (str): The text to search the items for, ?name= is kept as an alias
+        rank (str): Pass 1 to get the best ?limit= results ordered by BM25
+            relevance, each with its score, highlights and snippet
+        fuzzy (str): Pass 1 to get the ?limit= items whose name or sku are
+            the most similar to the text, typos included, with their score
+        facets (str): Pass 1, or some of category,sub_category,price,stock,
+            to also get the number of matching items per facet
 
     Returns:
         JsonResponse: A JSON response containing the item
@@ -771,15 +960,16 @@ def searchItems(request):
         sub_category = request.GET.get('sub_category', '')
 
         if category != '':
-            category = Category.objects.get(name__iexact=category)
+            category = category_registry.get(name=category)
             category = category.id
 
         if sub_category != '':
-            sub_category = SubCategory.objects.get(name__iexact=sub_category)
+            sub_category = sub_category_registry.get(name=sub_category)
             sub_category = sub_category.id
 
+        text = request.GET.get('q', '') or request.GET.get('name', '')
+
         queries = {
-            'name__icontains': request.GET.get('name', ''),
             'stock__qty_in_stock': request.GET.get('qty', ''),
             'category': category,
             'sub_category': sub_category,
@@ -788,11 +978,60 @@ def searchItems(request):
         queries = {key: value for key, value in queries.items() if value != ''}
 
         items = Item.objects.filter(**queries)
-        items = json.loads(serialize('json', items))
+        facets = parseFacets(request)
+
+        ranked = request.GET.get('rank', '') in ['1', 'true']
+        fuzzy = request.GET.get('fuzzy', '') in ['1', 'true']
+
+        if text != '' and (ranked or fuzzy):
+            limit = request.GET.get('limit', settings.INVENTORY_SEARCH_LIMIT)
+
+            if not str(limit).isdigit() or not 0 < int(limit) <= settings.INVENTORY_SEARCH_MAX_LIMIT:
+                return JsonResponse(
+                    {"error": f"Invalid limit, use 1 to {settings.INVENTORY_SEARCH_MAX_LIMIT}."}, status=400
+                )
+
+            if fuzzy:
+                found_items = serializeFuzzyItems(items, text, int(limit))
+            else:
+                found_items = serializeRankedItems(items, text, int(limit))
 
-        poulateRelatedFields(items, 'category', Category)
+            if found_items is not None:
+                poulateRelatedFields(found_items, 'category', Category)
 
-        return JsonResponse({"name": items})
+                response = {"name": found_items}
+
+                if facets:
+                    # The fuzzy matches aren't a queryset, the ranked ones are
+                    # counted over all the full-text matches, not only the top ones.
+                    if fuzzy:
+                        faceted_items = items.filter(pk__in=[row['pk'] for row in found_items])
+                    else:
+                        faceted_items = filterByText(items, text)
+
+                    response["facets"] = computeFacets(faceted_items, facets)
+
+                return JsonResponse(response)
+
+        if text != '':
+            items = filterByText(items, text)
+
+        if wantsStream(request):
+            return streamQueryset(
+                request, items, None, 'name',
+                ['category', 'sub_category'], [Category, SubCategory]
+            )
+
+        items_list = serializeQueryset(items)
+
+        poulateRelatedFields(items_list, 'category', Category)
+
+        response = {"name": items_list}
+
+        if facets:
+            response["facets"] = computeFacets(items, facets)
+
+        return JsonResponse(response)
 
     except Category.DoesNotExist:
         return JsonResponse({"error": "Category does not exist"}, status=404)
@@ -801,4 +1040,35 @@ def searchItems(request):
         return JsonResponse({"error": "SubCategory does not exist"}, status=404)
 
     except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+def autocompleteItems(request):
+    """
+    Completes what has been typed so far into item names and skus.
+
+    Served from the in-memory autocomplete index (see inventory.indexes),
+    without any database query once the index is loaded.
+
+    Args:
+        q (str): The prefix typed so far
+        limit (int): The number of suggestions to return
+
+    Returns:
+        JsonResponse: A JSON response containing the suggestions
+    """
+    try:
+        prefix = request.GET.get('q', '')
+        limit = request.GET.get('limit', settings.INVENTORY_AUTOCOMPLETE_LIMIT)
+
+        if not str(limit).isdigit() or not 0 < int(limit) <= settings.INVENTORY_SEARCH_MAX_LIMIT:
+            return JsonResponse(
+                {"error": f"Invalid limit, use 1 to {settings.INVENTORY_SEARCH_MAX_LIMIT}."}, status=400
+            )
+
+        suggestions = autocomplete_index.complete(prefix, int(limit))
+
+        return JsonResponse({"q": prefix, "suggestions": suggestions})
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
@@ -1,17 +1,18 @@
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
-from django.core.paginator import Paginator
+from inventory.columnar import paginateColumns
 from inventory.models import Item, Stock
-from inventory.myutils import populateRelationalFields
-import json
+from inventory.myutils import cachedResponse, paginateQueryset, populateRelationalFields, serializeQueryset
+from inventory.query import compileQuery
 
 
 # Stock Filter views
 
+@cachedResponse
 def listStocksByMinQty(request, min_qty):
     try:
-        min_qty_stocks = Stock.objects.filter(qty_in_stock__gte=min_qty).order_by('qty_in_stock')
+        min_qty_stocks = compileQuery(Stock, {'qty__gte': min_qty, 'sort': 'qty'})
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
@@ -24,12 +25,16 @@ def listStocksByMinQty(request, min_qty):
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(min_qty_stocks, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Stock, {'qty_in_stock': (min_qty, None)}, 'qty_in_stock', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, min_qty_stocks, page, pagesize
+            )
 
-        min_qty_stocks = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        min_qty_stocks = serializeQueryset(page_queryset)
 
         populateRelationalFields(min_qty_stocks, ['item'], [Item])
 
@@ -38,8 +43,8 @@ def listStocksByMinQty(request, min_qty):
                 "message": f"Successfully retrieved all items of min quantity {min_qty}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "stocks": min_qty_stocks
             },
             status=200
@@ -49,9 +54,10 @@ def listStocksByMinQty(request, min_qty):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listStocksByMaxQty(request, max_qty):
     try:
-        max_qty_stocks = Stock.objects.filter(qty_in_stock__lte=max_qty).order_by('qty_in_stock')
+        max_qty_stocks = compileQuery(Stock, {'qty__lte': max_qty, 'sort': 'qty'})
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
@@ -64,12 +70,16 @@ def listStocksByMaxQty(request, max_qty):
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(max_qty_stocks, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Stock, {'qty_in_stock': (None, max_qty)}, 'qty_in_stock', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, max_qty_stocks, page, pagesize
+            )
 
-        max_qty_stocks = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        max_qty_stocks = serializeQueryset(page_queryset)
 
         populateRelationalFields(max_qty_stocks, ['item'], [Item])
 
@@ -78,8 +88,8 @@ def listStocksByMaxQty(request, max_qty):
                 "message": f"Successfully retrieved all items of max quantity {max_qty}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "stocks": max_qty_stocks
             },
             status=200
@@ -89,12 +99,12 @@ def listStocksByMaxQty(request, max_qty):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@cachedResponse
 def listStocksFromMaxToMinQty(request, max_qty, min_qty):
     try:
-        stocks_from_min_to_max_qty = Stock.objects.filter(
-            qty_in_stock__lte=max_qty,
-            qty_in_stock__gte=min_qty,
-        ).order_by('-qty_in_stock')
+        stocks_from_min_to_max_qty = compileQuery(
+            Stock, {'qty__lte': max_qty, 'qty__gte': min_qty, 'sort': '-qty'}
+        )
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
@@ -107,12 +117,16 @@ def listStocksFromMaxToMinQty(request, max_qty, min_qty):
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(stocks_from_min_to_max_qty, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Stock, {'qty_in_stock': (min_qty, max_qty)}, '-qty_in_stock', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, stocks_from_min_to_max_qty, page, pagesize
+            )
 
-        stocks_from_min_to_max_qty = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        stocks_from_min_to_max_qty = serializeQueryset(page_queryset)
 
         populateRelationalFields(stocks_from_min_to_max_qty, ['item'], [Item])
 
@@ -121,8 +135,8 @@ def listStocksFromMaxToMinQty(request, max_qty, min_qty):
                 "message": f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "stocks": stocks_from_min_to_max_qty
             }
         )
@@ -136,12 +150,12 @@ def listStocksFromMaxToMinQty(request, max_qty, min_qty):
         )
 
 
+@cachedResponse
 def listStocksFromMinToMaxQty(request, min_qty, max_qty):
     try:
-        stocks_from_min_to_max_qty = Stock.objects.filter(
-            qty_in_stock__gte=min_qty,
-            qty_in_stock__lte=max_qty
-        ).order_by('qty_in_stock')
+        stocks_from_min_to_max_qty = compileQuery(
+            Stock, {'qty__gte': min_qty, 'qty__lte': max_qty, 'sort': 'qty'}
+        )
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
@@ -154,12 +168,16 @@ def listStocksFromMinToMaxQty(request, min_qty, max_qty):
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(stocks_from_min_to_max_qty, pagesize)
-        page_object = paginator.get_page(page)
+        if settings.INVENTORY_COLUMNAR_ENGINE:
+            page_queryset, total_pages, total_results = paginateColumns(
+                Stock, {'qty_in_stock': (min_qty, max_qty)}, 'qty_in_stock', page, pagesize
+            )
+        else:
+            page_queryset, total_pages, total_results = paginateQueryset(
+                request, stocks_from_min_to_max_qty, page, pagesize
+            )
 
-        stocks_from_min_to_max_qty = json.loads(
-            serialize('json', page_object.object_list)
-        )
+        stocks_from_min_to_max_qty = serializeQueryset(page_queryset)
 
         populateRelationalFields(stocks_from_min_to_max_qty, ['item'], [Item])
 
@@ -168,8 +186,8 @@ def listStocksFromMinToMaxQty(request, min_qty, max_qty):
                 "message": f"Successfully retrieved all stocks between quantity {min_qty} and {max_qty}",
                 "page": page,
                 "pagesize": pagesize,
-                'total_pages': paginator.num_pages,
-                "total_results": paginator.count,
+                'total_pages': total_pages,
+                "total_results": total_results,
                 "stocks": stocks_from_min_to_max_qty
             }
         )
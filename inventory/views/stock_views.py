@@ -1,18 +1,83 @@
+from django.conf import settings
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
-from django.core.paginator import Paginator
-from inventory.models import Item, Stock
-from inventory.myutils import populateRelationalFields
+from django.db.models import Count, Max
+from inventory.models import Item, Stock, StockMovement, StockReservation
+from inventory.myutils import conditionalGet, cursorPaginate, paginateQueryset, parseExpand, parseFieldset, populateRelationalFields, serializeQueryset
+from inventory.reservations import lastLapsed
+from inventory.signals import getGeneration
+from inventory.stocks import StockConflict, appendMovement, applyStockUpdates, lastPending, quantitiesAsOf, withQtyOnHand
+import datetime
 import json
 
 
 # Stock views
 
+def stocksVersion(request):
+    """
+    Version of the stock list: MAX(last_updated), COUNT(*) and MAX(pk) of the
+    stocks, MAX(id) of the movements, whose pending ones are added to the
+    quantities, and the number of reservations past their expiry, taken
+    out of the reserved quantities, plus the generation of the items
+    embedded in every row.
+
+    No Last-Modified is sent: deletes and item renames change the list
+    without moving any stock timestamp, only the ETag sees them.
+    """
+    probe = Stock.objects.aggregate(
+        last_modified=Max('last_updated'), count=Count('pk'), last_pk=Max('pk')
+    )
+
+    version = (
+        probe['last_modified'], probe['count'], probe['last_pk'],
+        StockMovement.objects.aggregate(last_movement=Max('id'))['last_movement'],
+        StockReservation.objects.filter(
+            status=StockReservation.ACTIVE, expires_at__lte=timezone.now()
+        ).count(),
+        getGeneration(Item)
+    )
+    return version, None
+
+
+def stockVersion(request, item_slug):
+    """
+    Version of the stock of a single item: its last_updated, its last pending
+    movement, the expiry of its last reservation past its expiry and the
+    updatedAt of the item embedded in it.
+
+    Every change moves one of the timestamps (the created_at of an appended
+    movement, the expiry of a hold, the last_updated of a compaction or
+    reservation), so the latest of them is sent as Last-Modified.
+    """
+    probe = Stock.objects.filter(item__slug=item_slug).annotate(
+        last_movement=lastPending('id'), last_movement_at=lastPending('created_at'),
+        last_lapsed_at=lastLapsed()
+    ).values_list(
+        'last_updated', 'item__updatedAt', 'last_movement', 'last_movement_at', 'last_lapsed_at'
+    ).first()
+
+    if probe is None:
+        return None, None
+
+    last_updated, item_updated_at, _, last_movement_at, last_lapsed_at = probe
+
+    return probe, max(
+        timestamp for timestamp in [last_updated, item_updated_at, last_movement_at, last_lapsed_at]
+        if timestamp is not None
+    )
+
+
+@conditionalGet(stocksVersion)
 def listStocks(request):
     """
     Retrieves a list of all stocks in the inventory.
 
+    Pass ?cursor= (empty for the first page) instead of ?page= to walk the
+    list with keyset pagination. Pass ?expand=item to read the items with
+    the stocks, in the same query.
+
     Returns:
         JsonResponse: A JSON response containing a list of stocks
 
@@ -20,26 +85,53 @@ def listStocks(request):
         Exception: If there is an error with the database query
     """
     try:
-        stock_queryset = Stock.objects.all()
+        stock_queryset = Stock.objects.all().order_by('pk')
 
         page = request.GET.get('page', 0)
         pagesize = request.GET.get('pagesize', 0)
+        cursor = request.GET.get('cursor', None)
 
         page = int(page)
         pagesize = int(pagesize)
+        fields = parseFieldset(request, Stock)
+        expand = parseExpand(request, Stock)
+
+        if cursor is not None:
+            if pagesize <= 0:
+                return JsonResponse(
+                    {"error": "Invalid pagesize."}, status=400
+                )
+
+            page_queryset, next_cursor, prev_cursor = cursorPaginate(
+                stock_queryset, cursor, pagesize
+            )
+
+            stocks_list = serializeQueryset(page_queryset, fields, expand=expand)
+
+            populateRelationalFields(stocks_list, ['item'], [Item])
+
+            return JsonResponse(
+                {
+                    "message": "Successfully retrieved all stocks",
+                    "pagesize": pagesize,
+                    "next_cursor": next_cursor,
+                    "prev_cursor": prev_cursor,
+                    "stocks": stocks_list
+                },
+                status=200
+            )
 
         if page <= 0 or pagesize <= 0:
             return JsonResponse(
                 {"error": "Invalid page or pagesize."}, status=400
             )
 
-        paginator = Paginator(stock_queryset, pagesize)
-        page_object = paginator.get_page(page)
-
-        stocks_list = json.loads(
-            serialize('json', page_object.object_list)
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, stock_queryset, page, pagesize
         )
 
+        stocks_list = serializeQueryset(page_queryset, fields, expand=expand)
+
         populateRelationalFields(stocks_list, ['item'], [Item])
 
         return JsonResponse(
@@ -47,20 +139,28 @@ def listStocks(request):
                 "message": f"Successfully retrieved all stocks",
                 "page": page,
                 "pagesize": pagesize,
-                "total_pages": paginator.num_pages,
-                "total_results": paginator.count,
+                "total_pages": total_pages,
+                "total_results": total_results,
                 "stocks": stocks_list
             },
             status=200
         )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@conditionalGet(stockVersion)
 def retrieveStock(request, item_slug):
     """
     Retrieves a stock from the inventory by item-slug.
 
+    The stock is looked up through the item slug in a single query, which
+    also reads the item when ?expand=item is passed.
+
     Args:
         item-slug (str): The slug of the item whose stock to retrieve
 
@@ -72,12 +172,16 @@ def retrieveStock(request, item_slug):
         Exception: If any exception occurs
     """
     try:
-        item = Item.objects.get(slug=item_slug)
-        item_stock = item.stock
+        fields = parseFieldset(request, Stock)
+        expand = parseExpand(request, Stock)
 
-        stock_retrieved = json.loads(
-            serialize('json', [item_stock])
-        )[0]
+        stocks_retrieved = serializeQueryset(
+            Stock.objects.filter(item__slug=item_slug), fields, expand=expand
+        )
+        if not stocks_retrieved:
+            raise Item.DoesNotExist
+
+        stock_retrieved = stocks_retrieved[0]
 
         populateRelationalFields(stock_retrieved, ['item'], [Item])
 
@@ -101,6 +205,9 @@ def updateStock(request, item_slug):
     """
     Updates a stock from the inventory by item-slug.
 
+    The quantity is an absolute count: the pending movements of the item are
+    compacted first, and the difference is recorded in its ledger.
+
     Args:
         item-slug (str): The slug of the item whose stock to update
 
@@ -122,13 +229,17 @@ def updateStock(request, item_slug):
         data = json.loads(request.body)
         qty_in_stock = data.get('qty_in_stock', item_stock.qty_in_stock)
 
-        item_stock.qty_in_stock = qty_in_stock
-        item_stock.save()
-
-        stock_updated = json.loads(
-            serialize('json', [item_stock])
+        result = applyStockUpdates(
+            [{'slug': item_slug, 'qty': int(qty_in_stock)}], reason='count'
         )[0]
 
+        if result['status'] != 'updated':
+            return JsonResponse({"error": result.get('error', result['status'])}, status=400)
+
+        item_stock.refresh_from_db()
+
+        stock_updated = serializeQueryset([item_stock])[0]
+
         populateRelationalFields(stock_updated, ['item'], [Item])
 
         return JsonResponse(
@@ -145,6 +256,294 @@ def updateStock(request, item_slug):
         )
 
 
+@csrf_exempt
+def adjustStockQty(request, item_slug):
+    """
+    Adds a signed delta to the stock of an item, e.g. {"delta": -3}, with
+    an optional reason and source.
+
+    The delta is appended to the ledger of the item with a single
+    conditional INSERT, so concurrent adjustments never overwrite each
+    other, and a decrement that would take the quantity on hand below the
+    quantity reserved (inventory.reservations) is refused as a whole.
+
+    Args:
+        item-slug (str): The slug of the item whose stock to adjust
+
+    Returns:
+        JsonResponse: A JSON response containing the movement and the
+        adjusted stock, with its quantity on hand
+
+    Raises:
+        Stock.DoesNotExist: If the item doesn't exist or has no stock
+        StockConflict: If the stock would go below the reserved quantity
+        Exception: If there is an error with the database query
+    """
+    try:
+        if not request.method in ['POST', 'PATCH']:
+            return JsonResponse(
+                {"error": f"Request method {request.method} not allowed, use POST or PATCH"}, status=405
+            )
+
+        data = json.loads(request.body)
+        delta = data.get('delta')
+
+        if not isinstance(delta, int) or isinstance(delta, bool):
+            return JsonResponse(
+                {"error": "delta must be an integer."}, status=400
+            )
+
+        reason = data.get('reason', 'adjustment')
+        source = data.get('source', '')
+
+        if not isinstance(reason, str) or not reason or not isinstance(source, str):
+            return JsonResponse(
+                {"error": "reason and source must be strings."}, status=400
+            )
+
+        movement, stock = appendMovement(item_slug, delta, reason, source)
+
+        return JsonResponse(
+            {
+                "message": f"Successfully adjusted the stock of the item with slug {item_slug} by {delta}",
+                "movement": serializeQueryset([movement])[0],
+                "item_stock": serializeQueryset([stock])[0],
+                "qty_on_hand": stock.qty_on_hand
+            },
+            status=200
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Stock.DoesNotExist:
+        return JsonResponse({"error": f"Stock of the item with slug {item_slug} Doesn't Exists"}, status=404)
+
+    except StockConflict as e:
+        return JsonResponse(
+            {"error": str(e), "qty_on_hand": e.qty_on_hand, "qty_reserved": e.qty_reserved, "delta": e.delta}, status=409
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=500
+        )
+
+
+@csrf_exempt
+def listStockMovements(request, item_slug):
+    """
+    Retrieves the ledger of the stock of an item, the latest movements
+    first, with its quantity on hand and the snapshot of its compacted
+    movements. A POST appends a movement, see adjustStockQty.
+
+    Args:
+        item-slug (str): The slug of the item whose movements to retrieve
+
+    Returns:
+        JsonResponse: A JSON response containing a page of movements
+
+    Raises:
+        Stock.DoesNotExist: If the item doesn't exist or has no stock
+        Exception: If there is an error with the database query
+    """
+    if request.method == 'POST':
+        return adjustStockQty(request, item_slug)
+
+    try:
+        stock = withQtyOnHand(Stock.objects.filter(item__slug=item_slug)).first()
+        if stock is None:
+            raise Stock.DoesNotExist
+
+        page = request.GET.get('page', 0)
+        pagesize = request.GET.get('pagesize', 0)
+
+        page = int(page)
+        pagesize = int(pagesize)
+
+        if page <= 0 or pagesize <= 0:
+            return JsonResponse(
+                {"error": "Invalid page or pagesize."}, status=400
+            )
+
+        page_queryset, total_pages, total_results = paginateQueryset(
+            request, StockMovement.objects.filter(item=stock.item_id).order_by('-id'), page, pagesize
+        )
+
+        return JsonResponse(
+            {
+                "message": f"Successfully retrieved the movements of the item with slug {item_slug}",
+                "qty_snapshot": stock.qty_in_stock,
+                "qty_on_hand": stock.qty_on_hand,
+                "page": page,
+                "pagesize": pagesize,
+                "total_pages": total_pages,
+                "total_results": total_results,
+                "movements": serializeQueryset(page_queryset)
+            },
+            status=200
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Stock.DoesNotExist:
+        return JsonResponse({"error": f"Stock of the item with slug {item_slug} Doesn't Exists"}, status=404)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+def parseMoment(value):
+    """
+    Parse the ?t= of a point-in-time query: a datetime, or a date meaning
+    the end of that day, in the current timezone when naive.
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    day = parse_date(value)
+
+    if day is not None:
+        moment = datetime.datetime.combine(day, datetime.time.max)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid time {value}, use an ISO 8601 date or datetime.")
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+
+    return moment
+
+
+def listStocksAsOf(request):
+    """
+    Retrieves the quantities on hand at a point in time, ?t=2024-06-30 or
+    ?t=2024-06-30T18:00:00Z, of every item or of one with ?item=<slug>.
+
+    The quantities start from the last checkpoint before the time (see the
+    checkpoint_stocks command) and add the movements since.
+
+    Returns:
+        JsonResponse: A JSON response containing the quantity of every item
+
+    Raises:
+        ValueError: If the time is invalid
+        Item.DoesNotExist: If the item with ?item= doesn't exist
+        Exception: If there is an error with the database query
+    """
+    try:
+        moment = parseMoment(request.GET.get('t', ''))
+
+        items = Stock.objects.order_by('item')
+        item_slug = request.GET.get('item', None)
+
+        if item_slug is not None:
+            items = items.filter(item__slug=item_slug)
+
+        items = list(items.values_list('item', 'item__sku', 'item__slug'))
+
+        if item_slug is not None and not items:
+            raise Item.DoesNotExist
+
+        quantities, taken_at = quantitiesAsOf(
+            moment, [item_id for item_id, _, _ in items] if item_slug is not None else None
+        )
+
+        stocks_as_of = [
+            {
+                "item": {"id": item_id, "sku": sku, "slug": slug},
+                "qty": quantities.get(item_id, 0)
+            }
+            for item_id, sku, slug in items
+        ]
+
+        return JsonResponse(
+            {
+                "message": f"Successfully retrieved the stocks as of {moment.isoformat()}",
+                "as_of": moment,
+                "checkpoint": taken_at,
+                "stocks_count": len(stocks_as_of),
+                "stocks": stocks_as_of
+            },
+            status=200
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Item.DoesNotExist:
+        return JsonResponse({"error": f"Item with slug {item_slug} Doesn't Exists"}, status=404)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@csrf_exempt
+def bulkUpdateStocks(request):
+    """
+    Updates the stocks of many items in one transaction.
+
+    The body is {"updates": [...]}, every update naming the item by sku or
+    slug and giving either the new quantity or a signed delta, e.g.
+
+        {"updates": [{"sku": "PH-1", "qty": 40}, {"slug": "tablet", "delta": -2}]}
+
+    A delta taking a stock below its reserved quantity is a conflict. A qty
+    is a count and always applied, its result has a qty_short when the
+    count is below the reserved quantity.
+
+    Returns:
+        JsonResponse: A JSON response containing the result of every update,
+        in order, and the number of updates per status
+
+    Raises:
+        Exception: If there is an error with the database query
+    """
+    try:
+        if not request.method in ['POST', 'PATCH']:
+            return JsonResponse(
+                {"error": f"Request method {request.method} not allowed, use POST or PATCH"}, status=405
+            )
+
+        data = json.loads(request.body)
+        updates = data.get('updates') if isinstance(data, dict) else None
+
+        if not isinstance(updates, list):
+            return JsonResponse(
+                {"error": "updates must be a list."}, status=400
+            )
+
+        if len(updates) > settings.INVENTORY_BULK_UPDATE_MAX:
+            return JsonResponse(
+                {"error": f"At most {settings.INVENTORY_BULK_UPDATE_MAX} updates per request."}, status=400
+            )
+
+        results = applyStockUpdates(updates)
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+
+        return JsonResponse(
+            {
+                "message": f"Successfully applied {counts.get('updated', 0)} of {len(results)} stock updates",
+                "counts": counts,
+                "results": results
+            },
+            status=200
+        )
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=500
+        )
+
+
 # from django.http import JsonResponse
 # from django.views.decorators.csrf import csrf_exempt
 # from django.core.serializers import serialize
@@ -1,7 +1,7 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.serializers import serialize
 from inventory.models import Category, SubCategory
+from inventory.myutils import serializeQueryset, streamQueryset, wantsStream
 import json
 
 
@@ -207,9 +207,13 @@ def listSubCategories(request):
     try:
         sub_categories_queryset = SubCategory.objects.all()
 
-        sub_categories_list = json.loads(
-            serialize('json', sub_categories_queryset)
-        )
+        if wantsStream(request):
+            return streamQueryset(
+                request, sub_categories_queryset, "Successfully retrieved all sub-categories",
+                'sub-categories', ['category'], [Category]
+            )
+
+        sub_categories_list = serializeQueryset(sub_categories_queryset)
         sub_categories_list = poulateRelatedFields(
             sub_categories_list, 'category', Category)
 
@@ -245,9 +249,7 @@ def retrieveSubCategory(request, sub_category_slug):
             slug=sub_category_slug
         )
 
-        sub_category_retrieved = json.loads(
-            serialize('json', [sub_category_retrieved])
-        )[0]
+        sub_category_retrieved = serializeQueryset([sub_category_retrieved])[0]
 
         return JsonResponse(
             {
@@ -298,9 +300,7 @@ def updateSubCategory(request, sub_category_slug):
         sub_category.name = category_name
         sub_category.save()
 
-        sub_category_updated = json.loads(
-            serialize('json', [sub_category])
-        )[0]
+        sub_category_updated = serializeQueryset([sub_category])[0]
 
         return JsonResponse(
             {
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'inventory.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,6 +87,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# The generation counters invalidating the cached results (inventory.signals)
+# live in this cache. Local memory is per process: when running several worker
+# processes, switch to a shared backend (e.g. FileBasedCache) so that a write
+# in one worker invalidates the results cached by the others
+# (`manage.py check --deploy` warns about it, inventory.W001).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'inventory',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -126,3 +147,81 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Inventory settings
+
+# Number of rows read per database round trip by the streaming (?stream=1) list mode
+INVENTORY_STREAM_CHUNK_SIZE = 500
+
+# Default total_results strategy of the paginated lists, one of exact, cached,
+# estimated or none (see inventory.myutils.countResults); clients override it with ?count=
+INVENTORY_COUNT_MODE = 'exact'
+INVENTORY_COUNT_CACHE_TTL = 60
+INVENTORY_COUNT_ESTIMATE_LIMIT = 10000
+
+# Serve the paginated price and quantity range lists from the in-memory columns
+# of inventory.columnar instead of the database (vectorized when NumPy is installed)
+INVENTORY_COLUMNAR_ENGINE = False
+
+# Default ?pagesize= of the price and quantity range routes asked for a ?page=
+INVENTORY_RANGE_PAGESIZE = 20
+
+# Maximum age, in seconds, of the in-memory item indexes, category registries
+# and columns of a process (inventory.indexes, inventory.columnar). They are
+# reloaded sooner when a write moves the generation counters of the shared
+# cache, this bounds how long they miss the writes of other processes when
+# the cache is local to each process
+INVENTORY_INDEX_TTL = 60
+
+# Seconds between two compactions of the stock movements, by
+# `compact_stock_movements --loop`, which must run in the background. The
+# quantity filters, sorts and facets read the compacted snapshot, so they lag
+# the quantity on hand by at most this interval (inventory.stocks)
+INVENTORY_COMPACTION_INTERVAL = 60
+
+# Maximum number of entries of a stocks/bulk-update/ request
+INVENTORY_BULK_UPDATE_MAX = 5000
+
+# Default and maximum lifetime, in seconds, of a stock reservation, and the number
+# of expired reservations given back per sweep (inventory.reservations)
+INVENTORY_RESERVATION_TTL = 900
+INVENTORY_RESERVATION_MAX_TTL = 3600
+INVENTORY_RESERVATION_SWEEP_BATCH = 100
+
+# Lifetime, in seconds, of the cached filter and search responses (inventory.myutils.cachedResponse)
+INVENTORY_RESULT_CACHE_TTL = 300
+
+# Default and maximum number of results of the ranked (?rank=1) item search
+INVENTORY_SEARCH_LIMIT = 20
+INVENTORY_SEARCH_MAX_LIMIT = 100
+
+# Minimum trigram similarity (0 to 1) of the fuzzy (?fuzzy=1) item search
+INVENTORY_FUZZY_THRESHOLD = 0.3
+
+# Default number of suggestions of items/autocomplete/
+INVENTORY_AUTOCOMPLETE_LIMIT = 10
+
+# Price buckets and stock bands of the search facets (?facets=), as
+# (label, min, max) with max None for an unbounded band
+INVENTORY_FACET_PRICE_BUCKETS = [
+    ('0-99', 0, 99),
+    ('100-499', 100, 499),
+    ('500-999', 500, 999),
+    ('1000-4999', 1000, 4999),
+    ('5000+', 5000, None),
+]
+INVENTORY_FACET_STOCK_BANDS = [
+    ('out_of_stock', 0, 0),
+    ('low', 1, 9),
+    ('medium', 10, 49),
+    ('high', 50, None),
+]
+
+# Response compression (inventory.middleware.CompressionMiddleware), gzip is
+# always available, zstd and br are negotiated when zstandard / brotli are installed
+INVENTORY_COMPRESSION_MIN_SIZE = 1024
+INVENTORY_COMPRESSION_LEVEL = 6
+INVENTORY_COMPRESSION_EXCLUDE_PATHS = [
+    '/admin/',
+]